@@ -10,6 +10,7 @@ from geopy.geocoders import Nominatim
 from geopy.distance import vincenty
 import json
 from flask import flash
+from import_profiler import import_phase
 
 
 # http://stackoverflow.com/questions/6671183/calculate-the-center-point-of-multiple-latitude-longitude-coordinate-pairs
@@ -60,8 +61,9 @@ def parse_samples(samples, move):
         yield sample
 
 
-def postprocess_move(move):
-    gps_samples = [sample for sample in move.samples if sample.sample_type and sample.sample_type.startswith('gps-')]
+def update_gps_center(move):
+    """ Stores the center of the GPS samples of a move without outliers and their maximum distance to it, returns these samples """
+    gps_samples = [sample for sample in move.samples if sample.sample_type and sample.sample_type.startswith('gps-') and not sample.gps_outlier]
 
     if gps_samples:
         gps_center = calculate_gps_center(gps_samples)
@@ -79,12 +81,21 @@ def postprocess_move(move):
 
         move.gps_center_max_distance = gps_center_max_distance
 
+    return gps_samples
+
+
+def postprocess_move(move):
+    with import_phase('derive'):
+        gps_samples = update_gps_center(move)
+
+    if gps_samples:
         first_sample = gps_samples[0]
         latitude = first_sample.latitude
         longitude = first_sample.longitude
 
-        geolocator = Nominatim()
-        location = geolocator.reverse("%f, %f" % (radian_to_degree(latitude), radian_to_degree(longitude)), timeout=60)
+        with import_phase('geocode'):
+            geolocator = Nominatim()
+            location = geolocator.reverse("%f, %f" % (radian_to_degree(latitude), radian_to_degree(longitude)), timeout=60)
         move.location_address = location.address
         move.location_raw = location.raw
 
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+"""
+Compares reading the samples of a move as Sample ORM instances with the
+lightweight records and arrays of the sample_reader module.
+
+Usage: python -m benchmarks.bench_sample_reader [--samples N] [--repeat N]
+"""
+
+from flask import Flask
+from model import db, User, Device, Move, Sample
+from datetime import datetime, timedelta
+import sample_reader
+import argparse
+import math
+import time
+
+
+def create_app():
+    app = Flask('benchmark')
+    app.config.update(SQLALCHEMY_DATABASE_URI='sqlite://', SQLALCHEMY_ECHO=False)
+    db.init_app(app)
+    return app
+
+
+def create_move(nr_of_samples):
+    user = User(username='benchmark', password='-', active=True)
+    device = Device(name='benchmark', serial_number='BENCHMARK')
+    move = Move(user=user, device=device, date_time=datetime(2015, 1, 1), import_date_time=datetime.now(), import_module='benchmark',
+                activity='Running', duration=timedelta(seconds=nr_of_samples))
+    db.session.add(move)
+    db.session.commit()
+
+    rows = []
+    for idx in range(nr_of_samples):
+        row = {'move_id': move.id, 'time': timedelta(seconds=idx), 'sample_type': 'periodic',
+               'hr': 2.0 + math.sin(idx / 60.0), 'altitude': 500 + idx % 100, 'speed': 3.0, 'distance': 3.0 * idx,
+               'temperature': 293.15, 'vertical_speed': 0.1, 'energy_consumption': 10.0}
+        if idx % 5 == 0:
+            row.update({'sample_type': 'gps-base', 'latitude': 0.82 + idx * 1e-7, 'longitude': 0.13 + idx * 1e-7,
+                        'gps_altitude': 500.0, 'gps_hdop': 1.0, 'number_of_satellites': 8,
+                        'satellites': {'satellite': [{'sV_ID': str(sv), 'sNR': '40', 'state': '47'} for sv in range(8)]}})
+        if idx % 500 == 0:
+            row['events'] = {'lap': {'type': 'Distance', 'duration': str(idx), 'distance': str(3.0 * idx)}}
+        rows.append(row)
+
+    # use the same set of keys for all rows, so that the insert can be executed as one batch
+    keys = set(key for row in rows for key in row.keys())
+    db.session.execute(Sample.__table__.insert(), [dict((key, row.get(key)) for key in keys) for row in rows])
+    db.session.commit()
+    return move.id
+
+
+def benchmark(name, function, nr_of_samples, repeat):
+    timings = []
+    for _ in range(repeat):
+        db.session.expunge_all()
+        start = time.time()
+        function()
+        timings.append(time.time() - start)
+    best = min(timings)
+    print("%-40s %8.3f s %12.0f rows/s" % (name, best, nr_of_samples / best))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--samples', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        move_id = create_move(args.samples)
+        channels = ('time', 'hr', 'altitude')
+
+        def orm():
+            move = Move.query.get(move_id)
+            for sample in move.samples.order_by(Sample.time.asc()):
+                sample.time, sample.hr, sample.altitude
+
+        def rows_default_columns():
+            move = Move.query.get(move_id)
+            for sample in sample_reader.sample_rows(move):
+                sample.time, sample.hr, sample.altitude
+
+        def rows_projected():
+            move = Move.query.get(move_id)
+            for sample in sample_reader.sample_rows(move, channels):
+                sample.time, sample.hr, sample.altitude
+
+        def array_projected():
+            move = Move.query.get(move_id)
+            array = sample_reader.sample_array(move, channels)
+            array['time'], array['hr'], array['altitude']
+
+        print("%d samples, best of %d runs" % (args.samples, args.repeat))
+        benchmark("ORM Sample instances", orm, args.samples, args.repeat)
+        benchmark("sample_rows (default columns)", rows_default_columns, args.samples, args.repeat)
+        benchmark("sample_rows %s" % (channels,), rows_projected, args.samples, args.repeat)
+        benchmark("sample_array %s" % (channels,), array_projected, args.samples, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+"""
+Times the main user workflows on a database with N users times M synthetic moves.
+
+Every move is uploaded through /import and afterwards the moves list, the
+dashboard, each move page, the CSV and GPX exports and finally the deletion
+of every move are requested through the Flask test client. The timings are
+written as JSON, so that results of different commits can be compared.
+
+Usage: python -m benchmarks.bench_workload [--users 2] [--moves 10] [--duration 3600] [--output results.json]
+"""
+
+from benchmarks import synthetic
+from datetime import datetime, timedelta
+import _import
+import argparse
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+PASSWORD = 'benchmark'
+
+
+class OfflineGeolocator(object):
+    """ Stands in for the Nominatim reverse geocoder, so that results do not depend on the network """
+
+    class Location(object):
+        address = u'Zürich, Switzerland'
+        raw = {'address': {'city': u'Zürich', 'country_code': 'ch', 'country': 'Switzerland'}}
+
+    def reverse(self, query, timeout=None):
+        return self.Location()
+
+
+class Timings(object):
+
+    def __init__(self):
+        self.timings = {}
+
+    def measure(self, operation, function, *args, **kwargs):
+        start = time.time()
+        result = function(*args, **kwargs)
+        self.timings.setdefault(operation, []).append(time.time() - start)
+        return result
+
+    def summary(self):
+        summary = {}
+        for operation, timings in sorted(self.timings.items()):
+            timings = sorted(timings)
+            summary[operation] = {
+                'count': len(timings),
+                'total': sum(timings),
+                'mean': sum(timings) / len(timings),
+                'median': timings[len(timings) // 2],
+                'p95': timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+                'min': timings[0],
+                'max': timings[-1],
+            }
+        return summary
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.STDOUT).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def create_app(directory, database_uri):
+    configfile = os.path.join(directory, 'openmoves.cfg')
+    with open(configfile, 'w') as f:
+        f.write("SECRET_KEY = 'benchmark'\n")
+        f.write("SQLALCHEMY_DATABASE_URI = %r\n" % (database_uri or 'sqlite:///%s' % os.path.join(directory, 'openmoves.sqlite')))
+        f.write("EXPORT_CACHE_DIR = %r\n" % os.path.join(directory, 'export_cache'))
+        f.write("WTF_CSRF_ENABLED = False\n")
+        f.write("METRICS_ENABLED = False\n")
+
+    import openmoves
+    return openmoves.init(configfile)
+
+
+def create_users(app, nr_of_users):
+    from model import db, User
+    import openmoves
+
+    usernames = []
+    with app.app_context():
+        password = openmoves.app_bcrypt.generate_password_hash(PASSWORD, 4)
+        for idx in range(nr_of_users):
+            username = "benchmark_%d" % idx
+            db.session.add(User(username=username, password=password, active=True))
+            usernames.append(username)
+        db.session.commit()
+    return usernames
+
+
+def _check(response, operation):
+    if response.status_code not in (200, 302):
+        raise AssertionError("%s failed: HTTP %s" % (operation, response.status))
+    return response.get_data()
+
+
+def _activity(idx, format):
+    activities = sorted(synthetic.ACTIVITIES.keys())
+    if format == 'gpx':
+        activities = [activity for activity in activities if 'swimming' not in activity]
+    return activities[idx % len(activities)]
+
+
+def run_user(client, username, args, timings):
+    response = client.post('/login', data={'username': username, 'password': PASSWORD, 'timezone': 'Europe/Zurich'})
+    _check(response, 'login')
+
+    formats = args.formats.split(',')
+    for idx in range(args.moves):
+        format = formats[idx % len(formats)]
+        move = synthetic.generate_move(_activity(idx, format),
+                                       date_time=datetime(2015, 1, 1, 8, 0, 0) + timedelta(days=idx),
+                                       duration=args.duration, interval=args.interval, pauses=args.pauses, seed=idx)
+        data = synthetic.serialize(move, format)
+        response = timings.measure('import_%s' % format, client.post, '/import',
+                                   data={'files': [(io.BytesIO(data), synthetic.filename(move, format))]})
+        _check(response, 'import')
+
+    date_range = 'start_date=2015-01-01&end_date=%s' % (datetime(2015, 1, 1) + timedelta(days=args.moves)).strftime('%Y-%m-%d')
+    _check(timings.measure('moves', client.get, '/moves?%s' % date_range), 'moves')
+    _check(timings.measure('dashboard', client.get, '/dashboard?%s' % date_range), 'dashboard')
+
+    from model import Move, User
+    with client.application.app_context():
+        move_ids = [move_id for move_id, in Move.query.with_entities(Move.id).join(User).filter(User.username == username)]
+
+    for move_id in move_ids:
+        _check(timings.measure('move', client.get, '/moves/%d' % move_id), 'move')
+    for format in ('csv', 'gpx'):
+        for move_id in move_ids:
+            _check(timings.measure('export_%s' % format, client.get, '/moves/%d/export?format=%s' % (move_id, format)), 'export')
+    for move_id in move_ids:
+        _check(timings.measure('delete', client.get, '/moves/%d/delete' % move_id), 'delete')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=2)
+    parser.add_argument('--moves', type=int, default=10, help="moves per user")
+    parser.add_argument('--duration', type=float, default=3600, help="duration of each move in seconds")
+    parser.add_argument('--interval', type=float, default=1.0, help="sampling interval in seconds")
+    parser.add_argument('--pauses', type=int, default=1, help="pauses per move")
+    parser.add_argument('--formats', default=','.join(synthetic.FORMATS), help="comma separated list of %s" % ', '.join(synthetic.FORMATS))
+    parser.add_argument('--database', default=None, help="database URI, defaults to a temporary SQLite file")
+    parser.add_argument('--geocode', action='store_true', help="query Nominatim instead of a fixed offline location")
+    parser.add_argument('--output', default=None, help="JSON result file, defaults to stdout")
+    args = parser.parse_args()
+
+    if not args.geocode:
+        _import.Nominatim = OfflineGeolocator
+
+    directory = tempfile.mkdtemp(prefix='openmoves_benchmark_')
+    try:
+        app = create_app(directory, args.database)
+        usernames = create_users(app, args.users)
+
+        timings = Timings()
+        start = time.time()
+        for username in usernames:
+            run_user(app.test_client(), username, args, timings)
+        total = time.time() - start
+    finally:
+        shutil.rmtree(directory)
+
+    result = {
+        'revision': _git_revision(),
+        'date_time': datetime.now().isoformat(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'parameters': vars(args),
+        'total': total,
+        'timings': timings.summary(),
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2, sort_keys=True)
+    else:
+        json.dump(result, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write("\n")
+
+    for operation, summary in sorted(result['timings'].items()):
+        sys.stderr.write("%-12s %5d x  mean %8.3f s  median %8.3f s  p95 %8.3f s\n"
+                         % (operation, summary['count'], summary['mean'], summary['median'], summary['p95']))
+
+
+if __name__ == '__main__':
+    main()
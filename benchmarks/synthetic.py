@@ -0,0 +1,331 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+"""
+Generates synthetic but realistic move files in the SML, old XML and GPX
+formats understood by the importers.
+
+Usage: python -m benchmarks.synthetic [--format sml] [--duration 3600] [--interval 1] [--directory .]
+"""
+
+from datetime import datetime, timedelta
+from xml.sax.saxutils import escape
+import numpy as np
+import argparse
+import gzip
+import os
+
+
+EARTH_RADIUS = 6371000.0
+
+# activity name: (Suunto activity type, average speed in m/s, average heart rate in bpm)
+ACTIVITIES = {
+    'Running': (3, 3.0, 150),
+    'Cycling': (4, 7.0, 135),
+    'Trekking': (11, 1.2, 110),
+    'Pool swimming': (6, 0.8, 125),
+}
+
+SWIMMING_STYLES = ('Freestyle', 'Breaststroke', 'Backstroke')
+
+FORMATS = ('sml', 'xml', 'gpx')
+
+SML_NAMESPACE = 'http://www.suunto.com/schemas/sml'
+
+
+class SyntheticMove(object):
+    """ Channels of a synthetic move sampled at a fixed interval.
+
+    Positions are in radians, heart rate and cadence in Hz and temperatures
+    in Kelvin, just like the importers store them.
+    """
+
+    def __init__(self, activity, date_time, duration, interval, pauses, pool_length, serial_number, seed):
+        self.activity = activity
+        self.activity_type, speed_avg, hr_avg = ACTIVITIES[activity]
+        self.date_time = date_time
+        self.interval = interval
+        self.pool_length = pool_length if self.swimming else None
+        self.serial_number = serial_number
+
+        rng = np.random.RandomState(seed)
+        self.time = np.arange(0, duration, interval, dtype=float)
+        n = len(self.time)
+
+        # smooth variations around the average values
+        variation = np.convolve(rng.normal(0, 1, n), np.ones(30) / 30.0, mode='same')
+        speed = np.clip(speed_avg * (1 + 0.5 * variation), 0.1 * speed_avg, None)
+
+        # pause intervals of 30 s to 5 min, not overlapping the start or the end of the move
+        self.pauses = []
+        for start in sorted(rng.uniform(0.1, 0.9, pauses) * duration):
+            end = min(start + rng.uniform(30, 300), duration * 0.95)
+            if not self.pauses or start > self.pauses[-1][1]:
+                self.pauses.append((start, end))
+        self.paused = np.zeros(n, dtype=bool)
+        for start, end in self.pauses:
+            self.paused |= (self.time >= start) & (self.time < end)
+        speed[self.paused] = 0
+
+        self.speed = speed
+        self.distance = np.cumsum(speed * interval)
+        self.hr = (hr_avg + 15 * variation - 30 * self.paused + rng.normal(0, 2, n)) / 60.0
+        self.cadence = np.where(self.paused, 0, 1.4 + 0.1 * variation)
+        self.temperature = 293.15 + 5 * np.sin(self.time / max(duration, 1) * np.pi) + rng.normal(0, 0.1, n)
+
+        if self.swimming:
+            self.latitude = self.longitude = self.altitude = None
+        else:
+            heading = np.cumsum(rng.normal(0, 0.05, n))
+            latitude = np.radians(47.37) + np.cumsum(speed * interval * np.cos(heading)) / EARTH_RADIUS
+            self.latitude = latitude
+            self.longitude = np.radians(8.54) + np.cumsum(speed * interval * np.sin(heading)) / (EARTH_RADIUS * np.cos(latitude))
+            self.altitude = 450 + 80 * np.sin(self.distance / 3000.0) + np.cumsum(rng.normal(0, 0.05, n))
+
+        self.swimming_events = self._swimming_events(rng) if self.swimming else []
+
+    @property
+    def swimming(self):
+        return 'swimming' in self.activity
+
+    @property
+    def duration(self):
+        return float(self.time[-1]) if len(self.time) else 0.0
+
+    def utc(self, seconds):
+        return self.date_time + timedelta(seconds=float(seconds))
+
+    def _swimming_events(self, rng):
+        """ Returns (time, event type, details) of the strokes and turns """
+        events = []
+        stroke_interval = 1.4
+        next_stroke = 0.0
+        next_turn = self.pool_length
+        style = SWIMMING_STYLES[0]
+        lengths = 0
+        for time, distance, paused in zip(self.time, self.distance, self.paused):
+            if paused:
+                next_stroke = time + stroke_interval
+                continue
+            if time >= next_stroke:
+                events.append((time, 'Stroke', {}))
+                next_stroke = time + rng.uniform(0.8, 2.0) * stroke_interval
+            if distance >= next_turn:
+                lengths += 1
+                events.append((time, 'Turn', {'TotalLengths': lengths, 'PrevPoolLengthStyle': style, 'Distance': lengths * self.pool_length}))
+                next_turn += self.pool_length
+                if rng.uniform() < 0.1:
+                    style = SWIMMING_STYLES[rng.randint(len(SWIMMING_STYLES))]
+        return events
+
+    @property
+    def ascent_descent(self):
+        if self.altitude is None:
+            return 0, 0, 0, 0
+        altitude_diff = np.diff(np.round(self.altitude))
+        return (int(altitude_diff[altitude_diff > 0].sum()), int(-altitude_diff[altitude_diff < 0].sum()),
+                float(self.interval * np.count_nonzero(altitude_diff > 0)), float(self.interval * np.count_nonzero(altitude_diff < 0)))
+
+
+def generate_move(activity='Running', date_time=datetime(2015, 6, 1, 8, 0, 0), duration=3600, interval=1.0, pauses=1,
+                  pool_length=25, serial_number='CAFEBABECAFEBABE', seed=None):
+    return SyntheticMove(activity, date_time, duration, interval, pauses, pool_length, serial_number, seed)
+
+
+def _format_date_time(date_time):
+    return date_time.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3]
+
+
+def _element(tag, value):
+    return "<%s>%s</%s>" % (tag, value, tag)
+
+
+def _header(move):
+    ascent, descent, ascent_time, descent_time = move.ascent_descent
+    moving = ~move.paused
+    lines = [
+        _element('Duration', move.duration),
+        _element('Ascent', ascent),
+        _element('Descent', descent),
+        _element('AscentTime', ascent_time),
+        _element('DescentTime', descent_time),
+        _element('RecoveryTime', 0),
+        "<Speed>%s%s%s</Speed>" % (_element('Avg', move.distance[-1] / max(move.duration, 1)), _element('Max', move.speed.max()),
+                                   _element('MaxTime', move.time[move.speed.argmax()])),
+        "<HR>%s%s%s</HR>" % (_element('Avg', move.hr[moving].mean()), _element('Max', move.hr.max()), _element('Min', move.hr.min())),
+        _element('ActivityType', move.activity_type),
+        _element('Activity', escape(move.activity)),
+        "<Temperature>%s%s</Temperature>" % (_element('Max', move.temperature.max()), _element('Min', move.temperature.min())),
+        _element('Distance', int(move.distance[-1])),
+        _element('LogItemCount', len(move.time)),
+        _element('DateTime', move.date_time.strftime('%Y-%m-%dT%H:%M:%S')),
+    ]
+    if move.altitude is not None:
+        lines.append("<Altitude>%s%s</Altitude>" % (_element('Max', int(round(move.altitude.max()))), _element('Min', int(round(move.altitude.min())))))
+    if move.pool_length:
+        lines.append(_element('PoolLength', move.pool_length))
+    return "\n".join(lines)
+
+
+def _pause_sample(time, utc, state, duration, distance):
+    return ("<Sample>%s%s<Events><Pause><Type>31</Type>%s%s%s</Pause></Events></Sample>"
+            % (_element('Time', time), _element('UTC', utc), _element('Duration', duration), _element('Distance', distance), _element('State', state)))
+
+
+def _samples(move):
+    """ Yields the <Sample> elements shared by the SML and the old XML format """
+    start_utc = _format_date_time(move.date_time) + 'Z'
+    yield _pause_sample(0, start_utc, 'False', 0, 0)
+
+    pause_starts = dict((int(start // move.interval), (start, end)) for start, end in move.pauses)
+    pause_ends = dict((int(end // move.interval), (start, end)) for start, end in move.pauses)
+    swimming_events = iter(move.swimming_events)
+    next_swimming_event = next(swimming_events, None)
+
+    for idx, time in enumerate(move.time):
+        utc = _format_date_time(move.utc(time)) + 'Z'
+
+        while next_swimming_event and next_swimming_event[0] <= time:
+            event_time, event_type, details = next_swimming_event
+            details = dict(details)
+            distance = _element('Distance', details.pop('Distance')) if 'Distance' in details else ''
+            yield ("<Sample>%s%s<SampleType>swimming</SampleType><Events><Swimming>%s%s</Swimming></Events></Sample>"
+                   % (distance, _element('Time', event_time), _element('Type', event_type),
+                      "".join(_element(key, value) for key, value in sorted(details.items()))))
+            next_swimming_event = next(swimming_events, None)
+
+        if idx in pause_starts:
+            start, end = pause_starts[idx]
+            yield _pause_sample(time, utc, 'True', end - start, 0)
+        if idx in pause_ends:
+            yield _pause_sample(time, utc, 'False', 0, 0)
+
+        channels = [
+            _element('Time', time),
+            _element('UTC', utc),
+            _element('SampleType', 'periodic'),
+            _element('Distance', int(move.distance[idx])),
+            _element('Speed', round(move.speed[idx], 2)),
+            _element('HR', round(move.hr[idx], 4)),
+            _element('Temperature', round(move.temperature[idx], 2)),
+            _element('Cadence', round(move.cadence[idx], 3)),
+        ]
+        if move.altitude is not None:
+            channels.append(_element('Altitude', int(round(move.altitude[idx]))))
+            channels.append(_element('VerticalSpeed', round((move.altitude[idx] - move.altitude[idx - 1]) / move.interval if idx else 0, 2)))
+            channels.append(_element('SeaLevelPressure', 101325))
+        yield "<Sample>%s</Sample>" % "".join(channels)
+
+        if move.latitude is not None and not move.paused[idx]:
+            yield ("<Sample>%s%s<SampleType>gps-base</SampleType>%s%s%s%s%s</Sample>"
+                   % (_element('Time', time), _element('UTC', utc), _element('Latitude', repr(move.latitude[idx])),
+                      _element('Longitude', repr(move.longitude[idx])), _element('GPSAltitude', round(move.altitude[idx], 2)),
+                      _element('GpsHDOP', 1), _element('EHPE', 5)))
+
+
+def sml(move):
+    """ Returns the move as SML document of the Moveslink2 format """
+    return "\n".join([
+        '<?xml version="1.0" encoding="utf-8"?>',
+        '<sml xmlns="%s">' % SML_NAMESPACE,
+        '<DeviceLog>',
+        '<Header>', _header(move), '</Header>',
+        '<Device><Name>Suunto Ambit2</Name>%s<Info><SW>2.0.9</SW><HW>71.2.12345</HW><BSL>1.5.5</BSL><SWBuildDateTime>2014-05-13T09:24:00</SWBuildDateTime></Info></Device>'
+        % _element('SerialNumber', move.serial_number),
+        '<Samples>',
+        "\n".join(_samples(move)),
+        '</Samples>',
+        '</DeviceLog>',
+        '</sml>',
+    ])
+
+
+def old_xml(move):
+    """ Returns the move in the old Moveslink XML format: a header and a samples element without common root """
+    return "\n".join([
+        '<?xml version="1.0" encoding="utf-8"?>',
+        '<header>', _header(move), '</header>',
+        '<Samples>',
+        "\n".join(_samples(move)),
+        '</Samples>',
+    ])
+
+
+def gpx(move):
+    """ Returns the move as GPX 1.1 track. Pauses split the track into segments """
+    if move.latitude is None:
+        raise ValueError("%s has no GPS track" % move.activity)
+
+    segments = []
+    points = []
+    for idx, time in enumerate(move.time):
+        if move.paused[idx]:
+            if points:
+                segments.append(points)
+                points = []
+            continue
+
+        points.append('<trkpt lat="%.7f" lon="%.7f">%s%s<extensions>'
+                      '<gpxtpx:TrackPointExtension><gpxtpx:hr>%d</gpxtpx:hr></gpxtpx:TrackPointExtension>'
+                      '<gpxdata:temp>%.1f</gpxdata:temp></extensions></trkpt>'
+                      % (np.degrees(move.latitude[idx]), np.degrees(move.longitude[idx]),
+                         _element('time', _format_date_time(move.utc(time)) + 'Z'), _element('ele', round(move.altitude[idx], 1)),
+                         round(move.hr[idx] * 60), move.temperature[idx] - 273.15))
+    if points:
+        segments.append(points)
+
+    return "\n".join([
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        '<gpx version="1.1" creator="OpenMoves benchmark" xmlns="http://www.topografix.com/GPX/1/1" '
+        'xmlns:gpxdata="http://www.topografix.com/GPX/1/0" xmlns:gpxtpx="http://www.garmin.com/xmlschemas/TrackPointExtension/v1">',
+        '<trk>',
+        _element('name', escape(move.activity)),
+        "\n".join("<trkseg>\n%s\n</trkseg>" % "\n".join(points) for points in segments),
+        '</trk>',
+        '</gpx>',
+    ])
+
+
+def filename(move, format):
+    date_time = move.date_time.strftime('%Y-%m-%dT%H_%M_%S')
+    if format == 'sml':
+        return "%s-%s-0.sml" % (move.serial_number, date_time)
+    elif format == 'xml':
+        return "log-%s-%s-0.xml" % (move.serial_number, date_time)
+    elif format == 'gpx':
+        return "Move_%s_%s.gpx" % (date_time, move.activity.replace(' ', '_'))
+    else:
+        raise ValueError("illegal format: %s" % format)
+
+
+def serialize(move, format):
+    document = {'sml': sml, 'xml': old_xml, 'gpx': gpx}[format](move)
+    return document.encode('utf-8')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--format', choices=FORMATS, default='sml')
+    parser.add_argument('--activity', choices=sorted(ACTIVITIES.keys()), default='Running')
+    parser.add_argument('--duration', type=float, default=3600, help="duration in seconds")
+    parser.add_argument('--interval', type=float, default=1.0, help="sampling interval in seconds")
+    parser.add_argument('--pauses', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--gzip', action='store_true')
+    parser.add_argument('--directory', default='.')
+    args = parser.parse_args()
+
+    move = generate_move(args.activity, duration=args.duration, interval=args.interval, pauses=args.pauses, seed=args.seed)
+    path = os.path.join(args.directory, filename(move, args.format))
+    data = serialize(move, args.format)
+    if args.gzip:
+        path += '.gz'
+        with gzip.open(path, 'wb') as f:
+            f.write(data)
+    else:
+        with open(path, 'wb') as f:
+            f.write(data)
+    print("wrote %s" % path)
+
+
+if __name__ == '__main__':
+    main()
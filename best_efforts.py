@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+
+from model import db, BestEffort
+import sample_reader
+import numpy as np
+from datetime import timedelta
+
+# fastest time over these distances in meters
+DISTANCES = (400, 1000, 5000, 10000)
+
+# best average heart rate and speed over these durations in seconds
+DURATIONS = (60, 300, 1200)
+
+EFFORT_TYPES = ('distance', 'hr', 'speed')
+
+
+def fastest_section(time, distance, target_distance):
+    """ Returns (duration, start time) of the fastest section covering target_distance or None.
+
+    time and distance are non-decreasing sequences of the same length. The
+    start of the section is interpolated, so that the section covers exactly
+    target_distance. Runs in O(n): the start only ever moves forward.
+    """
+    best = None
+    start = 0
+    for end in range(len(time)):
+        if distance[end] - distance[0] < target_distance:
+            continue
+
+        while distance[end] - distance[start + 1] >= target_distance:
+            start += 1
+
+        # the section starts between the samples start and start + 1
+        start_distance = distance[end] - target_distance
+        fraction = (start_distance - distance[start]) / (distance[start + 1] - distance[start])
+        start_time = time[start] + fraction * (time[start + 1] - time[start])
+
+        duration = time[end] - start_time
+        if duration > 0 and (best is None or duration < best[0]):
+            best = (duration, start_time)
+    return best
+
+
+def best_window(time, cumulative, window):
+    """ Returns (increase, start time) of the largest increase of cumulative within window seconds or None.
+
+    time is strictly increasing and cumulative is an integral over time, eg. the
+    distance. The start of the window is interpolated. Runs in O(n).
+    """
+    best = None
+    start = 0
+    for end in range(len(time)):
+        if time[end] - time[0] < window:
+            continue
+
+        while time[end] - time[start + 1] >= window:
+            start += 1
+
+        start_time = time[end] - window
+        fraction = (start_time - time[start]) / (time[start + 1] - time[start])
+        start_value = cumulative[start] + fraction * (cumulative[start + 1] - cumulative[start])
+
+        increase = cumulative[end] - start_value
+        if best is None or increase > best[0]:
+            best = (increase, start_time)
+    return best
+
+
+def _strictly_increasing(time, *channels):
+    mask = np.ones(len(time), dtype=bool)
+    for channel in (time,) + channels:
+        mask &= ~np.isnan(channel)
+    time = time[mask]
+    channels = [channel[mask] for channel in channels]
+
+    # keep the first sample of samples sharing the same time
+    if len(time) > 0:
+        unique = np.concatenate(([True], np.diff(time) > 0))
+        time = time[unique]
+        channels = [channel[unique] for channel in channels]
+    return [time] + channels
+
+
+def calculate_best_efforts(time, distance, hr):
+    """ Returns (type, parameter, value, start time) of all best efforts of a move.
+
+    The arguments are float arrays with NaN for missing values; time in
+    seconds, distance in meters and hr in Hz.
+    """
+    efforts = []
+
+    time_distance, distance = _strictly_increasing(time, distance)
+    if len(time_distance) > 1:
+        # the distance of some devices jitters slightly backwards
+        distance = np.maximum.accumulate(distance)
+        time_list, distance_list = time_distance.tolist(), distance.tolist()
+
+        for target_distance in DISTANCES:
+            section = fastest_section(time_list, distance_list, target_distance)
+            if section:
+                duration, start_time = section
+                efforts.append(('distance', target_distance, duration, start_time))
+
+        for window in DURATIONS:
+            section = best_window(time_list, distance_list, window)
+            if section:
+                increase, start_time = section
+                efforts.append(('speed', window, increase / window, start_time))
+
+    time_hr, hr = _strictly_increasing(time, hr)
+    if len(time_hr) > 1:
+        # trapezoidal integral of the heart rate
+        heart_beats = np.concatenate(([0.0], np.cumsum(np.diff(time_hr) * (hr[1:] + hr[:-1]) / 2)))
+        time_list, heart_beats_list = time_hr.tolist(), heart_beats.tolist()
+
+        for window in DURATIONS:
+            section = best_window(time_list, heart_beats_list, window)
+            if section:
+                increase, start_time = section
+                efforts.append(('hr', window, increase / window, start_time))
+
+    return efforts
+
+
+def update_best_efforts(move):
+    """ Replaces the best efforts of a move with ones calculated from its samples """
+    BestEffort.query.filter_by(move_id=move.id).delete(synchronize_session=False)
+
+    samples = sample_reader.sample_array(move, ('time', 'distance', 'hr'))
+    efforts = calculate_best_efforts(samples['time'], samples['distance'], samples['hr'])
+
+    for effort_type, parameter, value, start_time in efforts:
+        best_effort = BestEffort(move_id=move.id,
+                                 user_id=move.user_id,
+                                 activity=move.activity,
+                                 type=effort_type,
+                                 parameter=parameter,
+                                 value=value,
+                                 start=timedelta(seconds=start_time))
+        db.session.add(best_effort)
+    return efforts
+
+
+def personal_record_query(user, activity, effort_type, parameter):
+    """ Orders the best efforts of all moves of the user by the index of the best_effort table, the best first """
+    query = BestEffort.query.filter_by(user_id=user.id, activity=activity, type=effort_type, parameter=parameter)
+    if effort_type == 'distance':
+        return query.order_by(BestEffort.value.asc())
+    else:
+        return query.order_by(BestEffort.value.desc())
+
+
+def personal_records(user, activity):
+    """ Returns the personal records of an activity as list of (type, parameter, best effort) """
+    records = []
+    for effort_type in EFFORT_TYPES:
+        for parameter in (DISTANCES if effort_type == 'distance' else DURATIONS):
+            best_effort = personal_record_query(user, activity, effort_type, parameter).first()
+            if best_effort:
+                records.append((effort_type, parameter, best_effort))
+    return records
+
+
+def effort_name(effort_type, parameter):
+    if effort_type == 'distance':
+        if parameter < 1000:
+            return "%d m" % parameter
+        return "%g km" % (parameter / 1000.0)
+    else:
+        return "%d min" % (parameter / 60)
@@ -1,10 +1,29 @@
 #!/usr/bin/env python
 # vim: set fileencoding=utf-8 :
 
+from flask import Flask, current_app
 from flask_script import Command, Option
+import os
 import xkcdpass.xkcd_password as xp
-from model import db, User, Move, Sample
+from datetime import datetime
+from werkzeug.datastructures import FileStorage
+from model import db, User, Move, Sample, BestEffort, HrZone, SwimLength, Pause, HeatCell
 from imports import move_import
+from import_profiler import ImportProfile
+from best_efforts import update_best_efforts
+from training_load import update_hr_zones, remove_move
+from swimming import update_swim_lengths
+import heatmap
+from spatial import update_gps_bounds
+import segments
+import search
+import pauses
+import gps_filter
+import gpx_import
+import sample_reader
+from _import import update_gps_center
+from exports import export_functions, zip_export
+from export_cache import export_cache
 
 
 class AddUser(Command):
@@ -72,9 +91,18 @@ class DeleteMove(Command):
 
     def run(self, move_id):
         move = Move.query.filter_by(id=move_id).one()
+        remove_move(move)
+        heatmap.remove_move(move)
+        segments.remove_move(move)
+        search.remove_move(move)
         Sample.query.filter_by(move=move).delete()
+        BestEffort.query.filter_by(move=move).delete()
+        HrZone.query.filter_by(move=move).delete()
+        SwimLength.query.filter_by(move=move).delete()
+        Pause.query.filter_by(move=move).delete()
         db.session.delete(move)
         db.session.commit()
+        export_cache.invalidate(move.id)
         print("deleted move %d" % move.id)
 
 
@@ -90,3 +118,241 @@ class ListMoves(Command):
     def run(self):
         for move in Move.query:
             print("move %d: user=%s, date='%s', activity=%s" % (move.id, move.user.username, move.date_time, move.activity))
+
+
+class ExportMoves(Command):
+    """ Exports all moves of an user to a ZIP archive """
+
+    def __init__(self, app_context):
+        self.app_context = app_context
+
+    def get_options(self):
+        return [
+            Option('--username', '-u', dest='username', required=True),
+            Option('--filename', '-f', dest='filename', required=True),
+            Option('--format', dest='format', default='gpx', choices=sorted(export_functions.keys())),
+        ]
+
+    def run(self, username, filename, format='gpx'):
+        with self.app_context():
+            user = User.query.filter_by(username=username).one()
+            moves = Move.query.filter_by(user=user).order_by(Move.date_time.asc())
+            with open(filename, 'wb') as f:
+                for chunk in zip_export(moves, format):
+                    f.write(chunk)
+            print("exported moves of '%s' to '%s'" % (user.username, filename))
+
+
+class ProfileImport(Command):
+    """ Imports a move into a throwaway in-memory database and reports the duration and memory peak of each import phase """
+
+    def __init__(self, app_context):
+        self.app_context = app_context
+
+    def get_options(self):
+        return [
+            Option('--filename', '-f', dest='filename', required=True),
+            Option('--no-memory', dest='trace_memory', action='store_false', default=True,
+                   help="don't trace memory allocations which slows down the import"),
+        ]
+
+    def run(self, filename, trace_memory=True):
+        with self.app_context():
+            profile = self._profile_import(filename, trace_memory)
+
+        print("%-16s %10s %12s" % ('phase', 'seconds', 'peak MiB'))
+        for phase in profile.sorted_phases():
+            memory_peak = "%12.1f" % (phase.memory_peak / 1024.0 / 1024.0) if phase.memory_peak is not None else "%12s" % '-'
+            print("%-16s %10.3f %s" % (phase.name, phase.duration, memory_peak))
+        print("%-16s %10.3f" % ('total', profile.total_duration))
+        return profile
+
+    def _profile_import(self, filename, trace_memory):
+        # an own app with an in-memory database, db.session is bound to the engine of the current app,
+        # so the database of the app is never touched
+        profile_app = Flask(current_app.import_name)
+        profile_app.config.update(current_app.config)
+        profile_app.config.update(SQLALCHEMY_DATABASE_URI='sqlite://', EXPORT_CACHE_DIR=None)
+        db.init_app(profile_app)
+        try:
+            with profile_app.test_request_context():
+                db.create_all()
+                user = User(username='profile-import', password='-', active=True)
+                db.session.add(user)
+                db.session.commit()
+
+                profile = ImportProfile(filename, trace_memory=trace_memory)
+                with open(filename, 'rb') as f:
+                    move = move_import(FileStorage(f, os.path.basename(filename)), os.path.basename(filename), user, {}, profile=profile)
+
+                if move:
+                    print("imported move %d: %s, %d samples" % (move.id, move.activity, move.samples.count()))
+        finally:
+            db.get_engine(profile_app).dispose()
+        return profile
+
+
+class _Backfill(Command):
+    """ Base class of commands that calculate data at import for moves imported before """
+
+    def __init__(self, app_context):
+        self.app_context = app_context
+
+    def get_options(self):
+        return [
+            Option('--username', '-u', dest='username', required=False),
+            Option('--all', dest='recalculate', action='store_true', default=False,
+                   help="recalculate all moves, not only moves without any data"),
+        ]
+
+    def scope(self):
+        """ Criterion of the moves the command applies to, None for all moves """
+        return None
+
+    def run(self, username=None, recalculate=False):
+        with self.app_context():
+            moves = Move.query
+            if self.scope() is not None:
+                moves = moves.filter(self.scope())
+            if username:
+                moves = moves.filter(Move.user == User.query.filter_by(username=username).one())
+            if not recalculate:
+                moves = moves.filter(self.missing())
+
+            count = 0
+            for move_id, in moves.with_entities(Move.id).order_by(Move.id.asc()).all():
+                move = Move.query.get(move_id)
+                print("move %d: %s" % (move.id, self.update(move)))
+                # changes the validators of the move page and the versions of the cached exports and channels
+                move.derived_date_time = datetime.now()
+                db.session.commit()
+                export_cache.invalidate(move.id)
+                count += 1
+            print("updated %d moves" % count)
+
+
+class BackfillBestEfforts(_Backfill):
+    """ Calculates the best efforts of moves imported before they were calculated at import """
+
+    def missing(self):
+        return ~Move.best_efforts.any()
+
+    def update(self, move):
+        return "%d best efforts" % len(update_best_efforts(move))
+
+
+class BackfillHrZones(_Backfill):
+    """ Calculates the heart rate zones and training load of moves imported before they were calculated at import """
+
+    def missing(self):
+        return ~Move.hr_zones.any()
+
+    def update(self, move):
+        return "%s seconds in heart rate zones" % ", ".join("%.0f" % duration for duration in update_hr_zones(move))
+
+
+class BackfillGpsBounds(_Backfill):
+    """ Calculates the GPS bounding boxes used by the location filters of moves imported before they were calculated at import """
+
+    def missing(self):
+        return (Move.gps_center_latitude != None) & (Move.gps_geohash == None)
+
+    def update(self, move):
+        return "geohash '%s'" % update_gps_bounds(move)
+
+
+class BackfillSearchIndex(_Backfill):
+    """ Indexes moves imported before the full-text search index was maintained at import """
+
+    def missing(self):
+        return ~Move.id.in_(search.indexed_move_ids())
+
+    def update(self, move):
+        return "indexed '%s'" % search.update_move(move)
+
+
+class BackfillGpsOutliers(_Backfill):
+    """ Flags the GPS outliers of moves imported before they were flagged at import and updates the aggregates of their GPS tracks.
+
+    The distances and speeds of GPX imports are accumulated again without the outliers, the ones of other imports are recorded by the device.
+    """
+
+    def missing(self):
+        return (Move.gps_center_latitude != None) & (Move.gps_outlier_count == None)
+
+    def update(self, move):
+        heatmap.remove_move(move)
+        count = gps_filter.update_move(move)
+        db.session.flush()
+
+        heatmap.add_move(move)
+        update_gps_center(move)
+        update_gps_bounds(move)
+        segments.match_move(move)
+        if move.import_module == gpx_import.__name__:
+            gpx_import.update_distances(move)
+            update_best_efforts(move)
+            return "%d GPS outliers, distance %d m" % (count, move.distance)
+        return "%d GPS outliers" % count
+
+
+class BackfillGpxAscent(_Backfill):
+    """ Recalculates the ascent and descent of GPX imports from the smoothed altitude, keeping the raw sums of all altitude differences """
+
+    def scope(self):
+        return Move.import_module == gpx_import.__name__
+
+    def missing(self):
+        return (Move.ascent_raw == None) & (Move.altitude_max != None)
+
+    def update(self, move):
+        samples = sample_reader.sample_array(move, ('time', 'altitude'))
+        gpx_import.update_ascent_descent(move, samples['time'], samples['altitude'])
+        return "ascent %d m (raw %d m), descent %d m (raw %d m)" % (move.ascent, move.ascent_raw, move.descent, move.descent_raw)
+
+
+class BackfillSwimLengths(_Backfill):
+    """ Segments the lengths of swimming moves imported before they were stored at import """
+
+    def scope(self):
+        return Move.activity.like('%swimming%')
+
+    def missing(self):
+        return ~Move.swim_lengths.any()
+
+    def update(self, move):
+        return "%d lengths" % len(update_swim_lengths(move))
+
+
+class BackfillMovingTime(_Backfill):
+    """ Stores the pauses and the moving time of moves imported before they were stored at import """
+
+    def missing(self):
+        return Move.moving_time == None
+
+    def update(self, move):
+        pause_count = len(pauses.update_move(move))
+        return "moving time %s, %d pauses" % (move.moving_time, pause_count)
+
+
+class RebuildHeatmap(Command):
+    """ Recounts the heatmap cells of all moves, eg. for moves imported before the heatmap was calculated at import """
+
+    def __init__(self, app_context):
+        self.app_context = app_context
+
+    def get_options(self):
+        return [
+            Option('--username', '-u', dest='username', required=False),
+        ]
+
+    def run(self, username=None):
+        with self.app_context():
+            users = User.query
+            if username:
+                users = users.filter_by(username=username)
+
+            for user in users.all():
+                heatmap.rebuild(user)
+                db.session.commit()
+                print("rebuilt heatmap of '%s': %d cells" % (user.username, HeatCell.query.filter_by(user_id=user.id).count()))
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+
+from flask import json
+from export_cache import export_cache
+import resample
+import numpy as np
+from collections import OrderedDict
+
+COMPARE_COLUMNS = ('time', 'distance', 'hr', 'speed', 'altitude')
+
+CHANNELS = ('hr', 'speed', 'altitude')
+
+# spacing of the common distance grid the moves are aligned on
+GRID_SPACING = 5.0
+
+# number of points of the series for charting, each one averages the grid points of its bin
+MAX_POINTS = 500
+
+
+def _to_list(values):
+    return [None if np.isnan(value) else value for value in values.tolist()]
+
+
+def distance_profile(samples):
+    """ Returns the times and distances since the start of a move with strictly increasing distance """
+    mask = ~np.isnan(samples['time']) & ~np.isnan(samples['distance'])
+    time, distance = samples['time'][mask], samples['distance'][mask]
+    if len(time) < 2:
+        return np.empty(0), np.empty(0)
+
+    # the distance of some devices jitters slightly backwards, a pause is passed at the time it ended
+    distance = np.maximum.accumulate(distance)
+    increasing = np.concatenate((np.diff(distance) > 0, [True]))
+    return time[increasing], distance[increasing] - distance[0]
+
+
+def _channel_at(samples, column, times):
+    """ Interpolates a channel at times, NaN outside of the samples of the channel """
+    mask = ~np.isnan(samples['time']) & ~np.isnan(samples[column])
+    if np.count_nonzero(mask) < 2:
+        return np.full(len(times), np.nan)
+    return np.interp(times, samples['time'][mask], samples[column][mask], left=np.nan, right=np.nan)
+
+
+def _bin_means(values, bins):
+    """ Averages the values of each bin ignoring NaN, bins is the array of the bin start indices """
+    valid = ~np.isnan(values)
+    sums = np.add.reduceat(np.where(valid, values, 0.0), bins)
+    counts = np.add.reduceat(valid.astype(float), bins)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(counts > 0, sums / counts, np.nan)
+
+
+def align(samples1, samples2, spacing=GRID_SPACING, max_points=MAX_POINTS):
+    """ Aligns two moves on their distance since the start.
+
+    samples1 and samples2 are structured arrays with the COMPARE_COLUMNS like
+    ResampledChannels.to_array. Both moves are resampled every
+    spacing meters up to the distance of the shorter move. The time gap is
+    the time move 2 is behind move 1 at the same distance, the deltas are the
+    values of move 2 minus move 1. The series are downsampled to at most
+    max_points by averaging bins of the grid, distances and times are the
+    ones at the end of a bin. Returns an OrderedDict of JSON serializable
+    lists with None for missing values, or None if a move has no distance.
+    """
+    time1, distance1 = distance_profile(samples1)
+    time2, distance2 = distance_profile(samples2)
+    if not len(distance1) or not len(distance2):
+        return None
+
+    common_distance = min(distance1[-1], distance2[-1])
+    grid = np.append(np.arange(0.0, common_distance, spacing), common_distance)
+    grid_time1 = np.interp(grid, distance1, time1)
+    grid_time2 = np.interp(grid, distance2, time2)
+
+    bins = np.unique(np.linspace(0, len(grid), min(max_points, len(grid)), endpoint=False).astype(int))
+    bin_ends = np.append(bins[1:], len(grid)) - 1
+
+    elapsed1 = grid_time1[bin_ends] - grid_time1[0]
+    elapsed2 = grid_time2[bin_ends] - grid_time2[0]
+
+    result = OrderedDict()
+    result['distance'] = grid[bin_ends]
+    result['time_1'] = elapsed1
+    result['time_2'] = elapsed2
+    result['time_gap'] = elapsed2 - elapsed1
+    for column in CHANNELS:
+        values1 = _channel_at(samples1, column, grid_time1)
+        values2 = _channel_at(samples2, column, grid_time2)
+        result[column + '_1'] = _bin_means(values1, bins)
+        result[column + '_2'] = _bin_means(values2, bins)
+        result[column + '_delta'] = _bin_means(values2 - values1, bins)
+
+    return OrderedDict((name, _to_list(values)) for name, values in result.items())
+
+
+def _cache_format(other_move):
+    return "compare_%d.json" % other_move.id
+
+
+def _cache_version(move1, move2):
+    return "%s_%s" % (export_cache.version(move1), export_cache.version(move2))
+
+
+def compare_moves(move1, move2):
+    """ Returns the alignment of two moves, see align.
+
+    The alignment is cached in the export cache of the first move until one
+    of the moves changes, it is calculated from the 1 s grids of the moves.
+    """
+    def alignment_json(move, format):
+        samples1 = resample.resampled_channels(move1).to_array(COMPARE_COLUMNS)
+        samples2 = resample.resampled_channels(move2).to_array(COMPARE_COLUMNS)
+        return json.dumps(align(samples1, samples2))
+
+    if not export_cache.enabled:
+        return json.loads(alignment_json(move1, None))
+
+    path = export_cache.get_or_create(move1, _cache_format(move2), alignment_json, _cache_version(move1, move2))
+    with open(path, 'rb') as f:
+        return json.loads(f.read().decode('utf-8'))
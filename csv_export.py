@@ -4,6 +4,7 @@ from flask import flash
 from filters import radian_to_degree, format_distance, format_speed, format_altitude, format_temparature, format_hr, \
     format_energyconsumption, format_date_time
 from functools import partial
+from sample_reader import sample_rows
 
 
 csv_export_unit = False
@@ -20,9 +21,10 @@ def addValue(row_array, value, formatter=None):
 
 
 def csv_export(move):
-    samples = move.samples.order_by('time asc')
+    samples = sample_rows(move, ('time', 'latitude', 'longitude', 'altitude', 'distance', 'speed', 'temperature', 'hr',
+                                 'energy_consumption', 'gps_hdop', 'vertical_speed', 'number_of_satellites'))
 
-    if samples.count() == 0:
+    if len(samples) == 0:
         flash("No samples found for CSV export", 'error')
         return None
 
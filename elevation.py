@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+
+from numpy.lib.stride_tricks import as_strided
+import numpy as np
+
+# durations of the smoothing windows in seconds, converted to samples by the typical sample interval of a track:
+# the median removes single spikes, the Savitzky-Golay filter the noise while keeping the shape of climbs
+MEDIAN_DURATION = 5.0
+SAVITZKY_GOLAY_DURATION = 21.0
+SAVITZKY_GOLAY_ORDER = 2
+
+# changes of the smoothed altitude below this many meters are not counted as ascent or descent
+HYSTERESIS = 5.0
+
+
+def _sections(altitude):
+    """ Returns the (start, end) slices of the runs of samples with altitude """
+    valid = np.concatenate(([False], ~np.isnan(altitude), [False]))
+    changes = np.flatnonzero(np.diff(valid.astype(int)))
+    return list(zip(changes[::2], changes[1::2]))
+
+
+def _window(time, duration):
+    """ Returns the odd number of samples covering duration at the median sample interval of a section """
+    intervals = np.diff(time)
+    intervals = intervals[intervals > 0]
+    if not len(intervals):
+        return 1
+    window = int(duration / np.median(intervals))
+    window = min(window, len(time))
+    return max(window - (1 - window % 2), 1)
+
+
+def _sliding(values, window):
+    """ Returns the windows centered on each value as rows, the values at the ends are repeated """
+    padded = np.pad(values, window // 2, mode='edge')
+    return as_strided(padded, shape=(len(values), window), strides=(padded.strides[0], padded.strides[0]))
+
+
+def median_filter(values, window):
+    if window < 3:
+        return values.copy()
+    return np.median(_sliding(values, window), axis=1)
+
+
+def savitzky_golay(values, window, order=SAVITZKY_GOLAY_ORDER):
+    """ Smooths values by fitting a polynomial of order to the window around each value """
+    if window <= order:
+        return values.copy()
+    offsets = np.arange(window) - window // 2
+    coefficients = np.linalg.pinv(np.vander(offsets, order + 1, increasing=True))[0]
+    return _sliding(values, window).dot(coefficients)
+
+
+def smooth(time, altitude):
+    """ Returns the altitude of a section of a track smoothed by a median and a Savitzky-Golay filter """
+    altitude = median_filter(altitude, _window(time, MEDIAN_DURATION))
+    return savitzky_golay(altitude, _window(time, SAVITZKY_GOLAY_DURATION))
+
+
+def _extrema(altitude):
+    """ Returns the indices of the first and last value and of the values where the altitude turns """
+    direction = np.sign(np.diff(altitude))
+    changing = np.flatnonzero(direction)
+    turns = changing[1:][direction[changing[1:]] != direction[changing[:-1]]]
+    return np.concatenate(([0], turns, [len(altitude) - 1]))
+
+
+def climbs(altitude, threshold=HYSTERESIS):
+    """ Returns the alternating climbs and descents of at least threshold meters as (start, end) indices.
+
+    A climb ends at its highest point once the altitude dropped threshold
+    meters below it, so noise below the threshold neither ends a climb nor
+    counts as a descent.
+    """
+    legs = []
+    extrema = _extrema(altitude)
+    start = low = high = peak = extrema[0]
+    direction = 0
+    for index in extrema[1:]:
+        value = altitude[index]
+        if direction == 0:
+            low = index if value < altitude[low] else low
+            high = index if value > altitude[high] else high
+            if value - altitude[low] >= threshold:
+                direction, start, peak = 1, low, index
+            elif altitude[high] - value >= threshold:
+                direction, start, peak = -1, high, index
+        elif direction * (value - altitude[peak]) >= 0:
+            peak = index
+        elif direction * (altitude[peak] - value) >= threshold:
+            legs.append((start, peak))
+            direction, start, peak = -direction, peak, index
+
+    if direction != 0:
+        legs.append((start, peak))
+    return legs
+
+
+def raw_ascent_descent(altitude):
+    """ Returns the sums of all altitude increases and decreases between consecutive samples with altitude """
+    differences = np.diff(altitude)
+    differences = differences[~np.isnan(differences)]
+    return float(differences[differences > 0].sum()), float(-differences[differences < 0].sum())
+
+
+def ascent_descent(time, altitude, threshold=HYSTERESIS):
+    """ Returns the ascent, ascent time, descent and descent time in meters and seconds of a track.
+
+    time and altitude are float arrays with NaN for samples without
+    altitude, like the pause events of GPX imports. These split the track
+    into sections, which are smoothed separately and not connected. The
+    ascent and descent are the climbs and descents of the smoothed altitude
+    of at least threshold meters.
+    """
+    ascent = ascent_time = descent = descent_time = 0.0
+    for start, end in _sections(altitude):
+        section_time = time[start:end]
+        section_altitude = smooth(section_time, altitude[start:end])
+        for leg_start, leg_end in climbs(section_altitude, threshold):
+            difference = section_altitude[leg_end] - section_altitude[leg_start]
+            duration = section_time[leg_end] - section_time[leg_start]
+            if difference > 0:
+                ascent += difference
+                ascent_time += duration
+            else:
+                descent -= difference
+                descent_time += duration
+    return ascent, ascent_time, descent, descent_time
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+
+from flask import current_app
+from collections import OrderedDict
+import numpy as np
+import threading
+import math
+import os
+
+# value of the samples without elevation, eg. over water or in the shadow of mountains
+VOID = -32768
+
+# number of tiles kept open, one SRTM tile of 1 arc second is about 25 MiB
+MAX_OPEN_TILES = 16
+
+
+def tile_name(south, west):
+    """ Returns the file name of the HGT tile whose south west corner is at integer degrees, eg. 'N47E008.hgt' """
+    return "%s%02d%s%03d.hgt" % ('N' if south >= 0 else 'S', abs(south), 'E' if west >= 0 else 'W', abs(west))
+
+
+def open_tile(path):
+    """ Maps a HGT tile: big-endian 16 bit elevations in meters of a square grid, rows from north to south """
+    size = int(round(math.sqrt(os.path.getsize(path) // 2)))
+    return np.memmap(path, dtype='>i2', mode='r', shape=(size, size))
+
+
+def interpolate(tile, south, west, latitude, longitude):
+    """ Bilinearly interpolates the elevations of a tile at coordinates in degrees within it, NaN next to voids """
+    last = tile.shape[0] - 1
+    row = np.clip((south + 1 - latitude) * last, 0, last)
+    column = np.clip((longitude - west) * last, 0, last)
+    row0 = np.minimum(np.floor(row).astype(int), last - 1)
+    column0 = np.minimum(np.floor(column).astype(int), last - 1)
+    row_fraction, column_fraction = row - row0, column - column0
+
+    corners = [tile[row0 + dr, column0 + dc].astype(float) for dr, dc in ((0, 0), (0, 1), (1, 0), (1, 1))]
+    elevation = (corners[0] * (1 - row_fraction) * (1 - column_fraction) + corners[1] * (1 - row_fraction) * column_fraction +
+                 corners[2] * row_fraction * (1 - column_fraction) + corners[3] * row_fraction * column_fraction)
+    void = np.zeros(len(elevation), dtype=bool)
+    for corner in corners:
+        void |= corner == VOID
+    return np.where(void, np.nan, elevation)
+
+
+class ElevationModel(object):
+    """ Digital elevation model of SRTM HGT tiles in a local directory.
+
+    Tiles are memory-mapped on first use, so only the pages around the
+    looked up points are read. The most recently used tiles are kept open.
+    """
+
+    def __init__(self, directory=None, max_open_tiles=MAX_OPEN_TILES):
+        self._directory = directory
+        self.max_open_tiles = max_open_tiles
+        self._tiles = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def directory(self):
+        return self._directory or current_app.config.get('DEM_DIR')
+
+    @property
+    def enabled(self):
+        return bool(self.directory)
+
+    def tile(self, south, west):
+        """ Returns the memory-mapped tile with the south west corner at integer degrees or None if it does not exist, which is remembered as well """
+        path = os.path.join(self.directory, tile_name(south, west))
+        with self._lock:
+            if path in self._tiles:
+                tile = self._tiles.pop(path)
+            else:
+                tile = open_tile(path) if os.path.exists(path) else None
+            self._tiles[path] = tile  # most recently used last
+
+            while len(self._tiles) > self.max_open_tiles:
+                self._tiles.popitem(last=False)
+            return tile
+
+    def elevations(self, latitude, longitude):
+        """ Returns the elevations in meters at coordinates in degrees, NaN where no tile is available or next to voids """
+        latitude, longitude = np.asarray(latitude, dtype=float), np.asarray(longitude, dtype=float)
+        elevations = np.full(len(latitude), np.nan)
+        valid = ~np.isnan(latitude) & ~np.isnan(longitude)
+        souths = np.floor(np.where(valid, latitude, 0)).astype(int)
+        wests = np.floor(np.where(valid, longitude, 0)).astype(int)
+
+        for south, west in sorted(set(zip(souths[valid].tolist(), wests[valid].tolist()))):
+            tile = self.tile(south, west)
+            if tile is None:
+                continue
+            in_tile = valid & (souths == south) & (wests == west)
+            elevations[in_tile] = interpolate(tile, south, west, latitude[in_tile], longitude[in_tile])
+        return elevations
+
+
+elevation_model = ElevationModel()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+
+from flask import current_app
+import os
+import glob
+import tempfile
+
+
+class ExportCache(object):
+    """ Size-bounded on-disk LRU cache of move exports.
+
+    Entries are keyed by move id, export format and move version. The version
+    changes whenever a move is edited, so stale entries are never served.
+    """
+
+    @property
+    def directory(self):
+        return current_app.config.get('EXPORT_CACHE_DIR')
+
+    @property
+    def max_size(self):
+        return current_app.config.get('EXPORT_CACHE_MAX_SIZE')
+
+    @property
+    def enabled(self):
+        return bool(self.directory)
+
+    def _path(self, move_id, format, version='*'):
+        return os.path.join(self.directory, "%d_%s.%s" % (move_id, version, format))
+
+    def version(self, move, last_modified=None):
+        return (last_modified or move.last_modified()).strftime('%Y%m%dT%H%M%S%f')
+
+    def get(self, move, format, version=None):
+        path = self._path(move.id, format, version or self.version(move))
+        try:
+            os.utime(path, None)  # mark as recently used
+        except OSError:
+            return None
+        return path
+
+    def put(self, move, format, data, version=None):
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+        if not isinstance(data, bytes):
+            data = data.encode('utf-8')
+
+        path = self._path(move.id, format, version or self.version(move))
+
+        # write to a temporary file first so that concurrent readers never see partial exports
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp_')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+
+        for stale_path in glob.glob(self._path(move.id, format)):
+            self._remove(stale_path)
+
+        os.rename(tmp_path, path)
+        self._evict(keep=path)
+        return path
+
+    def get_or_create(self, move, format, export_function, version=None):
+        version = version or self.version(move)
+        path = self.get(move, format, version)
+        if path:
+            return path
+
+        data = export_function(move, format)
+        if not data:
+            return None
+        return self.put(move, format, data, version)
+
+    def invalidate(self, move_id):
+        if self.enabled:
+            for path in glob.glob(os.path.join(self.directory, "%d_*" % move_id)):
+                self._remove(path)
+            # comparisons are cached with the first move in the format compare_<id of the second move>.json
+            for path in glob.glob(os.path.join(self.directory, "*.compare_%d.json" % move_id)):
+                self._remove(path)
+
+    def _evict(self, keep):
+        if not self.max_size:
+            return
+
+        entries = []
+        for filename in os.listdir(self.directory):
+            if filename.startswith('.tmp_'):
+                continue
+            path = os.path.join(self.directory, filename)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            if path != keep:
+                self._remove(path)
+                total_size -= size
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+export_cache = ExportCache()
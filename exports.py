@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+
+from gpx_export import gpx_export
+from csv_export import csv_export
+from filters import get_city
+from export_cache import export_cache
+import zipfile
+
+
+export_functions = {
+    'gpx': gpx_export,
+    'csv': csv_export,
+}
+
+export_mimetypes = {
+    'gpx': 'application/gpx+xml',
+    'csv': 'text/csv',
+}
+
+
+def export_filename(move, format):
+    date_time = move.date_time.strftime('%Y-%m-%dT%H_%M_%S')
+    if move.location_raw:
+        address = move.location_raw['address']
+        city = get_city(address)
+        country_code = address['country_code'].upper()
+        return "Move_%s_%s_%s_%s.%s" % (date_time, country_code, city, move.activity, format)
+    else:
+        return "Move_%s_%s.%s" % (date_time, move.activity, format)
+
+
+def move_export(move, format):
+    return export_functions[format](move)
+
+
+def cached_move_export(move, format):
+    """ Returns the path of the export file in the export cache or None if the move has no data to export """
+    return export_cache.get_or_create(move, format, move_export)
+
+
+def _read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+class _ZipStream(object):
+    """ Write-only file object which hands out the written data chunk by chunk instead of keeping the archive """
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(data)
+        self.position += len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def zip_export(moves, format):
+    """ Generates a ZIP archive with one export file per move.
+
+    Files are generated on the fly and the archive is yielded in chunks,
+    so only a single export file is held in memory at any point in time.
+    Moves without data for the requested format are skipped.
+    """
+    stream = _ZipStream()
+    archive = zipfile.ZipFile(stream, mode='w', compression=zipfile.ZIP_DEFLATED)
+    filenames = set()
+
+    for move in moves:
+        if export_cache.enabled:
+            path = cached_move_export(move, format)
+            export_file = _read(path) if path else None
+        else:
+            export_file = move_export(move, format)
+
+        if not export_file:
+            continue
+
+        filename = export_filename(move, format)
+        if filename in filenames:
+            filename = "%d_%s" % (move.id, filename)
+        filenames.add(filename)
+
+        zip_info = zipfile.ZipInfo(filename, date_time=move.date_time.timetuple()[:6])
+        zip_info.compress_type = zipfile.ZIP_DEFLATED
+        zip_info.external_attr = 0o644 << 16
+        archive.writestr(zip_info, export_file)
+        yield stream.pop()
+
+    archive.close()
+    yield stream.pop()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+
+from model import db, Sample
+from spatial import EARTH_RADIUS
+from sqlalchemy.sql import bindparam
+import sample_reader
+import numpy as np
+
+# activity: (maximum plausible speed in m/s, maximum plausible acceleration in m/s²)
+ACTIVITY_LIMITS = {
+    'Running': (12.0, 8.0),
+    'Trekking': (8.0, 6.0),
+    'Walking': (8.0, 6.0),
+    'Hiking': (8.0, 6.0),
+    'Cycling': (30.0, 10.0),
+    'Mountain biking': (25.0, 10.0),
+    'Pool swimming': (4.0, 4.0),
+    'Outdoor swimming': (4.0, 4.0),
+    'Cross-country skiing': (20.0, 8.0),
+    'Alpine skiing': (45.0, 15.0),
+}
+
+# limits of unknown activities, roughly a car on a highway
+DEFAULT_LIMITS = (70.0, 15.0)
+
+# samples with a worse precision are outliers regardless of their position
+MAX_HDOP = 10.0
+MAX_EHPE = 100.0  # meters
+
+# jitter of the positions in meters, which is never regarded as movement
+POSITION_TOLERANCE = 10.0
+
+# longest run of points away from the track and back which is detected as a spike
+MAX_SPIKE_LENGTH = 3
+
+# flagging a spike changes the segments of its neighbours, so the track is checked again
+MAX_PASSES = 3
+
+FILTER_COLUMNS = ('id', 'time', 'latitude', 'longitude', 'gps_hdop', 'ehpe')
+
+
+def activity_limits(activity):
+    """ Returns the maximum plausible (speed, acceleration) of an activity """
+    return ACTIVITY_LIMITS.get(activity, DEFAULT_LIMITS)
+
+
+def _to_xy(latitude, longitude):
+    """ Projects coordinates in radians to meters on a plane tangent at the mean latitude """
+    origin_latitude = np.mean(latitude)
+    return EARTH_RADIUS * (longitude - longitude[0]) * np.cos(origin_latitude), EARTH_RADIUS * (latitude - latitude[0])
+
+
+def _implied_rate(length, duration):
+    """ Length beyond the position tolerance per duration, infinite for simultaneous positions """
+    excess = np.maximum(length - POSITION_TOLERANCE, 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(duration > 0, excess / duration, np.where(excess > 0, np.inf, 0.0))
+
+
+def _spikes(time, x, y, max_speed, max_acceleration):
+    """ Returns the mask of the points of a track which are implausible jumps """
+    spikes = np.zeros(len(time), dtype=bool)
+    if len(time) < 3:
+        return spikes
+
+    # a run of a few points is a spike if reaching and leaving it are both too fast, while bypassing it is not
+    too_fast = _implied_rate(np.hypot(np.diff(x), np.diff(y)), np.diff(time)) > max_speed
+    for length in range(1, min(MAX_SPIKE_LENGTH, len(time) - 2) + 1):
+        before = np.arange(len(time) - length - 1)
+        after = before + length + 1
+        bypass_too_fast = _implied_rate(np.hypot(x[after] - x[before], y[after] - y[before]), time[after] - time[before]) > max_speed
+        starts = before[too_fast[before] & too_fast[after - 1] & ~bypass_too_fast] + 1
+        for offset in range(length):
+            spikes[starts + offset] = True
+
+    # the first and last point only have a single segment, which is too fast while the following one is not
+    spikes[0] = too_fast[0] and not too_fast[1]
+    spikes[-1] = too_fast[-1] and not too_fast[-2]
+
+    # or if the detour from the direct path between its neighbours needs too much acceleration:
+    # moving the distance h sideways and back within t seconds needs an acceleration of 16 h / t²
+    chord_x, chord_y = x[2:] - x[:-2], y[2:] - y[:-2]
+    offset_x, offset_y = x[1:-1] - x[:-2], y[1:-1] - y[:-2]
+    chord = np.hypot(chord_x, chord_y)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        detour = np.where(chord > 0, np.abs(chord_x * offset_y - chord_y * offset_x) / chord, np.hypot(offset_x, offset_y))
+    duration = time[2:] - time[:-2]
+    spikes[1:-1] |= 16 * _implied_rate(detour, duration ** 2) > max_acceleration
+    return spikes
+
+
+def flag_outliers(time, latitude, longitude, hdop=None, ehpe=None, max_speed=DEFAULT_LIMITS[0], max_acceleration=DEFAULT_LIMITS[1]):
+    """ Returns the mask of the GPS outliers of a track.
+
+    All arguments are float arrays of the same length, time in seconds and
+    positions in radians, NaN for samples without the value. Samples without
+    position are never outliers. A sample is an outlier if its precision is
+    worse than MAX_HDOP or MAX_EHPE, or if it is a spike: an implausible jump
+    away from the track and back, see _spikes. Spikes are detected in a few
+    passes, each one ignoring the outliers found so far.
+    """
+    outliers = np.zeros(len(time), dtype=bool)
+    positions = ~np.isnan(time) & ~np.isnan(latitude) & ~np.isnan(longitude)
+    with np.errstate(invalid='ignore'):
+        if hdop is not None:
+            outliers |= positions & (hdop > MAX_HDOP)
+        if ehpe is not None:
+            outliers |= positions & (ehpe > MAX_EHPE)
+
+    indices = np.flatnonzero(positions & ~outliers)
+    if len(indices) < 3:
+        return outliers
+
+    time = time[indices]
+    x, y = _to_xy(latitude[indices], longitude[indices])
+    for _ in range(MAX_PASSES):
+        spikes = _spikes(time, x, y, max_speed, max_acceleration)
+        if not spikes.any():
+            break
+        outliers[indices[spikes]] = True
+        indices, time, x, y = indices[~spikes], time[~spikes], x[~spikes], y[~spikes]
+    return outliers
+
+
+def _float_array(values):
+    return np.array([value if value is not None else np.nan for value in values], dtype=float)
+
+
+def flag_samples(samples, activity, time=None):
+    """ Flags the GPS outliers of parsed samples before they are persisted, returns the number of outliers.
+
+    time defaults to the seconds of the samples since the start of the move.
+    """
+    if time is None:
+        time = np.array([sample.time.total_seconds() if sample.time is not None else np.nan for sample in samples], dtype=float)
+    outliers = flag_outliers(time,
+                             _float_array([sample.latitude for sample in samples]),
+                             _float_array([sample.longitude for sample in samples]),
+                             _float_array([sample.gps_hdop for sample in samples]),
+                             _float_array([sample.ehpe for sample in samples]),
+                             *activity_limits(activity))
+
+    for index in np.flatnonzero(outliers):
+        samples[index].gps_outlier = True
+    return int(np.count_nonzero(outliers))
+
+
+def update_move(move):
+    """ Flags the GPS outliers of a persisted move again, eg. after the limits changed, returns the number of outliers """
+    samples = sample_reader.sample_array(move, FILTER_COLUMNS)
+    outliers = flag_outliers(samples['time'], samples['latitude'], samples['longitude'], samples['gps_hdop'], samples['ehpe'],
+                             *activity_limits(move.activity))
+
+    table = Sample.__table__
+    db.session.execute(table.update().where(table.c.move_id == move.id).values(gps_outlier=None))
+    if outliers.any():
+        db.session.execute(table.update().where(table.c.id == bindparam('sample_id')).values(gps_outlier=True),
+                           [{'sample_id': int(sample_id)} for sample_id in samples['id'][outliers]])
+    move.gps_outlier_count = int(np.count_nonzero(outliers))
+    return move.gps_outlier_count
@@ -4,6 +4,7 @@ from flask import flash
 import gpxpy.gpx
 from filters import radian_to_degree
 from model import Sample
+from sample_reader import sample_rows
 
 
 def gpx_export(move):
@@ -20,9 +21,9 @@ def gpx_export(move):
     gpx_track.segments.append(gpx_segment)
 
     # Create points:
-    gps_samples = move.samples.filter(Sample.sample_type.like('gps-%')).order_by('time asc')
+    gps_samples = sample_rows(move, ('time', 'latitude', 'longitude', 'gps_altitude', 'gps_hdop'), Sample.sample_type.like('gps-%'))
 
-    if gps_samples.count() == 0:
+    if len(gps_samples) == 0:
         flash("No GPS samples found for GPX export", 'error')
         return None
 
@@ -5,11 +5,18 @@ import os
 import dateutil.parser
 from flask import flash
 from model import db, Device, Move, Sample
+from sqlalchemy.sql import bindparam
 from lxml import objectify
 from filters import degree_to_radian, radian_to_degree
 from datetime import datetime, timedelta
 from _import import postprocess_move
+from import_profiler import import_phase
 from geopy.distance import vincenty
+import gps_filter
+import sample_reader
+import elevation
+from pauses import pause_intervals, moving_time
+from elevation_model import elevation_model
 import numpy as np
 
 # Import options
@@ -35,6 +42,7 @@ GPX_TRKPT = 'trkpt'
 GPX_TRKPT_ATTRIB_LATITUDE = 'lat'
 GPX_TRKPT_ATTRIB_LONGITUDE = 'lon'
 GPX_TRKPT_ATTRIB_ELEVATION = 'ele'
+GPX_TRKPT_HDOP = 'hdop'
 
 GPX_NAMESPACE_TRACKPOINTEXTENSION_V1 = '{http://www.garmin.com/xmlschemas/TrackPointExtension/v1}'
 GPX_EXTENSION_TRACKPOINTEXTENSION = 'TrackPointExtension'
@@ -78,8 +86,51 @@ def parse_sample_extensions(sample, track_point):
                     break
 
 
+def parse_track_point(track_point):
+    sample = Sample()
+
+    # GPS position / altitude
+    sample.latitude = degree_to_radian(float(track_point.attrib[GPX_TRKPT_ATTRIB_LATITUDE]))
+    sample.longitude = degree_to_radian(float(track_point.attrib[GPX_TRKPT_ATTRIB_LONGITUDE]))
+    sample.sample_type = GPX_SAMPLE_TYPE
+    if hasattr(track_point, GPX_TRKPT_ATTRIB_ELEVATION):
+        sample.gps_altitude = float(track_point.ele)
+        sample.altitude = int(round(sample.gps_altitude))
+    if hasattr(track_point, GPX_TRKPT_HDOP):
+        sample.gps_hdop = float(track_point.hdop)
+
+    # Time / UTC
+    sample.utc = dateutil.parser.parse(str(track_point.time))
+    return sample
+
+
+def flag_outliers(samples, activity):
+    """ Flags the GPS outliers of the samples of a track segment, returns the number of outliers """
+    if not samples:
+        return 0
+    time = np.asarray([(sample.utc - samples[0].utc).total_seconds() for sample in samples], dtype=float)
+    return gps_filter.flag_samples(samples, activity, time)
+
+
+def fill_missing_altitudes(samples, dem=elevation_model):
+    """ Looks up the altitude of the samples with position but without altitude in the local elevation model, returns the number of filled samples """
+    missing = [sample for sample in samples if sample.latitude is not None and sample.altitude is None]
+    if not missing or not dem.enabled:
+        return 0
+
+    altitudes = dem.elevations([radian_to_degree(sample.latitude) for sample in missing],
+                               [radian_to_degree(sample.longitude) for sample in missing])
+    count = 0
+    for sample, altitude in zip(missing, altitudes.tolist()):
+        if not np.isnan(altitude):
+            sample.altitude = int(round(altitude))
+            count += 1
+    return count
+
+
 def parse_samples(tree, move, gpx_namespace, import_options):
     all_samples = []
+    move.gps_outlier_count = 0
 
     tracks = tree.iterchildren(tag=gpx_namespace + GPX_TRK)
     for track in tracks:
@@ -89,21 +140,14 @@ def parse_samples(tree, move, gpx_namespace, import_options):
         for track_segment in track_segments:
             segment_samples = []
 
-            track_points = track_segment.iterchildren(tag=gpx_namespace + GPX_TRKPT)
-            for track_point in track_points:
-                sample = Sample()
-                sample.move = move
-
-                # GPS position / altitude
-                sample.latitude = degree_to_radian(float(track_point.attrib[GPX_TRKPT_ATTRIB_LATITUDE]))
-                sample.longitude = degree_to_radian(float(track_point.attrib[GPX_TRKPT_ATTRIB_LONGITUDE]))
-                sample.sample_type = GPX_SAMPLE_TYPE
-                if hasattr(track_point, GPX_TRKPT_ATTRIB_ELEVATION):
-                    sample.gps_altitude = float(track_point.ele)
-                    sample.altitude = int(round(sample.gps_altitude))
+            track_points = list(track_segment.iterchildren(tag=gpx_namespace + GPX_TRKPT))
+            points = [parse_track_point(track_point) for track_point in track_points]
+            with import_phase('filter'):
+                move.gps_outlier_count += flag_outliers(points, move.activity)
 
-                # Time / UTC
-                sample.utc = dateutil.parser.parse(str(track_point.time))
+            previous_sample = None  # Last sample of the track segment which is not a GPS outlier
+            for track_point, sample in zip(track_points, points):
+                sample.move = move
 
                 # Option flags
                 pause_detected = False
@@ -114,15 +158,21 @@ def parse_samples(tree, move, gpx_namespace, import_options):
                     time_delta = sample.utc - segment_samples[-1].utc
                     sample.time = segment_samples[-1].time + time_delta
 
-                    # Accumulate distance to previous sample
-                    distance_delta = vincenty((radian_to_degree(sample.latitude), radian_to_degree(sample.longitude)),
-                                              (radian_to_degree(segment_samples[-1].latitude), radian_to_degree(segment_samples[-1].longitude))).meters
-
-                    sample.distance = segment_samples[-1].distance + distance_delta
-                    if time_delta > timedelta(0):
-                        sample.speed = distance_delta / time_delta.total_seconds()
+                    if sample.gps_outlier or previous_sample is None:
+                        # GPS outliers are left out of the track
+                        sample.distance = segment_samples[-1].distance
+                        sample.speed = None if sample.gps_outlier else 0
                     else:
-                        sample.speed = 0
+                        # Accumulate distance to previous sample
+                        distance_delta = vincenty((radian_to_degree(sample.latitude), radian_to_degree(sample.longitude)),
+                                                  (radian_to_degree(previous_sample.latitude), radian_to_degree(previous_sample.longitude))).meters
+
+                        sample.distance = previous_sample.distance + distance_delta
+                        track_time_delta = sample.utc - previous_sample.utc
+                        if track_time_delta > timedelta(0):
+                            sample.speed = distance_delta / track_time_delta.total_seconds()
+                        else:
+                            sample.speed = 0
 
                     # Option: Pause detection based on time delta threshold
                     if GPX_IMPORT_OPTION_PAUSE_DETECTION in import_options and time_delta > import_options[GPX_IMPORT_OPTION_PAUSE_DETECTION]:
@@ -148,6 +198,8 @@ def parse_samples(tree, move, gpx_namespace, import_options):
 
                 parse_sample_extensions(sample, track_point)
                 segment_samples.append(sample)
+                if not sample.gps_outlier:
+                    previous_sample = sample
 
                 # Finally insert a found pause based on time delta threshold
                 if pause_detected:
@@ -165,6 +217,9 @@ def parse_samples(tree, move, gpx_namespace, import_options):
         all_samples.extend(track_samples)
         insert_pause(all_samples, insert_pause_idx, move, pause_type=GPX_TRK)
     # end for tracks
+
+    # Tracks without elevation, eg. recorded by phones
+    fill_missing_altitudes(all_samples)
     return all_samples
 
 
@@ -208,9 +263,6 @@ def insert_pause(samples, insert_pause_idx, move, pause_type):
                                     }}
     samples.insert(insert_pause_idx + 1, pause_sample)
 
-def is_start_pause_sample(sample):
-    return sample.events and "pause" in sample.events and sample.events["pause"]["state"].lower() == "true"
-
 def parse_move(tree):
     move = Move()
     move.activity = GPX_ACTIVITY_TYPE
@@ -226,6 +278,17 @@ def parse_device(tree):
     return device
 
 
+def update_ascent_descent(move, time, altitude):
+    """ Stores the raw and the corrected ascent and descent of a move from the times and altitudes of its samples, NaN without altitude """
+    move.ascent_raw, move.descent_raw = [int(round(value)) for value in elevation.raw_ascent_descent(altitude)]
+
+    ascent, ascent_time, descent, descent_time = elevation.ascent_descent(time, altitude)
+    move.ascent = int(round(ascent))
+    move.ascent_time = timedelta(seconds=ascent_time)
+    move.descent = int(round(descent))
+    move.descent_time = timedelta(seconds=descent_time)
+
+
 def derive_move_infos_from_samples(move, samples):
     if len(samples) <= 0:
         return
@@ -233,9 +296,7 @@ def derive_move_infos_from_samples(move, samples):
     move.date_time = samples[0].utc
     move.log_item_count = len(samples)
 
-    move.duration = timedelta(0)  # Accumulated later without pauses
-
-    speeds = np.asarray([sample.speed for sample in samples if sample.speed is not None], dtype=float)
+    speeds = np.asarray([sample.speed for sample in samples if sample.speed is not None and not sample.gps_outlier], dtype=float)
     if len(speeds) > 0:
         move.speed_max = np.max(speeds)
 
@@ -245,34 +306,14 @@ def derive_move_infos_from_samples(move, samples):
         move.altitude_min = np.min(altitudes)
         move.altitude_max = np.max(altitudes)
 
-        # Total ascent / descent
-        move.ascent = 0;
-        move.ascent_time = timedelta(0)
-        move.descent = 0;
-        move.descent_time = timedelta(0)
-        previous_sample = None
+        # Total ascent / descent, the raw sums of all altitude differences and of the smoothed altitude
+        update_ascent_descent(move,
+                              np.asarray([sample.time.total_seconds() for sample in samples], dtype=float),
+                              np.asarray([sample.altitude if sample.altitude is not None else np.nan for sample in samples], dtype=float))
 
-    # Accumulate values from samples
-    for sample in samples:
-        # Skip calculation on first sample, sample without altitude info, pause event
-        if previous_sample and not is_start_pause_sample(previous_sample):
-
-            # Calculate altitude and time sums
-            if sample.altitude is not None and previous_sample.altitude is not None:
-                altitude_diff = sample.altitude - previous_sample.altitude
-                time_diff = sample.time - previous_sample.time
-                if altitude_diff > 0:
-                    move.ascent += altitude_diff
-                    move.ascent_time += time_diff
-                elif altitude_diff < 0:
-                    move.descent += -altitude_diff
-                    move.descent_time += time_diff
-
-            # Total duration
-            move.duration += sample.utc - previous_sample.utc
-
-        # Store sample for next cycle
-        previous_sample = sample
+    # Total duration without the pauses between track segments, tracks and detected by the time delta threshold
+    times = [sample.time for sample in samples]
+    move.duration = moving_time(times[0], times[-1], pause_intervals(times, [sample.events for sample in samples]))
 
     # Total Speed / Distance
     move.distance = samples[-1].distance
@@ -293,6 +334,58 @@ def derive_move_infos_from_samples(move, samples):
         move.hr_avg = np.mean(hrs)
 
 
+def update_distances(move):
+    """ Accumulates the distances and speeds of the samples of a persisted GPX import again, eg. after its GPS outliers changed.
+
+    Like parse_samples the GPS outliers are left out of the track and the
+    first sample after a pause starts at the distance before with speed 0.
+    Distances and speeds from GPX extensions are replaced. Updates the
+    distance, the maximum and the average speed of the move.
+    """
+    samples = sample_reader.sample_rows(move, ('id', 'utc', 'latitude', 'longitude', 'gps_outlier', 'events'))
+
+    updates = []
+    distance = 0.0
+    previous_sample = None  # Last sample since the last pause which is not a GPS outlier
+    paused = True
+    for sample in samples:
+        if sample.events and 'pause' in sample.events:
+            previous_sample = None
+            paused = True
+            continue
+        if sample.latitude is None or sample.longitude is None:
+            continue
+
+        if paused:
+            speed = 0.0
+        elif sample.gps_outlier or previous_sample is None:
+            speed = None if sample.gps_outlier else 0.0
+        else:
+            distance_delta = vincenty((radian_to_degree(sample.latitude), radian_to_degree(sample.longitude)),
+                                      (radian_to_degree(previous_sample.latitude), radian_to_degree(previous_sample.longitude))).meters
+            distance += distance_delta
+            track_time_delta = sample.utc - previous_sample.utc
+            speed = distance_delta / track_time_delta.total_seconds() if track_time_delta > timedelta(0) else 0.0
+
+        paused = False
+        if not sample.gps_outlier:
+            previous_sample = sample
+        updates.append({'sample_id': sample.id, 'distance': distance, 'speed': speed})
+
+    if not updates:
+        return move.distance
+
+    table = Sample.__table__
+    db.session.execute(table.update().where(table.c.id == bindparam('sample_id')).values(distance=bindparam('distance'), speed=bindparam('speed')),
+                       updates)
+
+    move.distance = distance
+    move.speed_max = max(update['speed'] for update in updates if update['speed'] is not None)
+    if move.duration and move.duration > timedelta(0):
+        move.speed_avg = move.distance / move.duration.total_seconds()
+    return move.distance
+
+
 def get_gpx_import_options(request_form):
     import_options = { }
     if GPX_IMPORT_OPTION_PAUSE_DETECTION  in request_form:
@@ -312,7 +405,8 @@ def gpx_import(xmlfile, user, request_form):
 
     filename = xmlfile.filename
     try:
-        tree = objectify.parse(xmlfile).getroot()
+        with import_phase('parse samples'):
+            tree = objectify.parse(xmlfile).getroot()
     except Exception as e:
         flash("Failed to parse the GPX file! %s" % e.msg)
         return
@@ -341,9 +435,11 @@ def gpx_import(xmlfile, user, request_form):
     move.import_module = __name__
 
     # Parse samples
-    all_samples = parse_samples(tree, move, gpx_namespace, import_options)
+    with import_phase('parse samples'):
+        all_samples = parse_samples(tree, move, gpx_namespace, import_options)
 
-    derive_move_infos_from_samples(move, all_samples)
+    with import_phase('derive'):
+        derive_move_infos_from_samples(move, all_samples)
 
     if Move.query.filter_by(user=user, date_time=move.date_time, device=device).scalar():
         flash("%s at %s already exists" % (move.activity, move.date_time), 'warning')
@@ -355,6 +451,9 @@ def gpx_import(xmlfile, user, request_form):
         for sample in all_samples:
             db.session.add(sample)
 
+        with import_phase('persist'):
+            db.session.flush()
         postprocess_move(move)
-        db.session.commit()
+        with import_phase('persist'):
+            db.session.commit()
         return move
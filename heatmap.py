@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+
+from model import db, Move, HeatCell
+import sample_reader
+import numpy as np
+from collections import OrderedDict
+
+# zoom levels of the grids, a cell is a web mercator tile of the level
+ZOOM_LEVELS = (8, 11, 14, 17)
+
+# a map shows the cells of the finest grid at most this many levels above its zoom, ie. cells of 8 pixels
+CELL_ZOOM_OFFSET = 5
+
+MAX_LATITUDE = 85.0511287798
+
+
+def tile_coordinates(latitude, longitude, zoom):
+    """ Returns the web mercator tile x and y arrays of coordinates in degrees """
+    n = 2 ** zoom
+    latitude = np.radians(np.clip(latitude, -MAX_LATITUDE, MAX_LATITUDE))
+    x = np.floor((np.asarray(longitude) + 180.0) / 360.0 * n)
+    y = np.floor((1.0 - np.log(np.tan(latitude) + 1.0 / np.cos(latitude)) / np.pi) / 2.0 * n)
+    return np.clip(x, 0, n - 1).astype(np.int64), np.clip(y, 0, n - 1).astype(np.int64)
+
+
+def tile_center(zoom, x, y):
+    """ Returns the latitude and longitude in degrees of the center of a tile """
+    n = 2 ** zoom
+    longitude = (x + 0.5) / n * 360.0 - 180.0
+    latitude = np.degrees(np.arctan(np.sinh(np.pi * (1.0 - 2.0 * (y + 0.5) / n))))
+    return float(latitude), float(longitude)
+
+
+def calculate_cells(latitude, longitude, zoom):
+    """ Returns the distinct cells (x, y) of a zoom level the coordinates in degrees fall into """
+    mask = ~np.isnan(latitude) & ~np.isnan(longitude)
+    x, y = tile_coordinates(latitude[mask], longitude[mask], zoom)
+    keys = np.unique(x * 2 ** zoom + y)
+    return list(zip((keys // 2 ** zoom).tolist(), (keys % 2 ** zoom).tolist()))
+
+
+def move_cells(move):
+    """ Returns an OrderedDict of zoom level to the cells the GPS samples of a move fall into, outliers excluded """
+    samples = sample_reader.sample_array(move, ('latitude', 'longitude'), sample_reader.NOT_GPS_OUTLIER)
+    latitude, longitude = np.degrees(samples['latitude']), np.degrees(samples['longitude'])
+
+    cells = OrderedDict()
+    for zoom in ZOOM_LEVELS:
+        cells[zoom] = calculate_cells(latitude, longitude, zoom)
+    return cells
+
+
+def _add_cells(user_id, zoom, cells, delta):
+    if not cells:
+        return
+
+    xs, ys = zip(*cells)
+    existing = HeatCell.query.filter(HeatCell.user_id == user_id) \
+                             .filter(HeatCell.zoom == zoom) \
+                             .filter(HeatCell.x.between(min(xs), max(xs))) \
+                             .filter(HeatCell.y.between(min(ys), max(ys)))
+    heat_cells = dict(((heat_cell.x, heat_cell.y), heat_cell) for heat_cell in existing)
+
+    for x, y in cells:
+        heat_cell = heat_cells.get((x, y))
+        if heat_cell:
+            heat_cell.count += delta
+            if heat_cell.count <= 0:
+                db.session.delete(heat_cell)
+        elif delta > 0:
+            db.session.add(HeatCell(user_id=user_id, zoom=zoom, x=x, y=y, count=delta))
+
+
+def add_move(move, delta=1):
+    """ Counts the cells of a move in the heatmap of its user """
+    cells = move_cells(move)
+    for zoom, zoom_cells in cells.items():
+        _add_cells(move.user_id, zoom, zoom_cells, delta)
+    return cells
+
+
+def remove_move(move):
+    """ Uncounts the cells of a move, before its samples are deleted """
+    return add_move(move, delta=-1)
+
+
+def rebuild(user):
+    """ Recounts the heatmap of an user from all moves """
+    HeatCell.query.filter_by(user_id=user.id).delete(synchronize_session=False)
+    db.session.flush()
+    for move_id, in Move.query.filter_by(user=user).with_entities(Move.id).order_by(Move.id.asc()).all():
+        add_move(Move.query.get(move_id))
+        db.session.flush()
+
+
+def grid_zoom(map_zoom):
+    """ Returns the zoom level of the grid to show on a map """
+    levels = [zoom for zoom in ZOOM_LEVELS if zoom <= map_zoom + CELL_ZOOM_OFFSET]
+    return levels[-1] if levels else ZOOM_LEVELS[0]
+
+
+def cells_query(user, zoom, west, south, east, north):
+    """ Returns the cells of a grid within a bounding box in degrees """
+    (x_min, x_max), (y_max, y_min) = tile_coordinates(np.array([south, north]), np.array([west, east]), zoom)
+    return HeatCell.query.filter(HeatCell.user_id == user.id) \
+                         .filter(HeatCell.zoom == zoom) \
+                         .filter(HeatCell.x.between(int(x_min), int(x_max))) \
+                         .filter(HeatCell.y.between(int(y_min), int(y_max)))
+
+
+def heatmap_geojson(user, map_zoom, west, south, east, north):
+    """ Returns a GeoJSON feature collection of the cell centers within a bounding box with their count """
+    zoom = grid_zoom(map_zoom)
+    features = []
+    for heat_cell in cells_query(user, zoom, west, south, east, north):
+        latitude, longitude = tile_center(zoom, heat_cell.x, heat_cell.y)
+        features.append({
+            'type': 'Feature',
+            'geometry': {'type': 'Point', 'coordinates': [longitude, latitude]},
+            'properties': {'count': heat_cell.count},
+        })
+    return {'type': 'FeatureCollection', 'zoom': zoom, 'features': features}
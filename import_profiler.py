@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+
+from collections import OrderedDict
+from contextlib import contextmanager
+import threading
+import time
+
+try:
+    import tracemalloc
+except ImportError:  # Python < 3.4
+    tracemalloc = None
+
+
+PHASES = ('parse header', 'parse samples', 'filter', 'derive', 'geocode', 'persist')
+
+_active = threading.local()
+
+
+class ImportPhase(object):
+    __slots__ = ('name', 'duration', 'memory_peak')
+
+    def __init__(self, name):
+        self.name = name
+        self.duration = 0.0
+        self.memory_peak = None
+
+
+class ImportProfile(object):
+    """ Durations and memory peaks of the phases of a single move import.
+
+    A phase may be entered several times, its durations are summed up. The
+    memory peak of a phase is the maximum of memory allocated while it ran,
+    measured with tracemalloc if trace_memory is set and available.
+    """
+
+    def __init__(self, filename, trace_memory=False):
+        self.filename = filename
+        self.trace_memory = bool(trace_memory) and tracemalloc is not None
+        self.phases = OrderedDict()
+        self._started_tracing = False
+
+    def __enter__(self):
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        self._previous = getattr(_active, 'profile', None)
+        _active.profile = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _active.profile = self._previous
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    @contextmanager
+    def phase(self, name):
+        if name not in self.phases:
+            self.phases[name] = ImportPhase(name)
+        phase = self.phases[name]
+
+        if self.trace_memory:
+            # clearing the traces resets the peak, so the peak only covers this phase
+            tracemalloc.clear_traces()
+
+        start = time.time()
+        try:
+            yield phase
+        finally:
+            phase.duration += time.time() - start
+            if self.trace_memory:
+                _, peak = tracemalloc.get_traced_memory()
+                phase.memory_peak = max(phase.memory_peak or 0, peak)
+
+    @property
+    def total_duration(self):
+        return sum(phase.duration for phase in self.phases.values())
+
+    def sorted_phases(self):
+        return sorted(self.phases.values(), key=lambda phase: PHASES.index(phase.name) if phase.name in PHASES else len(PHASES))
+
+    def summary(self):
+        parts = []
+        for phase in self.sorted_phases():
+            if phase.memory_peak is not None:
+                parts.append("%s %.3f s (peak %.1f MiB)" % (phase.name, phase.duration, phase.memory_peak / 1024.0 / 1024.0))
+            else:
+                parts.append("%s %.3f s" % (phase.name, phase.duration))
+        return "import of '%s' took %.3f s: %s" % (self.filename, self.total_duration, ", ".join(parts))
+
+
+@contextmanager
+def import_phase(name):
+    """ Accounts the enclosed code to the given phase of the active import profile, if any """
+    profile = getattr(_active, 'profile', None)
+    if profile is None:
+        yield None
+    else:
+        with profile.phase(name) as phase:
+            yield phase
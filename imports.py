@@ -1,7 +1,7 @@
 #!/usr/bin/env python
 # vim: set fileencoding=utf-8 :
 
-from flask import flash
+from flask import flash, current_app
 
 from old_xml_import import old_xml_import
 from sml_import import sml_import
@@ -9,10 +9,31 @@ from gpx_import import gpx_import
 import gzip
 from model import db, Sample
 from sqlalchemy.sql import func
+from import_profiler import ImportProfile, import_phase
+from best_efforts import update_best_efforts
+from training_load import update_hr_zones
+from swimming import update_swim_lengths
+import heatmap
+from spatial import update_gps_bounds
+from segments import match_move
+import search
+import pauses
 
 
-def move_import(xmlfile, filename, user, request_form):
+def move_import(xmlfile, filename, user, request_form, profile=None):
+    if profile is None:
+        profile = ImportProfile(filename, trace_memory=current_app.config.get('IMPORT_TRACE_MEMORY'))
+
+    with profile:
+        move = _move_import(xmlfile, filename, user, request_form)
+
+    current_app.logger.info(profile.summary())
+    return move
+
+
+def _move_import(xmlfile, filename, user, request_form):
     if filename.endswith('.gz'):
+        # decompressed while parsing, so its time counts to the parse phases
         xmlfile = gzip.GzipFile(fileobj=xmlfile, mode='rb', filename=filename)
         filename = filename[:-len('.gz')]
 
@@ -29,18 +50,29 @@ def move_import(xmlfile, filename, user, request_form):
         import_function = import_functions[extension]
         move = import_function(xmlfile, user, request_form)
         if move:
-            move.temperature_avg, = db.session.query(func.avg(Sample.temperature)).filter(Sample.move == move, Sample.temperature > 0).one()
+            with import_phase('derive'):
+                move.temperature_avg, = db.session.query(func.avg(Sample.temperature)).filter(Sample.move == move, Sample.temperature > 0).one()
+
+                stroke_count = 0
+                for events, in db.session.query(Sample.events).filter(Sample.move == move, Sample.events != None):
+                    if 'swimming' in events and events['swimming']['type'] == 'Stroke':
+                        stroke_count += 1
 
-            stroke_count = 0
-            for events, in db.session.query(Sample.events).filter(Sample.move == move, Sample.events != None):
-                if 'swimming' in events and events['swimming']['type'] == 'Stroke':
-                    stroke_count += 1
+                if 'swimming' in move.activity:
+                    assert stroke_count > 0
 
-            if 'swimming' in move.activity:
-                assert stroke_count > 0
+                if stroke_count > 0:
+                    move.stroke_count = stroke_count
 
-            if stroke_count > 0:
-                move.stroke_count = stroke_count
+                pauses.update_move(move)
+                update_best_efforts(move)
+                update_hr_zones(move)
+                update_swim_lengths(move)
+                heatmap.add_move(move)
+                update_gps_bounds(move)
+                match_move(move)
+                search.update_move(move)
 
-            db.session.commit()
+            with import_phase('persist'):
+                db.session.commit()
             return move
@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+
+from flask import g, request, has_request_context
+from jinja2 import Template
+from sqlalchemy import event
+from collections import defaultdict
+import threading
+import time
+
+
+# upper bounds of the latency histogram buckets in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf'))
+
+MAX_RECORDED_STATEMENTS = 200
+
+
+class RequestMetrics(object):
+    """ Measurements of a single request """
+    __slots__ = ('start', 'sql_count', 'sql_time', 'template_time', 'statements')
+
+    def __init__(self, record_statements):
+        self.start = time.time()
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.statements = [] if record_statements else None
+
+
+class _EndpointMetrics(object):
+    __slots__ = ('requests_by_status', 'latency_buckets', 'latency_sum', 'sql_count', 'sql_time', 'template_time', 'response_size')
+
+    def __init__(self):
+        self.requests_by_status = defaultdict(int)
+        self.latency_buckets = [0] * len(LATENCY_BUCKETS)
+        self.latency_sum = 0.0
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.response_size = 0
+
+
+def _current_request_metrics():
+    if has_request_context():
+        return getattr(g, 'request_metrics', None)
+    return None
+
+
+class _TimedTemplate(Template):
+    """ Adds the rendering time of the template to the metrics of the current request """
+
+    def render(self, *args, **kwargs):
+        start = time.time()
+        try:
+            return super(_TimedTemplate, self).render(*args, **kwargs)
+        finally:
+            request_metrics = _current_request_metrics()
+            if request_metrics:
+                request_metrics.template_time += time.time() - start
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('metrics_query_start', []).append(time.time())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    duration = time.time() - conn.info['metrics_query_start'].pop()
+    request_metrics = _current_request_metrics()
+    if request_metrics:
+        request_metrics.sql_count += 1
+        request_metrics.sql_time += duration
+        if request_metrics.statements is not None and len(request_metrics.statements) < MAX_RECORDED_STATEMENTS:
+            request_metrics.statements.append((duration, statement))
+
+
+class Metrics(object):
+    """ Collects per endpoint latency, SQL and template statistics of all requests.
+
+    The statistics are kept in memory per process and exposed in the
+    Prometheus text format. Requests slower than SLOW_REQUEST_THRESHOLD
+    seconds are logged together with their SQL statements.
+    """
+
+    def __init__(self, app=None, db=None):
+        self.lock = threading.Lock()
+        self.endpoints = defaultdict(_EndpointMetrics)
+        self.instrumented_engines = set()
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        self.app = app
+        self.db = db
+        app.extensions['metrics'] = self
+        app.jinja_env.template_class = _TimedTemplate
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+
+    def _instrument_engine(self):
+        engine = self.db.engine
+        if id(engine) not in self.instrumented_engines:
+            event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+            self.instrumented_engines.add(id(engine))
+
+    def _before_request(self):
+        if not self.app.config.get('METRICS_ENABLED'):
+            return
+
+        self._instrument_engine()
+        g.request_metrics = RequestMetrics(record_statements=bool(self.app.config.get('SLOW_REQUEST_THRESHOLD')))
+
+    def _after_request(self, response):
+        request_metrics = _current_request_metrics()
+        if not request_metrics:
+            return response
+
+        duration = time.time() - request_metrics.start
+        endpoint = request.endpoint or 'unknown'
+        response_size = response.content_length or 0
+
+        with self.lock:
+            endpoint_metrics = self.endpoints[endpoint]
+            endpoint_metrics.requests_by_status[response.status_code] += 1
+            for idx, upper_bound in enumerate(LATENCY_BUCKETS):
+                if duration <= upper_bound:
+                    endpoint_metrics.latency_buckets[idx] += 1
+                    break
+            endpoint_metrics.latency_sum += duration
+            endpoint_metrics.sql_count += request_metrics.sql_count
+            endpoint_metrics.sql_time += request_metrics.sql_time
+            endpoint_metrics.template_time += request_metrics.template_time
+            endpoint_metrics.response_size += response_size
+
+        slow_request_threshold = self.app.config.get('SLOW_REQUEST_THRESHOLD')
+        if slow_request_threshold and duration > slow_request_threshold:
+            statements = "\n".join("%8.3f s  %s" % (statement_duration, " ".join(statement.split()))
+                                   for statement_duration, statement in request_metrics.statements)
+            self.app.logger.warning("slow request: %s %s took %.3f s (%d SQL statements: %.3f s, templates: %.3f s)\n%s"
+                                    % (request.method, request.path, duration, request_metrics.sql_count,
+                                       request_metrics.sql_time, request_metrics.template_time, statements))
+
+        return response
+
+    def prometheus_text(self):
+        lines = []
+
+        def add_metric(name, metric_type, help, samples):
+            lines.append("# HELP %s %s" % (name, help))
+            lines.append("# TYPE %s %s" % (name, metric_type))
+            for suffix, labels, value in samples:
+                label_text = ",".join('%s="%s"' % (key, str(label_value).replace('\\', '\\\\').replace('"', '\\"')) for key, label_value in labels)
+                lines.append("%s%s{%s} %s" % (name, suffix, label_text, repr(float(value)) if isinstance(value, float) else value))
+
+        with self.lock:
+            endpoints = sorted(self.endpoints.items())
+
+            samples = []
+            for endpoint, metrics in endpoints:
+                for status, count in sorted(metrics.requests_by_status.items()):
+                    samples.append(('', (('endpoint', endpoint), ('status', status)), count))
+            add_metric('openmoves_requests_total', 'counter', 'Number of handled requests', samples)
+
+            samples = []
+            for endpoint, metrics in endpoints:
+                cumulative_count = 0
+                for upper_bound, count in zip(LATENCY_BUCKETS, metrics.latency_buckets):
+                    cumulative_count += count
+                    le = '+Inf' if upper_bound == float('inf') else repr(upper_bound)
+                    samples.append(('_bucket', (('endpoint', endpoint), ('le', le)), cumulative_count))
+                samples.append(('_sum', (('endpoint', endpoint),), metrics.latency_sum))
+                samples.append(('_count', (('endpoint', endpoint),), cumulative_count))
+            add_metric('openmoves_request_duration_seconds', 'histogram', 'Request latency', samples)
+
+            for name, attr, help in (('openmoves_sql_statements_total', 'sql_count', 'Number of executed SQL statements'),
+                                     ('openmoves_sql_duration_seconds_total', 'sql_time', 'Time spent executing SQL statements'),
+                                     ('openmoves_template_duration_seconds_total', 'template_time', 'Time spent rendering templates'),
+                                     ('openmoves_response_size_bytes_total', 'response_size', 'Size of the response bodies')):
+                samples = [('', (('endpoint', endpoint),), getattr(metrics, attr)) for endpoint, metrics in endpoints]
+                add_metric(name, 'counter', help, samples)
+
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
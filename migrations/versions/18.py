@@ -0,0 +1,16 @@
+revision = '18'
+down_revision = '17'
+
+from alembic import op
+
+
+def upgrade():
+    op.create_index('ix_move_user_id_date_time', 'move', ['user_id', 'date_time'])
+    op.create_index('ix_sample_move_id_time', 'sample', ['move_id', 'time'])
+    op.create_index('ix_move_edit_move_id', 'move_edit', ['move_id'])
+
+
+def downgrade():
+    op.drop_index('ix_move_edit_move_id', 'move_edit')
+    op.drop_index('ix_sample_move_id_time', 'sample')
+    op.drop_index('ix_move_user_id_date_time', 'move')
@@ -0,0 +1,29 @@
+revision = '19'
+down_revision = '18'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('best_effort',
+                    sa.Column('id', sa.Integer(), nullable=False),
+                    sa.Column('move_id', sa.Integer(), nullable=False),
+                    sa.Column('user_id', sa.Integer(), nullable=False),
+                    sa.Column('activity', sa.String(), nullable=True),
+                    sa.Column('type', sa.String(), nullable=False),
+                    sa.Column('parameter', sa.Integer(), nullable=False),
+                    sa.Column('value', sa.Float(), nullable=False),
+                    sa.Column('start', sa.Interval(), nullable=False),
+                    sa.ForeignKeyConstraint(['move_id'], ['move.id'], ),
+                    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+                    sa.PrimaryKeyConstraint('id')
+                    )
+    op.create_index('ix_best_effort_user_id_activity_type_parameter_value', 'best_effort', ['user_id', 'activity', 'type', 'parameter', 'value'])
+    op.create_index('ix_best_effort_move_id', 'best_effort', ['move_id'])
+
+
+def downgrade():
+    op.drop_index('ix_best_effort_move_id', 'best_effort')
+    op.drop_index('ix_best_effort_user_id_activity_type_parameter_value', 'best_effort')
+    op.drop_table('best_effort')
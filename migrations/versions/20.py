@@ -0,0 +1,35 @@
+revision = '20'
+down_revision = '19'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('hr_zone',
+                    sa.Column('id', sa.Integer(), nullable=False),
+                    sa.Column('move_id', sa.Integer(), nullable=False),
+                    sa.Column('zone', sa.Integer(), nullable=False),
+                    sa.Column('duration', sa.Float(), nullable=False),
+                    sa.ForeignKeyConstraint(['move_id'], ['move.id'], ),
+                    sa.PrimaryKeyConstraint('id')
+                    )
+    op.create_index('ix_hr_zone_move_id', 'hr_zone', ['move_id'])
+
+    op.create_table('training_load',
+                    sa.Column('id', sa.Integer(), nullable=False),
+                    sa.Column('user_id', sa.Integer(), nullable=False),
+                    sa.Column('date', sa.Date(), nullable=False),
+                    sa.Column('activity', sa.String(), nullable=True),
+                    sa.Column('load', sa.Float(), nullable=False),
+                    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+                    sa.PrimaryKeyConstraint('id')
+                    )
+    op.create_index('ix_training_load_user_id_date_activity', 'training_load', ['user_id', 'date', 'activity'], unique=True)
+
+
+def downgrade():
+    op.drop_index('ix_training_load_user_id_date_activity', 'training_load')
+    op.drop_table('training_load')
+    op.drop_index('ix_hr_zone_move_id', 'hr_zone')
+    op.drop_table('hr_zone')
@@ -0,0 +1,24 @@
+revision = '21'
+down_revision = '20'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('heat_cell',
+                    sa.Column('id', sa.Integer(), nullable=False),
+                    sa.Column('user_id', sa.Integer(), nullable=False),
+                    sa.Column('zoom', sa.Integer(), nullable=False),
+                    sa.Column('x', sa.Integer(), nullable=False),
+                    sa.Column('y', sa.Integer(), nullable=False),
+                    sa.Column('count', sa.Integer(), nullable=False),
+                    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+                    sa.PrimaryKeyConstraint('id')
+                    )
+    op.create_index('ix_heat_cell_user_id_zoom_x_y', 'heat_cell', ['user_id', 'zoom', 'x', 'y'], unique=True)
+
+
+def downgrade():
+    op.drop_index('ix_heat_cell_user_id_zoom_x_y', 'heat_cell')
+    op.drop_table('heat_cell')
@@ -0,0 +1,23 @@
+revision = '22'
+down_revision = '21'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('move', sa.Column('gps_latitude_min', sa.Float(), nullable=True))
+    op.add_column('move', sa.Column('gps_latitude_max', sa.Float(), nullable=True))
+    op.add_column('move', sa.Column('gps_longitude_min', sa.Float(), nullable=True))
+    op.add_column('move', sa.Column('gps_longitude_max', sa.Float(), nullable=True))
+    op.add_column('move', sa.Column('gps_geohash', sa.String(), nullable=True))
+    op.create_index('ix_move_user_id_gps_geohash', 'move', ['user_id', 'gps_geohash'])
+
+
+def downgrade():
+    op.drop_index('ix_move_user_id_gps_geohash', 'move')
+    op.drop_column('move', 'gps_geohash')
+    op.drop_column('move', 'gps_longitude_max')
+    op.drop_column('move', 'gps_longitude_min')
+    op.drop_column('move', 'gps_latitude_max')
+    op.drop_column('move', 'gps_latitude_min')
@@ -0,0 +1,45 @@
+revision = '23'
+down_revision = '22'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('segment',
+                    sa.Column('id', sa.Integer(), nullable=False),
+                    sa.Column('user_id', sa.Integer(), nullable=False),
+                    sa.Column('move_id', sa.Integer(), nullable=True),
+                    sa.Column('name', sa.String(), nullable=False),
+                    sa.Column('distance', sa.Float(), nullable=False),
+                    sa.Column('points', sa.String(), nullable=False),
+                    sa.Column('latitude_min', sa.Float(), nullable=False),
+                    sa.Column('latitude_max', sa.Float(), nullable=False),
+                    sa.Column('longitude_min', sa.Float(), nullable=False),
+                    sa.Column('longitude_max', sa.Float(), nullable=False),
+                    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+                    sa.ForeignKeyConstraint(['move_id'], ['move.id'], ),
+                    sa.PrimaryKeyConstraint('id')
+                    )
+    op.create_index('ix_segment_user_id', 'segment', ['user_id'])
+
+    op.create_table('segment_traversal',
+                    sa.Column('id', sa.Integer(), nullable=False),
+                    sa.Column('segment_id', sa.Integer(), nullable=False),
+                    sa.Column('move_id', sa.Integer(), nullable=False),
+                    sa.Column('start', sa.Interval(), nullable=False),
+                    sa.Column('duration', sa.Float(), nullable=False),
+                    sa.ForeignKeyConstraint(['segment_id'], ['segment.id'], ),
+                    sa.ForeignKeyConstraint(['move_id'], ['move.id'], ),
+                    sa.PrimaryKeyConstraint('id')
+                    )
+    op.create_index('ix_segment_traversal_segment_id_duration', 'segment_traversal', ['segment_id', 'duration'])
+    op.create_index('ix_segment_traversal_move_id', 'segment_traversal', ['move_id'])
+
+
+def downgrade():
+    op.drop_index('ix_segment_traversal_move_id', 'segment_traversal')
+    op.drop_index('ix_segment_traversal_segment_id_duration', 'segment_traversal')
+    op.drop_table('segment_traversal')
+    op.drop_index('ix_segment_user_id', 'segment')
+    op.drop_table('segment')
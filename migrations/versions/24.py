@@ -0,0 +1,16 @@
+revision = '24'
+down_revision = '23'
+
+from alembic import op
+
+FILTER_COLUMNS = ('activity', 'distance', 'duration', 'hr_avg', 'speed_avg', 'ascent')
+
+
+def upgrade():
+    for column in FILTER_COLUMNS:
+        op.create_index('ix_move_user_id_%s' % column, 'move', ['user_id', column])
+
+
+def downgrade():
+    for column in FILTER_COLUMNS:
+        op.drop_index('ix_move_user_id_%s' % column, 'move')
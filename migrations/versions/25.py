@@ -0,0 +1,34 @@
+revision = '25'
+down_revision = '24'
+
+from alembic import op
+
+MOVE_SEARCH_DDL = {
+    'sqlite': (
+        "CREATE VIRTUAL TABLE move_search USING fts5(user_id, document, tokenize = 'unicode61 remove_diacritics 2')",
+        "INSERT INTO move_search (move_search, rank) VALUES ('rank', 'bm25(0.0, 1.0)')",
+    ),
+    'sqlite without fts5': (
+        "CREATE TABLE move_search (user_id INTEGER NOT NULL, document TEXT NOT NULL)",
+        "CREATE INDEX ix_move_search_user_id ON move_search (user_id)",
+    ),
+    'postgresql': (
+        "CREATE TABLE move_search (move_id INTEGER PRIMARY KEY REFERENCES move (id), user_id INTEGER NOT NULL, document TSVECTOR NOT NULL)",
+        "CREATE INDEX ix_move_search_document ON move_search USING GIN (document)",
+        "CREATE INDEX ix_move_search_user_id ON move_search (user_id)",
+    ),
+}
+
+
+def upgrade():
+    # the index is filled by './openmoves.py backfill-search-index'
+    bind = op.get_bind()
+    dialect = bind.dialect.name
+    if dialect == 'sqlite' and not bind.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')").scalar():
+        dialect = 'sqlite without fts5'
+    for statement in MOVE_SEARCH_DDL[dialect]:
+        op.execute(statement)
+
+
+def downgrade():
+    op.execute("DROP TABLE move_search")
@@ -0,0 +1,15 @@
+revision = '26'
+down_revision = '25'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('sample', sa.Column('gps_outlier', sa.Boolean(), nullable=True))
+    op.add_column('move', sa.Column('gps_outlier_count', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('move', 'gps_outlier_count')
+    op.drop_column('sample', 'gps_outlier')
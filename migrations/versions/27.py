@@ -0,0 +1,15 @@
+revision = '27'
+down_revision = '26'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('move', sa.Column('ascent_raw', sa.Integer(), nullable=True))
+    op.add_column('move', sa.Column('descent_raw', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('move', 'descent_raw')
+    op.drop_column('move', 'ascent_raw')
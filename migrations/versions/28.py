@@ -0,0 +1,27 @@
+revision = '28'
+down_revision = '27'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('swim_length',
+                    sa.Column('id', sa.Integer(), nullable=False),
+                    sa.Column('move_id', sa.Integer(), nullable=False),
+                    sa.Column('number', sa.Integer(), nullable=False),
+                    sa.Column('start', sa.Interval(), nullable=False),
+                    sa.Column('duration', sa.Interval(), nullable=False),
+                    sa.Column('strokes', sa.Integer(), nullable=False),
+                    sa.Column('style', sa.String(), nullable=True),
+                    sa.Column('swolf', sa.Integer(), nullable=False),
+                    sa.Column('pace', sa.Interval(), nullable=True),
+                    sa.ForeignKeyConstraint(['move_id'], ['move.id'], ),
+                    sa.PrimaryKeyConstraint('id')
+                    )
+    op.create_index('ix_swim_length_move_id', 'swim_length', ['move_id'])
+
+
+def downgrade():
+    op.drop_index('ix_swim_length_move_id', 'swim_length')
+    op.drop_table('swim_length')
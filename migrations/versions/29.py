@@ -0,0 +1,25 @@
+revision = '29'
+down_revision = '28'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('move', sa.Column('moving_time', sa.Interval(), nullable=True))
+
+    op.create_table('pause',
+                    sa.Column('id', sa.Integer(), nullable=False),
+                    sa.Column('move_id', sa.Integer(), nullable=False),
+                    sa.Column('start', sa.Interval(), nullable=False),
+                    sa.Column('end', sa.Interval(), nullable=False),
+                    sa.ForeignKeyConstraint(['move_id'], ['move.id'], ),
+                    sa.PrimaryKeyConstraint('id')
+                    )
+    op.create_index('ix_pause_move_id', 'pause', ['move_id'])
+
+
+def downgrade():
+    op.drop_index('ix_pause_move_id', 'pause')
+    op.drop_table('pause')
+    op.drop_column('move', 'moving_time')
@@ -0,0 +1,13 @@
+revision = '30'
+down_revision = '29'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('move', sa.Column('derived_date_time', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('move', 'derived_date_time')
@@ -3,24 +3,82 @@
 
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.types import TypeDecorator
+from sqlalchemy import event, DDL
+from sqlalchemy.sql import func
 import json
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+try:
+    # optional, considerably faster than the standard library. only used for decoding,
+    # the stored encoding and its float precision must not depend on the installed packages
+    import ujson as json_codec
+except ImportError:
+    json_codec = json
 
 db = SQLAlchemy()
 
 
+class LazyJsonDict(Mapping):
+    """ Read-only dict of a JSON column value which is decoded on first access """
+    __slots__ = ('raw', '_value')
+
+    def __init__(self, raw):
+        self.raw = raw
+        self._value = None
+
+    @property
+    def value(self):
+        if self._value is None:
+            self._value = json_codec.loads(self.raw)
+        return self._value
+
+    @property
+    def decoded(self):
+        return self._value is not None
+
+    def __getitem__(self, key):
+        return self.value[key]
+
+    def __iter__(self):
+        return iter(self.value)
+
+    def __len__(self):
+        return len(self.value)
+
+    def __contains__(self, key):
+        return key in self.value
+
+    def __repr__(self):
+        return repr(self.value)
+
+
 class JsonEncodedDict(TypeDecorator):
     impl = db.String
 
+    def __init__(self, *args, **kwargs):
+        # compact: store the canonical encoding without whitespace and with sorted keys
+        self.compact = kwargs.pop('compact', False)
+        super(JsonEncodedDict, self).__init__(*args, **kwargs)
+
     def process_bind_param(self, value, dialect):
+        if isinstance(value, LazyJsonDict):
+            if not value.decoded:
+                return value.raw
+            value = value.value
+
         if value:
             assert isinstance(value, dict)
+            if self.compact:
+                return json.dumps(value, separators=(',', ':'), sort_keys=True)
             return json.dumps(value)
         else:
             return value
 
     def process_result_value(self, value, dialect):
         if value and not isinstance(value, dict):
-            return json.loads(value)
+            return LazyJsonDict(value)
         else:
             return value
 
@@ -54,6 +112,15 @@ class User(db.Model):
 
 class Move(db.Model):
     __tablename__ = 'move'
+    __table_args__ = (db.Index('ix_move_user_id_date_time', 'user_id', 'date_time'),
+                      db.Index('ix_move_user_id_gps_geohash', 'user_id', 'gps_geohash'),
+                      # the fields of the moves filter
+                      db.Index('ix_move_user_id_activity', 'user_id', 'activity'),
+                      db.Index('ix_move_user_id_distance', 'user_id', 'distance'),
+                      db.Index('ix_move_user_id_duration', 'user_id', 'duration'),
+                      db.Index('ix_move_user_id_hr_avg', 'user_id', 'hr_avg'),
+                      db.Index('ix_move_user_id_speed_avg', 'user_id', 'speed_avg'),
+                      db.Index('ix_move_user_id_ascent', 'user_id', 'ascent'))
     id = db.Column(db.Integer, name="id", primary_key=True)
 
     user_id = db.Column(db.Integer, db.ForeignKey(User.id), name="user_id", nullable=False)
@@ -64,6 +131,8 @@ class Move(db.Model):
 
     date_time = db.Column(db.DateTime, name="date_time", nullable=False)
     duration = db.Column(db.Interval, name="duration")
+    # time from the first to the last sample without the pauses, None if not calculated yet
+    moving_time = db.Column(db.Interval, name="moving_time", nullable=True)
     distance = db.Column(db.Integer, name="distance")
     activity = db.Column(db.String, name="activity")
     activity_type = db.Column(db.Integer, name="activity_type")
@@ -74,6 +143,9 @@ class Move(db.Model):
     descent = db.Column(db.Integer, name="descent", nullable=True)
     ascent_time = db.Column(db.Interval, name="ascent_time")
     descent_time = db.Column(db.Interval, name="descent_time")
+    # sums of all altitude differences of moves whose ascent and descent are calculated from the smoothed altitude, eg. GPX imports
+    ascent_raw = db.Column(db.Integer, name="ascent_raw", nullable=True)
+    descent_raw = db.Column(db.Integer, name="descent_raw", nullable=True)
 
     recovery_time = db.Column(db.Interval, name="recovery_time")
 
@@ -122,6 +194,8 @@ class Move(db.Model):
 
     source = db.Column(db.String, name="source")
     import_date_time = db.Column(db.DateTime, name="import_date_time", nullable=False)
+    # last recalculation of data derived from the samples after the import, eg. by a backfill command
+    derived_date_time = db.Column(db.DateTime, name="derived_date_time", nullable=True)
     import_module = db.Column(db.String, name="import_module", nullable=False)
 
     location_address = db.Column('location_address', db.String, nullable=True)
@@ -129,10 +203,23 @@ class Move(db.Model):
     gps_center_max_distance = db.Column('gps_center_max_distance', db.Float, nullable=True)
     gps_center_latitude = db.Column('gps_center_latitude', db.Float, nullable=True)
     gps_center_longitude = db.Column('gps_center_longitude', db.Float, nullable=True)
+    # bounding box of the GPS samples in radians and the geohash of the smallest cell containing it
+    gps_latitude_min = db.Column('gps_latitude_min', db.Float, nullable=True)
+    gps_latitude_max = db.Column('gps_latitude_max', db.Float, nullable=True)
+    gps_longitude_min = db.Column('gps_longitude_min', db.Float, nullable=True)
+    gps_longitude_max = db.Column('gps_longitude_max', db.Float, nullable=True)
+    gps_geohash = db.Column('gps_geohash', db.String, nullable=True)
+    # number of GPS samples flagged as outliers, None if the move was not checked yet
+    gps_outlier_count = db.Column('gps_outlier_count', db.Integer, nullable=True)
+
+    def last_modified(self):
+        last_edit, = db.session.query(func.max(MoveEdit.date_time)).filter(MoveEdit.move_id == self.id).one()
+        return max(date_time for date_time in (self.import_date_time, self.derived_date_time, last_edit) if date_time)
 
 
 class Sample(db.Model):
     __tablename__ = 'sample'
+    __table_args__ = (db.Index('ix_sample_move_id_time', 'move_id', 'time'),)
     id = db.Column(db.Integer, name="id", primary_key=True)
 
     move_id = db.Column(db.Integer, db.ForeignKey(Move.id), name="move_id", nullable=False)
@@ -166,6 +253,8 @@ class Sample(db.Model):
     altitude = db.Column(db.Integer, name='altitude')
 
     ehpe = db.Column(db.Float, name='ehpe')  # Expected Horizontal Position Error
+    # True for implausible positions which are ignored by the aggregates of the GPS track, otherwise None
+    gps_outlier = db.Column(db.Boolean, name='gps_outlier')
 
     cadence = db.Column(db.Float, name='cadence')
 
@@ -173,13 +262,15 @@ class Sample(db.Model):
     nav_valid = db.Column(db.String, name='nav_valid')
     nav_type_explanation = db.Column(db.String, name='nav_type_explanation')
 
-    events = db.Column(JsonEncodedDict(4096), name='events')
-    satellites = db.Column(JsonEncodedDict(4096), name='satellites')
-    apps_data = db.Column(JsonEncodedDict(4096), name='apps_data')
+    # deferred: only loaded on access, most samples are read without these
+    events = db.deferred(db.Column(JsonEncodedDict(4096, compact=True), name='events'))
+    satellites = db.deferred(db.Column(JsonEncodedDict(4096, compact=True), name='satellites'))
+    apps_data = db.deferred(db.Column(JsonEncodedDict(4096, compact=True), name='apps_data'))
 
 
 class MoveEdit(db.Model):
     __tablename__ = 'move_edit'
+    __table_args__ = (db.Index('ix_move_edit_move_id', 'move_id'),)
     id = db.Column(db.Integer, name="id", primary_key=True)
 
     date_time = db.Column(db.DateTime, name="date_time", nullable=False)
@@ -191,6 +282,187 @@ class MoveEdit(db.Model):
     new_value = db.Column(JsonEncodedDict(4096), name='new_value')
 
 
+class BestEffort(db.Model):
+    __tablename__ = 'best_effort'
+    __table_args__ = (db.Index('ix_best_effort_user_id_activity_type_parameter_value', 'user_id', 'activity', 'type', 'parameter', 'value'),
+                      db.Index('ix_best_effort_move_id', 'move_id'))
+    id = db.Column(db.Integer, name="id", primary_key=True)
+
+    move_id = db.Column(db.Integer, db.ForeignKey(Move.id), name="move_id", nullable=False)
+    move = db.relationship(Move, backref=db.backref('best_efforts', lazy='dynamic'))
+
+    # denormalized from the move, so that personal records are looked up by index only
+    user_id = db.Column(db.Integer, db.ForeignKey(User.id), name="user_id", nullable=False)
+    activity = db.Column(db.String, name="activity")
+
+    # 'distance': fastest time in seconds over parameter meters
+    # 'hr', 'speed': best average heart rate (Hz) or speed (m/s) over parameter seconds
+    type = db.Column(db.String, name="type", nullable=False)
+    parameter = db.Column(db.Integer, name="parameter", nullable=False)
+    value = db.Column(db.Float, name="value", nullable=False)
+    start = db.Column(db.Interval, name="start", nullable=False)
+
+
+class HrZone(db.Model):
+    __tablename__ = 'hr_zone'
+    __table_args__ = (db.Index('ix_hr_zone_move_id', 'move_id'),)
+    id = db.Column(db.Integer, name="id", primary_key=True)
+
+    move_id = db.Column(db.Integer, db.ForeignKey(Move.id), name="move_id", nullable=False)
+    move = db.relationship(Move, backref=db.backref('hr_zones', lazy='dynamic'))
+
+    # 0: below zone 1
+    zone = db.Column(db.Integer, name="zone", nullable=False)
+    duration = db.Column(db.Float, name="duration", nullable=False)
+
+
+class Pause(db.Model):
+    """ Pause of a move between the pause events starting and ending it """
+    __tablename__ = 'pause'
+    __table_args__ = (db.Index('ix_pause_move_id', 'move_id'),)
+    id = db.Column(db.Integer, name="id", primary_key=True)
+
+    move_id = db.Column(db.Integer, db.ForeignKey(Move.id), name="move_id", nullable=False)
+    move = db.relationship(Move, backref=db.backref('pauses', lazy='dynamic'))
+
+    start = db.Column(db.Interval, name="start", nullable=False)
+    end = db.Column(db.Interval, name="end", nullable=False)
+
+
+class SwimLength(db.Model):
+    """ Pool length of a swimming move between two turns """
+    __tablename__ = 'swim_length'
+    __table_args__ = (db.Index('ix_swim_length_move_id', 'move_id'),)
+    id = db.Column(db.Integer, name="id", primary_key=True)
+
+    move_id = db.Column(db.Integer, db.ForeignKey(Move.id), name="move_id", nullable=False)
+    move = db.relationship(Move, backref=db.backref('swim_lengths', lazy='dynamic'))
+
+    # total number of lengths counted by the device at the turn ending the length
+    number = db.Column(db.Integer, name="number", nullable=False)
+    start = db.Column(db.Interval, name="start", nullable=False)
+    duration = db.Column(db.Interval, name="duration", nullable=False)
+    strokes = db.Column(db.Integer, name="strokes", nullable=False)
+    style = db.Column(db.String, name="style")
+    # seconds plus strokes of the length
+    swolf = db.Column(db.Integer, name="swolf", nullable=False)
+    # per meter, like the swim pace of the move
+    pace = db.Column(db.Interval, name="pace")
+
+
+class TrainingLoad(db.Model):
+    """ Sum of the training load of the moves of a user per day and activity """
+    __tablename__ = 'training_load'
+    __table_args__ = (db.Index('ix_training_load_user_id_date_activity', 'user_id', 'date', 'activity', unique=True),)
+    id = db.Column(db.Integer, name="id", primary_key=True)
+
+    user_id = db.Column(db.Integer, db.ForeignKey(User.id), name="user_id", nullable=False)
+    date = db.Column(db.Date, name="date", nullable=False)
+    activity = db.Column(db.String, name="activity")
+    load = db.Column(db.Float, name="load", nullable=False)
+
+
+class HeatCell(db.Model):
+    """ Number of moves of a user passing through a grid cell, the web mercator tile x, y at a zoom level """
+    __tablename__ = 'heat_cell'
+    __table_args__ = (db.Index('ix_heat_cell_user_id_zoom_x_y', 'user_id', 'zoom', 'x', 'y', unique=True),)
+    id = db.Column(db.Integer, name="id", primary_key=True)
+
+    user_id = db.Column(db.Integer, db.ForeignKey(User.id), name="user_id", nullable=False)
+    zoom = db.Column(db.Integer, name="zoom", nullable=False)
+    x = db.Column(db.Integer, name="x", nullable=False)
+    y = db.Column(db.Integer, name="y", nullable=False)
+    count = db.Column(db.Integer, name="count", nullable=False)
+
+
+class Segment(db.Model):
+    """ Part of a track defined by an user, traversals are searched in all moves of the user """
+    __tablename__ = 'segment'
+    __table_args__ = (db.Index('ix_segment_user_id', 'user_id'),)
+    id = db.Column(db.Integer, name="id", primary_key=True)
+
+    user_id = db.Column(db.Integer, db.ForeignKey(User.id), name="user_id", nullable=False)
+    user = db.relationship(User)
+
+    # the move the segment was defined on, None after the move was deleted
+    move_id = db.Column(db.Integer, db.ForeignKey(Move.id), name="move_id", nullable=True)
+    move = db.relationship(Move)
+
+    name = db.Column(db.String, name="name", nullable=False)
+    distance = db.Column(db.Float, name="distance", nullable=False)
+
+    # simplified track {'latitude': [...], 'longitude': [...]} and its bounding box, in radians
+    points = db.Column(JsonEncodedDict(compact=True), name="points", nullable=False)
+    latitude_min = db.Column(db.Float, name="latitude_min", nullable=False)
+    latitude_max = db.Column(db.Float, name="latitude_max", nullable=False)
+    longitude_min = db.Column(db.Float, name="longitude_min", nullable=False)
+    longitude_max = db.Column(db.Float, name="longitude_max", nullable=False)
+
+
+class SegmentTraversal(db.Model):
+    __tablename__ = 'segment_traversal'
+    __table_args__ = (db.Index('ix_segment_traversal_segment_id_duration', 'segment_id', 'duration'),
+                      db.Index('ix_segment_traversal_move_id', 'move_id'))
+    id = db.Column(db.Integer, name="id", primary_key=True)
+
+    segment_id = db.Column(db.Integer, db.ForeignKey(Segment.id), name="segment_id", nullable=False)
+    segment = db.relationship(Segment, backref=db.backref('traversals', lazy='dynamic'))
+
+    move_id = db.Column(db.Integer, db.ForeignKey(Move.id), name="move_id", nullable=False)
+    move = db.relationship(Move, backref=db.backref('segment_traversals', lazy='dynamic'))
+
+    # offset of the traversal in the move and its duration in seconds
+    start = db.Column(db.Interval, name="start", nullable=False)
+    duration = db.Column(db.Float, name="duration", nullable=False)
+
+
+# whether the SQLite library supports FTS5, None until checked
+_sqlite_fts5 = None
+
+
+def sqlite_has_fts5(connection):
+    """ Returns whether the SQLite library of a connection was compiled with FTS5, which was added in SQLite 3.9 """
+    global _sqlite_fts5
+    if _sqlite_fts5 is None:
+        # a SELECT, other statements would commit the transaction with the sqlite3 module of Python 2
+        _sqlite_fts5 = bool(connection.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')").scalar())
+    return _sqlite_fts5
+
+
+# full-text search index of the moves maintained by search.py, a FTS5 table on SQLite and a tsvector with GIN index on PostgreSQL.
+# without FTS5 a plain table is searched by prefix with LIKE
+MOVE_SEARCH_DDL = {
+    'sqlite': (
+        "CREATE VIRTUAL TABLE move_search USING fts5(user_id, document, tokenize = 'unicode61 remove_diacritics 2')",
+        # rank by the document only, the user_id column merely restricts the matches
+        "INSERT INTO move_search (move_search, rank) VALUES ('rank', 'bm25(0.0, 1.0)')",
+    ),
+    'sqlite without fts5': (
+        "CREATE TABLE move_search (user_id INTEGER NOT NULL, document TEXT NOT NULL)",
+        "CREATE INDEX ix_move_search_user_id ON move_search (user_id)",
+    ),
+    'postgresql': (
+        "CREATE TABLE move_search (move_id INTEGER PRIMARY KEY REFERENCES move (id), user_id INTEGER NOT NULL, document TSVECTOR NOT NULL)",
+        "CREATE INDEX ix_move_search_document ON move_search USING GIN (document)",
+        "CREATE INDEX ix_move_search_user_id ON move_search (user_id)",
+    ),
+}
+
+
+def _if_fts5(fts5):
+    return lambda ddl, target, bind, **kw: sqlite_has_fts5(bind) == fts5
+
+
+for statement in MOVE_SEARCH_DDL['sqlite']:
+    event.listen(Move.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite', callable_=_if_fts5(True)))
+for statement in MOVE_SEARCH_DDL['sqlite without fts5']:
+    event.listen(Move.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite', callable_=_if_fts5(False)))
+for statement in MOVE_SEARCH_DDL['postgresql']:
+    event.listen(Move.__table__, 'after_create', DDL(statement).execute_if(dialect='postgresql'))
+for dialect in ('sqlite', 'postgresql'):
+    event.listen(Move.__table__, 'before_drop', DDL("DROP TABLE IF EXISTS move_search").execute_if(dialect=dialect))
+
+
 class AlembicVersion(db.Model):
     __tablename__ = 'alembic_version'
     version_num = db.Column(db.String, name="version_num", primary_key=True)
@@ -0,0 +1,262 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+
+from model import db, Move
+from spatial import near_criterion, bounds_criterion, parse_distance
+from sqlalchemy.sql import and_, or_
+from sqlalchemy import distinct
+from datetime import datetime, timedelta
+import re
+
+TOKEN_PATTERN = re.compile(r'\s*(\(|\)|(?:[^\s()"]|"[^"]*")+)')
+TERM_PATTERN = re.compile(r'^(\w+)(>=|<=|:|=|>|<)(.*)$')
+
+COMPARISONS = {
+    '>': lambda column, value: column > value,
+    '>=': lambda column, value: column >= value,
+    '<': lambda column, value: column < value,
+    '<=': lambda column, value: column <= value,
+    '=': lambda column, value: column == value,
+}
+
+
+class FilterError(ValueError):
+    pass
+
+
+def parse_duration(value):
+    """ Parses a duration like '1:30:00', '45:00', '1.5h', '90min' or '30s' into a timedelta, plain numbers are minutes """
+    value = value.strip().lower()
+    if ':' in value:
+        seconds = 0.0
+        for part in value.split(':'):
+            seconds = seconds * 60 + float(part)
+        return timedelta(seconds=seconds)
+    for unit, factor in (('min', 60), ('h', 3600), ('s', 1)):
+        if value.endswith(unit):
+            return timedelta(seconds=float(value[:-len(unit)]) * factor)
+    return timedelta(minutes=float(value))
+
+
+def _parse_unit(value, unit, factor):
+    value = value.strip().lower()
+    if value.endswith(unit):
+        value = value[:-len(unit)]
+    return float(value) * factor
+
+
+# field: (column, parser of the value into the unit of the column)
+NUMERIC_FIELDS = {
+    'distance': (Move.distance, parse_distance),
+    'duration': (Move.duration, parse_duration),
+    'hr_avg': (Move.hr_avg, lambda value: _parse_unit(value, 'bpm', 1 / 60.0)),
+    'speed_avg': (Move.speed_avg, lambda value: _parse_unit(value, 'km/h', 1 / 3.6)),
+    'ascent': (Move.ascent, parse_distance),
+}
+
+FIELDS = sorted(list(NUMERIC_FIELDS.keys()) + ['activity', 'date', 'location', 'near', 'bbox'])
+
+
+def parse_period(value):
+    """ Parses a year, month or day like '2015', '2015-06' or '2015-06-25' into its start and end datetime """
+    value = value.strip()
+    for date_format, increment in (('%Y-%m-%d', lambda start: start + timedelta(days=1)),
+                                   ('%Y-%m', lambda start: datetime(start.year + start.month // 12, start.month % 12 + 1, 1)),
+                                   ('%Y', lambda start: datetime(start.year + 1, 1, 1))):
+        try:
+            start = datetime.strptime(value, date_format)
+        except ValueError:
+            continue
+        return start, increment(start)
+    raise FilterError("illegal date: '%s'" % value)
+
+
+def _range(value):
+    if '..' not in value:
+        return None
+    lower, upper = value.split('..', 1)
+    return lower.strip() or None, upper.strip() or None
+
+
+def _numeric_criterion(field, operator, value):
+    column, parse = NUMERIC_FIELDS[field]
+    if operator in COMPARISONS:
+        return COMPARISONS[operator](column, parse(value))
+
+    value_range = _range(value)
+    if not value_range:
+        raise FilterError("use a comparison or range for '%s', eg. '%s>10' or '%s:10..20'" % (field, field, field))
+    lower, upper = value_range
+    criteria = []
+    if lower:
+        criteria.append(column >= parse(lower))
+    if upper:
+        criteria.append(column <= parse(upper))
+    return and_(*criteria)
+
+
+def _date_criterion(operator, value):
+    value_range = _range(value) if operator == ':' else None
+    if value_range:
+        lower, upper = value_range
+        criteria = []
+        if lower:
+            criteria.append(Move.date_time >= parse_period(lower)[0])
+        if upper:
+            criteria.append(Move.date_time < parse_period(upper)[1])
+        return and_(*criteria)
+
+    start, end = parse_period(value)
+    if operator in (':', '='):
+        return and_(Move.date_time >= start, Move.date_time < end)
+    elif operator == '>':
+        return Move.date_time >= end
+    elif operator == '>=':
+        return Move.date_time >= start
+    elif operator == '<':
+        return Move.date_time < start
+    else:
+        return Move.date_time < end
+
+
+def _like_escape(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+class _Parser(object):
+
+    def __init__(self, filter_query, user_id):
+        self.tokens = self._tokenize(filter_query)
+        self.position = 0
+        self.user_id = user_id
+        self.fields = set()
+
+    @staticmethod
+    def _tokenize(filter_query):
+        tokens = []
+        position = 0
+        filter_query = filter_query.rstrip()
+        while position < len(filter_query):
+            match = TOKEN_PATTERN.match(filter_query, position)
+            if not match:
+                raise FilterError("unbalanced quotes")
+            tokens.append(match.group(1))
+            position = match.end()
+        return tokens
+
+    def _peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def _next(self):
+        token = self._peek()
+        self.position += 1
+        return token
+
+    @staticmethod
+    def _is_keyword(token, keyword):
+        return token is not None and token.upper() == keyword
+
+    def parse(self):
+        if not self.tokens:
+            raise FilterError("empty filter")
+        criterion = self._or()
+        if self._peek() is not None:
+            raise FilterError("unexpected '%s'" % self._peek())
+        return criterion
+
+    def _or(self):
+        criteria = [self._and()]
+        while self._is_keyword(self._peek(), 'OR'):
+            self._next()
+            criteria.append(self._and())
+        return criteria[0] if len(criteria) == 1 else or_(*criteria)
+
+    def _and(self):
+        criteria = [self._primary()]
+        while self._peek() not in (None, ')') and not self._is_keyword(self._peek(), 'OR'):
+            if self._is_keyword(self._peek(), 'AND'):
+                self._next()
+            criteria.append(self._primary())
+        return criteria[0] if len(criteria) == 1 else and_(*criteria)
+
+    def _primary(self):
+        token = self._next()
+        if token is None:
+            raise FilterError("missing term")
+        if token == '(':
+            criterion = self._or()
+            if self._next() != ')':
+                raise FilterError("missing ')'")
+            return criterion
+        if token == ')' or self._is_keyword(token, 'AND') or self._is_keyword(token, 'OR'):
+            raise FilterError("unexpected '%s'" % token)
+
+        match = TERM_PATTERN.match(token)
+        if not match:
+            raise FilterError("missing field in '%s', supported fields are %s" % (token, ", ".join(FIELDS)))
+        field, operator, value = match.groups()
+
+        # following words without field continue the value
+        words = [value]
+        while self._peek() not in (None, '(', ')') and not TERM_PATTERN.match(self._peek()) \
+                and not self._is_keyword(self._peek(), 'AND') and not self._is_keyword(self._peek(), 'OR'):
+            words.append(self._next())
+        value = ' '.join(words).replace('"', '').strip()
+        if not value:
+            raise FilterError("missing value of '%s'" % field)
+
+        self.fields.add(field)
+        try:
+            return self._criterion(field, operator, value)
+        except FilterError:
+            raise
+        except ValueError as e:
+            raise FilterError("illegal value of '%s': %s" % (field, e))
+
+    def _criterion(self, field, operator, value):
+        if field in NUMERIC_FIELDS:
+            return _numeric_criterion(field, operator, value)
+        elif field == 'date':
+            return _date_criterion(operator, value)
+        elif operator not in (':', '='):
+            raise FilterError("'%s' only supports '%s:<value>'" % (field, field))
+        elif field == 'activity':
+            return Move.activity.in_(self._activities(value))
+        elif field == 'location':
+            return Move.location_address.ilike('%%%s%%' % _like_escape(value), escape='\\')
+        elif field == 'near':
+            latitude, longitude, radius = value.split(',')
+            return near_criterion(self.user_id, float(latitude), float(longitude), parse_distance(radius))
+        elif field == 'bbox':
+            west, south, east, north = [float(part) for part in value.split(',')]
+            return bounds_criterion(self.user_id, south, west, north, east)
+        else:
+            raise FilterError("unknown field '%s', supported fields are %s" % (field, ", ".join(FIELDS)))
+
+    def _activities(self, value):
+        """ Activity names are matched case-insensitively against the activities of the user """
+        activities = db.session.query(distinct(Move.activity)).filter(Move.user_id == self.user_id)
+        matching = [activity for activity, in activities if activity and activity.lower() == value.lower()]
+        return matching or [value]
+
+
+class MoveFilter(object):
+    """ Parsed filter with the SQLAlchemy criterion on Move and the fields it refers to """
+
+    def __init__(self, criterion, fields):
+        self.criterion = criterion
+        self.fields = fields
+
+
+def parse(filter_query, user_id):
+    """ Parses a filter like 'activity:running distance>10km hr_avg<150 date:2015-06 location:Zurich' into a MoveFilter.
+
+    Terms are combined with AND unless joined by OR, AND binds stronger and
+    parentheses group terms. Words without field continue the value of the
+    previous term, eg. 'activity:Pool swimming'. Numeric fields and date
+    support comparisons and ranges like 'distance:5km..10km'. The location
+    filters only select moves of the user with user_id. Raises FilterError
+    for illegal filters.
+    """
+    parser = _Parser(filter_query, user_id)
+    return MoveFilter(parser.parse(), parser.fields)
@@ -6,6 +6,8 @@ from model import db
 from model import Move, Device
 from lxml import objectify
 import re
+from import_profiler import import_phase
+import gps_filter
 from _import import add_children, normalize_move, parse_samples, postprocess_move
 
 
@@ -33,8 +35,9 @@ def old_xml_import(xmlfile, user, request_form):
 
         serial_number = filematch.group(1)
 
-        tree = objectify.fromstring("\n".join(data).encode('utf-8'))
-        move = parse_move(tree)
+        with import_phase('parse header'):
+            tree = objectify.fromstring("\n".join(data).encode('utf-8'))
+            move = parse_move(tree)
         move.source = filename
         move.import_module = __name__
 
@@ -51,8 +54,16 @@ def old_xml_import(xmlfile, user, request_form):
             move.device = device
             db.session.add(move)
 
-            for sample in parse_samples(tree.Samples.iterchildren(), move):
-                db.session.add(sample)
+            with import_phase('parse samples'):
+                samples = list(parse_samples(tree.Samples.iterchildren(), move))
+            with import_phase('filter'):
+                move.gps_outlier_count = gps_filter.flag_samples(samples, move.activity)
+            with import_phase('parse samples'):
+                for sample in samples:
+                    db.session.add(sample)
+            with import_phase('persist'):
+                db.session.flush()
             postprocess_move(move)
-            db.session.commit()
+            with import_phase('persist'):
+                db.session.commit()
             return move
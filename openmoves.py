@@ -1,27 +1,44 @@
 #!/usr/bin/env python
 # vim: set fileencoding=utf-8 :
 
-from flask import Flask, render_template, flash, redirect, request, url_for, session, Response, json
+from flask import Flask, render_template, flash, redirect, request, url_for, session, Response, json, stream_with_context, send_file, abort
 from flask_bootstrap import Bootstrap
 from flask_login import login_user, current_user, login_required, logout_user
-from model import db, Move, Sample, MoveEdit, AlembicVersion
+from model import db, Move, Sample, MoveEdit, BestEffort, HrZone, SwimLength, Pause, Segment, SegmentTraversal, AlembicVersion
 from datetime import timedelta, datetime
 from sqlalchemy.sql import func
-from sqlalchemy import distinct, literal
+from sqlalchemy import distinct, literal, type_coerce
+from sqlalchemy.orm import joinedload
 import os
 import re
+import time
+import hashlib
 from flask_bcrypt import Bcrypt
 import imports
-import gpx_export
-import csv_export
+import exports
+import sample_reader
+import best_efforts
+import splits
+import resample
+import compare
+import training_load
+import heatmap
+import spatial
+import move_filter
+import segments
+import search
+from pauses import move_pauses
+from export_cache import export_cache
+from metrics import metrics
+from request_profiler import request_profiler, is_admin
 import dateutil.parser
 from flask.helpers import make_response
+from werkzeug.security import safe_str_cmp
 from flask_script import Manager, Server
 from flask_migrate import Migrate, MigrateCommand
-from commands import AddUser, ImportMove, DeleteMove, ListMoves
-from filters import register_filters, register_globals, radian_to_degree, get_city
+from commands import AddUser, ImportMove, DeleteMove, ListMoves, ExportMoves, ProfileImport, BackfillBestEfforts, BackfillHrZones, BackfillGpsBounds, BackfillSearchIndex, BackfillGpsOutliers, BackfillGpxAscent, BackfillSwimLengths, BackfillMovingTime, RebuildHeatmap
+from filters import register_filters, register_globals, radian_to_degree
 from login import login_manager, load_user, LoginForm
-import itertools
 from collections import OrderedDict
 from flask_util_js import FlaskUtilJs
 from _import import postprocess_move
@@ -95,6 +112,13 @@ def _get_date_range():
     return start_date, end_date
 
 
+def _distance_over_time(samples, pauses):
+    """ Returns the (time, distance) of the samples with distance and a gap (time, None) at the begin of each pause """
+    distance_over_time = [(sample.time, sample.distance) for sample in samples if sample.time and sample.distance]
+    distance_over_time.extend((begin, None) for begin, end in pauses if begin)
+    return sorted(distance_over_time, key=lambda point: point[0])
+
+
 def calculate_distances(model, samples):
     total_distance_horizontal = 0.0
     total_distance_real = 0.0
@@ -108,7 +132,7 @@ def calculate_distances(model, samples):
     for sample in samples:
         if sample.altitude:
             current_altitude_sample = sample
-        if sample.latitude:
+        if sample.latitude and not sample.gps_outlier:
             if previous_gps_sample:
                 distance_horizontal = vincenty(_sample_to_point(previous_gps_sample), _sample_to_point(sample)).meters
                 if previous_altitude_sample:
@@ -153,6 +177,11 @@ def init(configfile):
         SESSION_VERSION = 1
         app.config['SECRET_KEY'] = "%s-%d" % (app.config['SECRET_KEY'], SESSION_VERSION)
 
+    # relative directories are relative to the application, not to the working directory of the server
+    for key in ('EXPORT_CACHE_DIR', 'PROFILE_DIR', 'DEM_DIR'):
+        if app.config.get(key):
+            app.config[key] = os.path.join(app.root_path, app.config[key])
+
     db.init_app(app)
 
     with app.app_context():
@@ -165,6 +194,9 @@ def init(configfile):
     login_manager.init_app(app)
     login_manager.login_view = "login"
 
+    metrics.init_app(app, db)
+    request_profiler.init_app(app)
+
     return app
 
 
@@ -186,6 +218,12 @@ def command_app_context():
     return app.app_context()
 
 
+def command_request_context():
+    # the import and export functions flash messages which requires a request context
+    app.config.update(SQLALCHEMY_ECHO=False)
+    return app.test_request_context()
+
+
 manager = Manager(init)
 
 manager.add_option('-c', '--config', dest='configfile', default='openmoves.cfg', required=False)
@@ -196,6 +234,17 @@ manager.add_command('add-user', AddUser(command_app_context, app_bcrypt))
 manager.add_command('import-move', ImportMove(command_app_context))
 manager.add_command('delete-move', DeleteMove(command_app_context))
 manager.add_command('list-moves', ListMoves(command_app_context))
+manager.add_command('export-moves', ExportMoves(command_request_context))
+manager.add_command('profile-import', ProfileImport(command_request_context))
+manager.add_command('backfill-best-efforts', BackfillBestEfforts(command_app_context))
+manager.add_command('backfill-hr-zones', BackfillHrZones(command_app_context))
+manager.add_command('backfill-gps-bounds', BackfillGpsBounds(command_app_context))
+manager.add_command('backfill-search-index', BackfillSearchIndex(command_app_context))
+manager.add_command('backfill-gps-outliers', BackfillGpsOutliers(command_app_context))
+manager.add_command('backfill-gpx-ascent', BackfillGpxAscent(command_app_context))
+manager.add_command('backfill-swim-lengths', BackfillSwimLengths(command_app_context))
+manager.add_command('backfill-moving-time', BackfillMovingTime(command_app_context))
+manager.add_command('rebuild-heatmap', RebuildHeatmap(command_app_context))
 
 
 @app.errorhandler(404)
@@ -345,27 +394,74 @@ def dashboard():
     model['total_ascent'] = sum(total_ascent_by_activity.values())
     model['total_descent'] = sum(total_descent_by_activity.values())
 
+    model['training_load'] = training_load.training_load_series(current_user, start_date, end_date)
+
     return render_template('dashboard.html', **model)
 
 
 def _parse_move_filter(filter_query):
+    """ Parses the filter of the moves list, see move_filter.parse """
     if not filter_query:
         return None
 
-    filter_parts = [part.strip() for part in filter_query.split(':')]
-    if len(filter_parts) != 2 or filter_parts[0] not in ('activity'):
-        flash("illegal filter: '%s'" % filter_query, 'error')
+    try:
+        return move_filter.parse(filter_query, current_user.id)
+    except move_filter.FilterError as e:
+        flash("illegal filter: '%s': %s" % (filter_query, e), 'error')
         return None
-    else:
-        filter_attr = filter_parts[0]
-        filter_value = filter_parts[1]
-        return {filter_attr: filter_value}
 
 
 def _current_user_filtered(query):
     return query.filter_by(user=current_user)
 
 
+def _templates_version():
+    # changes whenever templates are deployed, so cached pages are revalidated against new markup
+    if not hasattr(app, 'templates_version'):
+        template_folder = os.path.join(app.root_path, app.template_folder)
+        mtimes = [os.path.getmtime(os.path.join(path, filename)) for path, _, filenames in os.walk(template_folder) for filename in filenames]
+        app.templates_version = max(mtimes) if mtimes else 0
+    return app.templates_version
+
+
+def _etag(*values):
+    return hashlib.sha1(':'.join(str(value) for value in values).encode('utf-8')).hexdigest()
+
+
+def _to_utc(local_date_time):
+    return datetime.utcfromtimestamp(time.mktime(local_date_time.timetuple()))
+
+
+def _not_modified(etag, last_modified):
+    """ Returns a '304 Not Modified' response if the client already has the current version """
+    if '_flashes' in session:
+        # pending messages have to be rendered
+        return None
+
+    # If-None-Match takes precedence over If-Modified-Since (RFC 7232, section 6)
+    if 'If-None-Match' in request.headers:
+        if not request.if_none_match.contains(etag):
+            return None
+    elif request.if_modified_since and last_modified:
+        if last_modified.replace(microsecond=0) > request.if_modified_since:
+            return None
+    else:
+        return None
+
+    return _add_validators(Response(status=304), etag, last_modified)
+
+
+def _add_validators(response, etag, last_modified):
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    # content is per user: only the browser may cache it and it has to revalidate on every use
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
 @app.route('/moves')
 @login_required
 def moves():
@@ -376,9 +472,9 @@ def moves():
                                               .filter(Move.date_time < filter_end_date)
 
     total_moves_count = moves.count()
-    move_filter = _parse_move_filter(request.args.get('filter'))
-    if move_filter:
-        moves = moves.filter_by(**move_filter)
+    parsed_filter = _parse_move_filter(request.args.get('filter'))
+    if parsed_filter:
+        moves = moves.filter(parsed_filter.criterion)
 
     sort = request.args.get('sort')
     sort_order = request.args.get('sort_order')
@@ -400,8 +496,8 @@ def moves():
                                   .order_by(func.count(Move.id).desc()))
 
     actual_activities_query = _current_user_filtered(db.session.query(distinct(Move.activity)))
-    if move_filter:
-        actual_activities_query = actual_activities_query.filter_by(**move_filter)
+    if parsed_filter:
+        actual_activities_query = actual_activities_query.filter(parsed_filter.criterion)
     actual_activities = set([activity for activity, in actual_activities_query])
 
     sort_attr = getattr(Move, sort)
@@ -419,12 +515,12 @@ def moves():
         base_query = _current_user_filtered(db.session.query(attr).filter(attr != None)
                                                                   .filter(Move.date_time >= start_date)
                                                                   .filter(Move.date_time < filter_end_date))
-        if move_filter:
-            base_query = base_query.filter_by(**move_filter)
+        if parsed_filter:
+            base_query = base_query.filter(parsed_filter.criterion)
         exists_query = db.session.query(literal(True)).filter(base_query.exists())
         show_columns[column] = exists_query.scalar()
 
-    show_columns['activity'] = not move_filter or 'activity' not in move_filter
+    show_columns['activity'] = not parsed_filter or parsed_filter.fields != {'activity'}
 
     moves = moves.order_by(sort_attr)
     return render_template('moves.html',
@@ -439,24 +535,51 @@ def moves():
                            sort_order=sort_order)
 
 
+@app.route('/moves/search')
+@login_required
+def search_moves():
+    query = request.args.get('q', '').strip()
+    results = search.search(current_user, query) if query else []
+    return render_template('search.html', query=query, results=results, search_limit=search.SEARCH_LIMIT)
+
+
 @app.route('/moves/<int:id>/delete')
 @login_required
 def delete_move(id):
     return delete_moves("%s" % id)
 
 
+def _parse_move_ids(ids):
+    """ Parses a comma separated list of move ids, aborts with 400 if it is malformed """
+    try:
+        return [int(id) for id in ids.split(',')]
+    except ValueError:
+        abort(400)
+
+
 @app.route('/moves/<string:ids>/delete')
 @login_required
 def delete_moves(ids):
-    parsed_ids = [int(id) for id in ids.split(',')]
+    parsed_ids = _parse_move_ids(ids)
     if parsed_ids:
         for id in parsed_ids:
             move = _current_user_filtered(Move.query).filter_by(id=id).first_or_404()
+            training_load.remove_move(move)
+            heatmap.remove_move(move)
+            segments.remove_move(move)
+            search.remove_move(move)
             Sample.query.filter_by(move=move).delete(synchronize_session=False)
             MoveEdit.query.filter_by(move=move).delete(synchronize_session=False)
+            BestEffort.query.filter_by(move=move).delete(synchronize_session=False)
+            HrZone.query.filter_by(move=move).delete(synchronize_session=False)
+            SwimLength.query.filter_by(move=move).delete(synchronize_session=False)
+            Pause.query.filter_by(move=move).delete(synchronize_session=False)
             db.session.delete(move)
         db.session.commit()
 
+        for id in parsed_ids:
+            export_cache.invalidate(id)
+
         if len(parsed_ids) == 1:
             flash("move %d deleted" % parsed_ids[0], 'success')
         else:
@@ -466,41 +589,94 @@ def delete_moves(ids):
     return redirect(url_for('moves'))
 
 
-@app.route('/moves/<int:id>/export')
-@login_required
-def export_move(id):
-    move = _current_user_filtered(Move.query).filter_by(id=id).first_or_404()
-
+def _get_export_format():
     if "format" in request.args:
         format = request.args.get("format").lower()
     else:
         format = "gpx"  # default
 
-    format_handlers = {}
-    format_handlers['gpx'] = gpx_export.gpx_export
-    format_handlers['csv'] = csv_export.csv_export
-    if format not in format_handlers:
+    if format not in exports.export_functions:
         flash("Export format %s not supported" % format, 'error')
-        return redirect(url_for('move', id=id))
+        return None
+    return format
+
+
+def _zip_export_response(moves, format, filename):
+    response = Response(stream_with_context(exports.zip_export(moves, format)), mimetype='application/zip')
+    response.headers['Content-Disposition'] = "attachment; filename=%s" % (quote_plus(filename))
+    return response
 
-    export_file = format_handlers[format](move)
 
-    if not export_file:
+@app.route('/moves/<int:id>/export')
+@login_required
+def export_move(id):
+    move = _current_user_filtered(Move.query).filter_by(id=id).first_or_404()
+
+    format = _get_export_format()
+    if not format:
         return redirect(url_for('move', id=id))
 
-    # app.logger.debug("Move export (format %s):\n%s" % (format, export_file))
-    response = make_response(export_file)
-    date_time = move.date_time.strftime('%Y-%m-%dT%H_%M_%S')
-    if move.location_raw:
-        address = move.location_raw['address']
-        city = get_city(address)
-        country_code = address['country_code'].upper()
-        filename = "Move_%s_%s_%s_%s.%s" % (date_time, country_code, city, move.activity, format)
+    last_modified = _to_utc(move.last_modified())
+    etag = _etag(current_user.id, move.id, format, last_modified)
+    not_modified = _not_modified(etag, last_modified)
+    if not_modified:
+        return not_modified
+
+    if export_cache.enabled:
+        path = exports.cached_move_export(move, format)
+        if not path:
+            return redirect(url_for('move', id=id))
+
+        # served by the web server if USE_X_SENDFILE is configured
+        response = send_file(path, mimetype=exports.export_mimetypes[format], add_etags=False)
     else:
-        filename = "Move_%s_%s.%s" % (date_time, move.activity, format)
+        export_file = exports.move_export(move, format)
+
+        if not export_file:
+            return redirect(url_for('move', id=id))
+
+        # app.logger.debug("Move export (format %s):\n%s" % (format, export_file))
+        response = make_response(export_file)
+        response.mimetype = exports.export_mimetypes[format]
 
+    filename = exports.export_filename(move, format)
     response.headers['Content-Disposition'] = "attachment; filename=%s" % (quote_plus(filename))
-    return response
+    return _add_validators(response, etag, last_modified)
+
+
+@app.route('/moves/<string:ids>/export')
+@login_required
+def export_moves(ids):
+    parsed_ids = _parse_move_ids(ids)
+    moves = [_current_user_filtered(Move.query).filter_by(id=id).first_or_404() for id in parsed_ids]
+
+    format = _get_export_format()
+    if not format:
+        return redirect(url_for('moves'))
+
+    # named by the date range of the moves like the exports of a date range, a list of all ids would get too long
+    dates = [move.date_time.date() for move in moves]
+    return _zip_export_response(moves, format, "Moves_%s_%s.%s.zip" % (min(dates), max(dates), format))
+
+
+@app.route('/moves/export')
+@login_required
+def export_moves_in_date_range():
+    start_date, end_date = _get_date_range()
+
+    moves = _current_user_filtered(Move.query).filter(Move.date_time >= start_date) \
+                                              .filter(Move.date_time < end_date + timedelta(days=1))
+
+    parsed_filter = _parse_move_filter(request.args.get('filter'))
+    if parsed_filter:
+        moves = moves.filter(parsed_filter.criterion)
+
+    format = _get_export_format()
+    if not format:
+        return redirect(url_for('moves', start_date=start_date, end_date=end_date))
+
+    moves = moves.order_by(Move.date_time.asc())
+    return _zip_export_response(moves, format, "Moves_%s_%s.%s.zip" % (start_date, end_date, format))
 
 
 @app.route('/moves/<int:id>', methods=['POST'])
@@ -528,10 +704,15 @@ def edit_move(id):
 
         db.session.add(move_edit)
 
+        old_activity = move.activity
         move.activity_type = activity_type
         move.activity = value
+        BestEffort.query.filter_by(move=move).update({'activity': value}, synchronize_session=False)
+        training_load.change_activity(move, old_activity)
+        search.update_move(move)
 
         db.session.commit()
+        export_cache.invalidate(move.id)
     else:
         raise ValueError("illegal name: %s" % name)
 
@@ -541,9 +722,112 @@ def edit_move(id):
 @app.route('/activity_types')
 @login_required
 def activity_types():
+    nr_of_moves, last_import = db.session.query(func.count(Move.id), func.max(Move.import_date_time)).one()
+    last_edit, = db.session.query(func.max(MoveEdit.date_time)).one()
+    last_modified = max(date_time for date_time in (last_import, last_edit, datetime.min) if date_time)
+    last_modified = _to_utc(last_modified) if last_modified > datetime.min else None
+    etag = _etag(nr_of_moves, last_modified)
+    not_modified = _not_modified(etag, last_modified)
+    if not_modified:
+        return not_modified
+
     activities = db.session.query(Move.activity).group_by(Move.activity).order_by(Move.activity.asc())
     data = [{'value': activity, 'text': activity} for activity, in activities]
-    return Response(json.dumps(data), mimetype='application/json')
+    return _add_validators(Response(json.dumps(data), mimetype='application/json'), etag, last_modified)
+
+
+@app.route('/records')
+@login_required
+def records():
+    activities = [activity for activity, in db.session.query(distinct(BestEffort.activity))
+                                                      .filter(BestEffort.user_id == current_user.id)
+                                                      .order_by(BestEffort.activity.asc())]
+
+    records_by_activity = OrderedDict()
+    for activity in activities:
+        records_by_activity[activity] = [(best_efforts.effort_name(effort_type, parameter), effort_type, best_effort)
+                                         for effort_type, parameter, best_effort in best_efforts.personal_records(current_user, activity)]
+
+    return render_template('records.html', records_by_activity=records_by_activity)
+
+
+@app.route('/heatmap')
+@login_required
+def heatmap_page():
+    return render_template('heatmap.html', heatmap_zoom_levels=heatmap.ZOOM_LEVELS)
+
+
+@app.route('/heatmap/cells')
+@login_required
+def heatmap_cells():
+    try:
+        west, south, east, north = [float(value) for value in request.args['bbox'].split(',')]
+        zoom = int(request.args.get('zoom', heatmap.ZOOM_LEVELS[0]))
+    except (KeyError, ValueError):
+        abort(400)
+    if any(math.isnan(value) or math.isinf(value) for value in (west, south, east, north)):
+        abort(400)
+    return Response(json.dumps(heatmap.heatmap_geojson(current_user, zoom, west, south, east, north)), mimetype='application/geo+json')
+
+
+@app.route('/moves/<int:id>/segments', methods=['POST'])
+@login_required
+def create_segment(id):
+    move = _current_user_filtered(Move.query).filter_by(id=id).first_or_404()
+    name = request.form.get('name', '').strip() or "Segment of move %d" % move.id
+    try:
+        # the form takes kilometers
+        start_distance = float(request.form.get('start')) * 1000
+        end_distance = float(request.form.get('end')) * 1000
+        segment = segments.create_segment(move, name, start_distance, end_distance)
+    except (TypeError, ValueError) as e:
+        flash(u"failed to create segment: %s" % e, 'error')
+        return redirect(url_for('move', id=move.id))
+
+    db.session.commit()
+    flash(u"created segment '%s' with %d traversals" % (segment.name, segment.traversals.count()), 'success')
+    return redirect(url_for('segment_page', id=segment.id))
+
+
+@app.route('/segments')
+@login_required
+def segment_list():
+    segment_stats = db.session.query(Segment, func.count(SegmentTraversal.id), func.min(SegmentTraversal.duration)) \
+                              .outerjoin(SegmentTraversal) \
+                              .filter(Segment.user_id == current_user.id) \
+                              .group_by(Segment.id) \
+                              .order_by(Segment.name.asc())
+    return render_template('segments.html', segment_stats=segment_stats.all())
+
+
+@app.route('/segments/<int:id>')
+@login_required
+def segment_page(id):
+    segment = _current_user_filtered(Segment.query).filter_by(id=id).first_or_404()
+    traversals = segments.leaderboard_query(segment).options(joinedload(SegmentTraversal.move)).all()
+    return render_template('segment.html', segment=segment, traversals=traversals)
+
+
+@app.route('/segments/<int:id>/delete')
+@login_required
+def delete_segment(id):
+    segment = _current_user_filtered(Segment.query).filter_by(id=id).first_or_404()
+    segments.delete_segment(segment)
+    db.session.commit()
+    flash(u"segment '%s' deleted" % segment.name, 'success')
+    return redirect(url_for('segment_list'))
+
+
+# sample channels used by the move templates and charts
+# longer moves are charted on the 10 s grid
+CHART_MAX_POINTS = 10000
+
+MOVE_PAGE_SAMPLE_COLUMNS = ('time', 'sample_type', 'distance', 'speed', 'temperature', 'hr', 'altitude', 'latitude', 'longitude', 'gps_outlier')
+
+# the event samples shown on the move page. pauses and swimming events are read from the pauses and lengths stored at import,
+# they are excluded by the key of their single event, without decoding the JSON of each stroke
+_raw_events = type_coerce(Sample.__table__.c.events, db.String)
+MOVE_PAGE_EVENTS = (Sample.__table__.c.events != None) & ~_raw_events.like('{"pause"%') & ~_raw_events.like('{"swimming"%')
 
 
 @app.route('/moves/<int:id>', methods=['GET'])
@@ -551,22 +835,21 @@ def activity_types():
 def move(id):
     move = _current_user_filtered(Move.query).filter_by(id=id).first_or_404()
 
-    samples = move.samples.order_by('time asc').all()
-    events = [sample for sample in samples if sample.events]
+    move_last_modified = move.last_modified()
+    last_modified = _to_utc(move_last_modified)
+    etag = _etag(current_user.id, move.id, last_modified, _templates_version(), app.config.get('BING_MAPS_API_KEY'))
+    not_modified = _not_modified(etag, last_modified)
+    if not_modified:
+        return not_modified
+
+    samples = sample_reader.sample_rows(move, MOVE_PAGE_SAMPLE_COLUMNS)
+    events = sample_reader.sample_rows(move, ('time', 'events'), MOVE_PAGE_EVENTS)
 
     filtered_events = []
-    pauses = []
     laps = []
-    pause_begin = None
     for sample in events:
         assert len(sample.events.keys()) == 1
-        if 'pause' in sample.events:
-            state = sample.events['pause']['state'].lower() == 'true'
-            if state:
-                pause_begin = sample
-            elif not state and pause_begin:
-                pauses.append([pause_begin, sample])
-        elif 'lap' in sample.events:
+        if 'lap' in sample.events:
             laps.append(sample)
         else:
             filtered_events.append(sample)
@@ -576,10 +859,17 @@ def move(id):
     model['move'] = move
     model['samples'] = samples
     model['events'] = filtered_events
-    model['pauses'] = pauses
+    # the stored pauses, a pause without end event lasts until the last sample
+    model['pauses'] = [(timedelta(seconds=start), timedelta(seconds=end)) for start, end in move_pauses(move)]
     model['laps'] = laps
-
-    gps_samples = [sample for sample in samples if sample.sample_type and sample.sample_type.startswith('gps-')]
+    model['distance_over_time'] = _distance_over_time(samples, model['pauses'])
+    model['hr_zones'] = [(hr_zone.zone, hr_zone.duration) for hr_zone in move.hr_zones.order_by(HrZone.zone.asc())]
+    model['hr_zone_bounds'] = training_load.zone_bounds()
+    model['splits'] = [(splits.split_name(split_distance), move_splits) for split_distance, move_splits in splits.move_splits(move).items()]
+    chart_interval = 1 if move.duration.total_seconds() <= CHART_MAX_POINTS else 10
+    model['channels'] = resample.resampled_channels(move, chart_interval, export_cache.version(move, move_last_modified))
+
+    gps_samples = [sample for sample in samples if sample.sample_type and sample.sample_type.startswith('gps-') and not sample.gps_outlier]
     model['gps_samples'] = gps_samples
 
     if gps_samples:
@@ -602,35 +892,24 @@ def move(id):
         else:
             map_zoom_level = 10
 
-        calculate_distances(model, move.samples)
+        calculate_distances(model, samples)
 
         model['map_zoom_level'] = map_zoom_level
 
     if 'swimming' in move.activity:
-        swimming_events = [sample for sample in filtered_events if 'swimming' in sample.events]
-        model['swimming_events'] = swimming_events
-
-        model['swimming_style_changes'] = [sample for sample in swimming_events if sample.events['swimming']['type'] == 'StyleChange']
-        model['swimming_turns'] = [sample for sample in swimming_events if sample.events['swimming']['type'] == 'Turn']
-
-        swimming_strokes = [sample for sample in swimming_events if sample.events['swimming']['type'] == 'Stroke']
-        model['swimming_strokes'] = swimming_strokes
-
-        pause_samples = list(itertools.chain.from_iterable(pauses))
-        model['swimming_strokes_and_pauses'] = sorted(swimming_strokes + pause_samples, key=lambda sample: sample.time)
-
+        model['swim_lengths'] = move.swim_lengths.order_by(SwimLength.start.asc()).all()
         model['swim_pace'] = timedelta(seconds=move.duration.total_seconds() / move.distance)
 
-        if move.stroke_count:
-            assert len(model['swimming_strokes']) == move.stroke_count
-
     # eg. 'Pool swimming' → 'pool_swimming'
+    # a page showing flashed messages must not be reused by the browser
+    cacheable = '_flashes' not in session
+
     activity_name = move.activity.lower().replace(' ', '_')
     try:
-        return render_template("move/%s.html" % activity_name, **model)
+        response = make_response(render_template("move/%s.html" % activity_name, **model))
     except TemplateNotFound:
         # Fall-back to generic template
-        return render_template("move/_move.html", **model)
+        response = make_response(render_template("move/_move.html", **model))
     except Exception as e:
         if app.debug or app.testing:
             raise e
@@ -638,6 +917,110 @@ def move(id):
             flash("Failed to load move template of activity '%s'." % activity_name)
             return redirect(url_for('index'))
 
+    if cacheable:
+        _add_validators(response, etag, last_modified)
+    return response
+
+
+@app.route('/moves/<int:id>/splits', methods=['GET'])
+@login_required
+def move_splits(id):
+    move = _current_user_filtered(Move.query).filter_by(id=id).first_or_404()
+
+    last_modified = _to_utc(move.last_modified())
+    split_distances = splits.split_distances(move)
+    etag = _etag(current_user.id, move.id, last_modified, split_distances)
+    not_modified = _not_modified(etag, last_modified)
+    if not_modified:
+        return not_modified
+
+    data = [{'split_distance': split_distance, 'name': splits.split_name(split_distance), 'splits': move_splits}
+            for split_distance, move_splits in splits.move_splits(move).items()]
+    return _add_validators(Response(json.dumps({'splits': data}), mimetype='application/json'), etag, last_modified)
+
+
+@app.route('/moves/<int:id>/channels', methods=['GET'])
+@login_required
+def move_channels(id):
+    move = _current_user_filtered(Move.query).filter_by(id=id).first_or_404()
+    # None for a malformed interval, which is answered like an interval out of INTERVALS
+    interval = request.args.get('interval', type=int) if 'interval' in request.args else resample.INTERVALS[0]
+    if interval not in resample.INTERVALS:
+        abort(400)
+
+    move_last_modified = move.last_modified()
+    last_modified = _to_utc(move_last_modified)
+    etag = _etag(current_user.id, move.id, last_modified, interval)
+    not_modified = _not_modified(etag, last_modified)
+    if not_modified:
+        return not_modified
+
+    channels = resample.resampled_channels(move, interval, export_cache.version(move, move_last_modified))
+    data = {'start': channels.start, 'interval': channels.interval,
+            'channels': dict((column, channels.values(column)) for column in resample.CHANNELS)}
+    return _add_validators(Response(json.dumps(data), mimetype='application/json'), etag, last_modified)
+
+
+@app.route('/moves/compare/<int:id1>,<int:id2>', methods=['GET'])
+@login_required
+def compare_moves(id1, id2):
+    move1 = _current_user_filtered(Move.query).filter_by(id=id1).first_or_404()
+    move2 = _current_user_filtered(Move.query).filter_by(id=id2).first_or_404()
+    return render_template('compare.html', move1=move1, move2=move2)
+
+
+@app.route('/moves/compare/<int:id1>,<int:id2>/series', methods=['GET'])
+@login_required
+def compare_series(id1, id2):
+    move1 = _current_user_filtered(Move.query).filter_by(id=id1).first_or_404()
+    move2 = _current_user_filtered(Move.query).filter_by(id=id2).first_or_404()
+
+    last_modified = _to_utc(max(move1.last_modified(), move2.last_modified()))
+    etag = _etag(current_user.id, move1.id, move2.id, last_modified)
+    not_modified = _not_modified(etag, last_modified)
+    if not_modified:
+        return not_modified
+
+    data = compare.compare_moves(move1, move2)
+    return _add_validators(Response(json.dumps({'series': data}), mimetype='application/json'), etag, last_modified)
+
+
+@app.route('/_metrics', methods=['GET'])
+def prometheus_metrics():
+    allowed_addresses = app.config.get('METRICS_ALLOWED_ADDRESSES')
+    if not app.config.get('METRICS_ENABLED') or (allowed_addresses is not None and request.remote_addr not in allowed_addresses):
+        return error404(None)
+
+    # behind a reverse proxy all requests come from its address, so the address alone does not restrict the access
+    token = app.config.get('METRICS_TOKEN')
+    authorization = request.headers.get('Authorization', '')
+    has_token = bool(token) and authorization.startswith('Bearer ') and safe_str_cmp(authorization[len('Bearer '):], token)
+    if not has_token and not is_admin(current_user):
+        return error404(None)
+
+    return Response(metrics.prometheus_text(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/_profiles', methods=['GET'])
+@login_required
+def profiles():
+    if not is_admin(current_user):
+        return error404(None)
+
+    profiles = [(name, request_profiler.metadata(name), request_profiler.top_functions(name))
+                for name in request_profiler.profile_names()]
+    return render_template('profiles.html', profiles=profiles)
+
+
+@app.route('/_profiles/<name>.prof', methods=['GET'])
+@login_required
+def download_profile(name):
+    path = request_profiler.profile_path(name) if is_admin(current_user) else None
+    if not path:
+        return error404(None)
+
+    return send_file(path, mimetype='application/octet-stream', as_attachment=True, attachment_filename="%s.prof" % name)
+
 
 @app.route('/_tests', methods=['GET'])
 @login_required
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+
+from model import db, Sample, Pause
+from datetime import timedelta
+import sample_reader
+
+
+def is_pause_start(events):
+    """ Returns whether the events of a sample start a pause """
+    return bool(events) and 'pause' in events and events['pause']['state'].lower() == 'true'
+
+
+def pause_intervals(time, events, end=None):
+    """ Returns the (begin, end) times of the pauses from the times and events of the event samples.
+
+    The times may be seconds or timedeltas. A pause which is not ended by an
+    event lasts until end, it is left out without end.
+    """
+    pauses = []
+    pause_begin = None
+    for sample_time, sample_events in zip(time, events):
+        if not sample_events or 'pause' not in sample_events:
+            continue
+        if is_pause_start(sample_events):
+            pause_begin = sample_time
+        elif pause_begin is not None:
+            pauses.append((pause_begin, sample_time))
+            pause_begin = None
+
+    if pause_begin is not None and end is not None:
+        pauses.append((pause_begin, end))
+    return pauses
+
+
+def moving_time(start, end, pauses):
+    """ Returns the time from start to end without the pauses in between """
+    moving = end - start
+    for pause_begin, pause_end in pauses:
+        pause_begin, pause_end = max(pause_begin, start), min(pause_end, end)
+        if pause_end > pause_begin:
+            moving -= pause_end - pause_begin
+    return moving
+
+
+def _end(move):
+    """ Returns the seconds of the last sample of a move, None without samples """
+    end = db.session.query(Sample.time).filter(Sample.move_id == move.id).order_by(Sample.time.desc()).limit(1).scalar()
+    return end.total_seconds() if end is not None else None
+
+
+def move_pauses(move):
+    """ Returns the (begin, end) seconds of the pauses of a move, from its pause events if they were not stored yet """
+    if move.moving_time is None:
+        events = sample_reader.sample_array(move, ('time', 'events'), Sample.__table__.c.events != None)
+        return pause_intervals(events['time'], events['events'], _end(move))
+    return [(pause.start.total_seconds(), pause.end.total_seconds()) for pause in move.pauses.order_by(Pause.start.asc())]
+
+
+def update_move(move):
+    """ Replaces the pauses of a move with the ones of its pause events and stores its moving time """
+    Pause.query.filter_by(move_id=move.id).delete(synchronize_session=False)
+
+    end = _end(move)
+    if end is None:
+        move.moving_time = None
+        return []
+
+    events = sample_reader.sample_array(move, ('time', 'events'), Sample.__table__.c.events != None)
+    pauses = pause_intervals(events['time'], events['events'], end)
+    for pause_begin, pause_end in pauses:
+        db.session.add(Pause(move_id=move.id, start=timedelta(seconds=pause_begin), end=timedelta(seconds=pause_end)))
+
+    move.moving_time = timedelta(seconds=moving_time(0.0, end, pauses))
+    return pauses
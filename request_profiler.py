@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+
+from flask import g, request, json, current_app
+from flask_login import current_user
+from datetime import datetime
+import cProfile
+import pstats
+import os
+import re
+
+PROFILE_QUERY_ARGUMENT = '_profile'
+PROFILE_HEADER = 'X-Profile'
+
+
+def is_admin(user):
+    return user.is_authenticated() and user.username in (current_app.config.get('ADMIN_USERS') or ())
+
+
+class RequestProfiler(object):
+    """ Profiles single requests of admin users with cProfile.
+
+    Profiling is requested with the query argument '_profile' or the header
+    'X-Profile'. Profiles are stored in PROFILE_DIR, only the most recent
+    PROFILE_MAX_FILES profiles are kept.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['request_profiler'] = self
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+    @property
+    def directory(self):
+        return self.app.config.get('PROFILE_DIR')
+
+    @property
+    def max_files(self):
+        return self.app.config.get('PROFILE_MAX_FILES')
+
+    @property
+    def enabled(self):
+        return bool(self.directory)
+
+    def _requested(self):
+        return PROFILE_QUERY_ARGUMENT in request.args or PROFILE_HEADER in request.headers
+
+    def _before_request(self):
+        if self.enabled and self._requested() and is_admin(current_user):
+            g.profiler = cProfile.Profile()
+            g.profiler.enable()
+
+    def _after_request(self, response):
+        profiler = getattr(g, 'profiler', None)
+        if profiler:
+            profiler.disable()
+            g.profiler = None
+            name = self._save(profiler, response)
+            response.headers['X-Profile-Name'] = name
+        return response
+
+    def _teardown_request(self, exception):
+        profiler = getattr(g, 'profiler', None)
+        if profiler:
+            profiler.disable()
+            g.profiler = None
+
+    def _save(self, profiler, response):
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+        now = datetime.utcnow()
+        path_name = re.sub(r'[^A-Za-z0-9]+', '_', request.path).strip('_') or 'index'
+        name = "%s_%s" % (now.strftime('%Y%m%dT%H%M%S%f'), path_name[:64])
+
+        stats = pstats.Stats(profiler)
+        metadata = {
+            'url': request.url,
+            'method': request.method,
+            'endpoint': request.endpoint,
+            'status': response.status_code,
+            'username': current_user.username,
+            'date_time': now.isoformat(),
+            'duration': stats.total_tt,
+        }
+
+        # write to temporary files first so that the profile list never sees partial profiles
+        tmp_path = os.path.join(self.directory, '.tmp_' + name)
+        profiler.dump_stats(tmp_path + '.prof')
+        with open(tmp_path + '.json', 'w') as f:
+            json.dump(metadata, f)
+        os.rename(tmp_path + '.json', self._path(name, '.json'))
+        os.rename(tmp_path + '.prof', self._path(name, '.prof'))
+
+        self._evict()
+        return name
+
+    def _path(self, name, extension='.prof'):
+        return os.path.join(self.directory, name + extension)
+
+    def _evict(self):
+        if not self.max_files:
+            return
+
+        for name in self.profile_names()[self.max_files:]:
+            for extension in ('.prof', '.json'):
+                try:
+                    os.remove(self._path(name, extension))
+                except OSError:
+                    pass
+
+    def profile_names(self):
+        """ Returns the names of the stored profiles, the most recent first """
+        if not self.enabled or not os.path.isdir(self.directory):
+            return []
+        return sorted((filename[:-len('.prof')] for filename in os.listdir(self.directory)
+                       if filename.endswith('.prof') and not filename.startswith('.tmp_')), reverse=True)
+
+    def profile_path(self, name):
+        if name not in self.profile_names():
+            return None
+        return self._path(name)
+
+    def metadata(self, name):
+        try:
+            with open(self._path(name, '.json')) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def top_functions(self, name, limit=20):
+        """ Returns (function, primitive calls, total calls, own time, cumulative time) ordered by cumulative time """
+        stats = pstats.Stats(self._path(name))
+        stats.sort_stats('cumulative')
+        functions = []
+        for function in stats.fcn_list[:limit]:
+            primitive_calls, total_calls, own_time, cumulative_time, _ = stats.stats[function]
+            functions.append((pstats.func_std_string(function), primitive_calls, total_calls, own_time, cumulative_time))
+        return functions
+
+
+request_profiler = RequestProfiler()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+
+from export_cache import export_cache
+from pauses import move_pauses
+import sample_reader
+import numpy as np
+import io
+
+# channels of the resampled grids and how the values between samples are filled
+INTERPOLATED_CHANNELS = ('distance', 'speed', 'hr', 'altitude', 'cadence')
+FORWARD_FILLED_CHANNELS = ('temperature',)
+CHANNELS = INTERPOLATED_CHANNELS + FORWARD_FILLED_CHANNELS
+
+RESAMPLE_COLUMNS = ('time',) + CHANNELS
+
+# grid intervals in seconds, coarser grids average the points of the 1 s grid
+INTERVALS = (1, 10)
+
+# values are not filled across gaps of a channel longer than this many seconds, eg. lost heart rate signal
+MAX_GAP = 60.0
+
+
+class ResampledChannels(object):
+    """ Channels of a move on a regular time grid, NaN within pauses and gaps """
+
+    def __init__(self, start, interval, channels):
+        self.start = start
+        self.interval = interval
+        self.channels = channels
+
+    def __len__(self):
+        return len(self.channels[CHANNELS[0]]) if self.channels else 0
+
+    def __getitem__(self, column):
+        if column == 'time':
+            return self.time
+        return self.channels[column]
+
+    @property
+    def time(self):
+        """ Seconds since the start of the move """
+        return self.start + np.arange(len(self), dtype=float) * self.interval
+
+    def values(self, column, decimals=None):
+        """ Returns a channel as JSON serializable list with None for missing values, optionally rounded """
+        values = self.channels[column]
+        if decimals is not None:
+            values = np.round(values, decimals)
+        return [None if np.isnan(value) else value for value in values.tolist()]
+
+    def to_array(self, columns=RESAMPLE_COLUMNS):
+        """ Returns the channels as structured array like sample_reader.sample_array """
+        array = np.empty(len(self), dtype=[(column, float) for column in columns])
+        for column in columns:
+            array[column] = self[column]
+        return array
+
+
+def _fill(time, values, grid, forward_fill, max_gap):
+    mask = ~np.isnan(time) & ~np.isnan(values)
+    time, values = time[mask], values[mask]
+    if not len(time):
+        return np.full(len(grid), np.nan)
+
+    # the samples around each grid point, the same sample for an exact match
+    following = np.clip(np.searchsorted(time, grid, side='left'), 0, len(time) - 1)
+    preceding = np.searchsorted(time, grid, side='right') - 1
+    filled = (preceding >= 0) & (time[following] >= grid)
+    preceding = np.clip(preceding, 0, len(time) - 1)
+    filled &= time[following] - time[preceding] <= max_gap
+
+    if forward_fill:
+        result = values[preceding]
+    else:
+        result = np.interp(grid, time, values)
+    return np.where(filled, result, np.nan)
+
+
+def _bin_means(values, bins):
+    valid = ~np.isnan(values)
+    sums = np.add.reduceat(np.where(valid, values, 0.0), bins)
+    counts = np.add.reduceat(valid.astype(float), bins)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(counts > 0, sums / counts, np.nan)
+
+
+def resample(samples, pauses, interval=1, max_gap=MAX_GAP):
+    """ Resamples the channels of a move onto a grid of interval seconds.
+
+    samples is a structured array with the RESAMPLE_COLUMNS as returned by
+    sample_reader.sample_array, pauses the (begin, end) times of the pauses.
+    The 1 s grid starts at the first full second of the move. Channels are
+    interpolated or forward filled per channel, except across pauses and gaps
+    longer than max_gap which stay NaN. Coarser grids average the points of
+    the 1 s grid.
+    """
+    time = samples['time'][~np.isnan(samples['time'])]
+    if not len(time):
+        return ResampledChannels(0.0, interval, dict((column, np.empty(0)) for column in CHANNELS))
+
+    grid = np.arange(np.floor(time.min()), time.max() + 1e-6, 1.0)
+    in_pause = np.zeros(len(grid), dtype=bool)
+    for begin, end in pauses:
+        in_pause |= (grid > begin) & (grid < end)
+
+    channels = {}
+    for column in CHANNELS:
+        values = _fill(samples['time'], samples[column], grid, column in FORWARD_FILLED_CHANNELS, max_gap)
+        values[in_pause] = np.nan
+        channels[column] = values
+
+    if interval == 1:
+        return ResampledChannels(float(grid[0]), 1, channels)
+
+    bins = np.arange(0, len(grid), interval)
+    return ResampledChannels(float(grid[0]), interval, dict((column, _bin_means(values, bins)) for column, values in channels.items()))
+
+
+def _to_npz(resampled):
+    data = io.BytesIO()
+    channels = dict((column, values.astype(np.float32)) for column, values in resampled.channels.items())
+    np.savez_compressed(data, start=resampled.start, interval=resampled.interval, **channels)
+    return data.getvalue()
+
+
+def _from_npz(f):
+    with np.load(f) as data:
+        channels = dict((column, data[column].astype(float)) for column in CHANNELS)
+        return ResampledChannels(float(data['start']), int(data['interval']), channels)
+
+
+def _cache_format(interval):
+    return "channels_%ds.npz" % interval
+
+
+def calculate(move, interval):
+    samples = sample_reader.sample_array(move, RESAMPLE_COLUMNS)
+    return resample(samples, move_pauses(move), interval)
+
+
+def resampled_channels(move, interval=1, version=None):
+    """ Returns the ResampledChannels of a move on a grid of interval seconds, one of INTERVALS.
+
+    This is the canonical source of regular time series of a move. The grids
+    are cached as float32 in the export cache until the move changes, the
+    export cache version of the move may be passed if it is already known.
+    """
+    if interval not in INTERVALS:
+        raise ValueError("illegal interval: %s, supported intervals are %s" % (interval, ", ".join("%d" % i for i in INTERVALS)))
+
+    if not export_cache.enabled:
+        return calculate(move, interval)
+
+    path = export_cache.get_or_create(move, _cache_format(interval), lambda move, format: _to_npz(calculate(move, interval)), version)
+    with open(path, 'rb') as f:
+        return _from_npz(f)
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+
+from model import db, Sample
+from sqlalchemy.sql import select
+import sqlalchemy
+import numpy as np
+
+
+JSON_COLUMNS = ('events', 'satellites', 'apps_data')
+
+# all channels except the JSON columns which are only decoded if explicitly requested
+DEFAULT_COLUMNS = tuple(column.name for column in Sample.__table__.columns if column.name not in JSON_COLUMNS + ('id', 'move_id'))
+
+# criterion excluding the samples flagged by gps_filter, for aggregates of the GPS track
+NOT_GPS_OUTLIER = Sample.__table__.c.gps_outlier == None
+
+_record_classes = {}
+
+
+def _record_class(columns):
+    if columns not in _record_classes:
+        def __init__(self, row):
+            for column, value in zip(columns, row):
+                setattr(self, column, value)
+
+        def __repr__(self):
+            return "SampleRecord(%s)" % ", ".join("%s=%r" % (column, getattr(self, column)) for column in columns)
+
+        _record_classes[columns] = type('SampleRecord', (object,), {'__slots__': columns, '__init__': __init__, '__repr__': __repr__})
+    return _record_classes[columns]
+
+
+def _query(move, columns, criteria):
+    table = Sample.__table__
+    query = select([table.c[column] for column in columns]).where(table.c.move_id == move.id)
+    for criterion in criteria:
+        query = query.where(criterion)
+    return query.order_by(table.c.time.asc(), table.c.id.asc())
+
+
+def _execute(move, columns, criteria):
+    return db.session.execute(_query(move, columns, criteria))
+
+
+def sample_rows(move, columns=DEFAULT_COLUMNS, *criteria):
+    """ Returns the samples of a move ordered by time as lightweight read-only records.
+
+    Only the given columns are fetched. The records are neither tracked by the
+    session nor instrumented, so they are much cheaper than Sample instances.
+    """
+    columns = tuple(columns)
+    record_class = _record_class(columns)
+    return [record_class(row) for row in _execute(move, columns, criteria)]
+
+
+def _numpy_column(column, values):
+    column_type = type(Sample.__table__.c[column].type)
+    if column_type in (sqlalchemy.sql.sqltypes.Float, sqlalchemy.sql.sqltypes.Integer, sqlalchemy.sql.sqltypes.Boolean):
+        return np.array(values, dtype=float), float
+    elif column_type == sqlalchemy.sql.sqltypes.Interval:
+        return np.array([value.total_seconds() if value is not None else np.nan for value in values], dtype=float), float
+    elif column_type == sqlalchemy.sql.sqltypes.DateTime:
+        return np.array([value if value is not None else 'NaT' for value in values], dtype='datetime64[us]'), 'datetime64[us]'
+    else:
+        # filled element-wise, np.array would unpack the dicts of the JSON columns
+        array = np.empty(len(values), dtype=object)
+        array[:] = [value for value in values]
+        return array, object
+
+
+def sample_array(move, columns, *criteria):
+    """ Returns the samples of a move ordered by time as NumPy structured array.
+
+    Numeric and boolean columns are converted to float with NaN for missing values,
+    intervals to float seconds and date times to datetime64.
+    """
+    columns = tuple(columns)
+    rows = _execute(move, columns, criteria).fetchall()
+    values_by_column = zip(*rows) if rows else [()] * len(columns)
+
+    converted_columns = [_numpy_column(column, values) for column, values in zip(columns, values_by_column)]
+    array = np.empty(len(rows), dtype=[(column, dtype) for column, (_, dtype) in zip(columns, converted_columns)])
+    for column, (values, _) in zip(columns, converted_columns):
+        array[column] = values
+    return array
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+
+from model import db, Move, sqlite_has_fts5
+from sqlalchemy.sql import table, column, literal, literal_column, func, select, text
+import unicodedata
+import re
+
+WORD_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+# address components of the reverse geocoding which are not worth searching for
+IGNORED_ADDRESS_COMPONENTS = ('country_code',)
+
+TRANSLITERATIONS = ((u'ä', u'ae'), (u'ö', u'oe'), (u'ü', u'ue'), (u'ß', u'ss'))
+
+MAX_QUERY_WORDS = 10
+
+SEARCH_LIMIT = 50
+
+_sqlite_table = table('move_search', column('rowid'), column('user_id'), column('document'))
+_postgresql_table = table('move_search', column('move_id'), column('user_id'), column('document'))
+
+
+def _is_sqlite():
+    return db.session.get_bind(Move.__mapper__).name == 'sqlite'
+
+
+def _is_fts5():
+    return _is_sqlite() and sqlite_has_fts5(db.session.connection())
+
+
+def _escape_like(word):
+    return word.replace('\\', '\\\\').replace('_', '\\_').replace('%', '\\%')
+
+
+def fold(word):
+    """ Lowercases a word and strips its diacritics, eg. 'Zürich' to 'zurich' """
+    decomposed = unicodedata.normalize('NFKD', word.lower())
+    return u''.join(character for character in decomposed if not unicodedata.combining(character))
+
+
+def words(value):
+    """ Returns the folded words of a text """
+    return [fold(word) for word in WORD_PATTERN.findall(value)]
+
+
+def move_document(move):
+    """ Returns the searchable words of a move: its activity, location address and the address components of the reverse geocoding.
+
+    Words with umlauts are added folded and transliterated, so 'Bärensee'
+    is found by both 'Barensee' and 'Baerensee'.
+    """
+    texts = [move.activity or u'', move.location_address or u'']
+    if move.location_raw and 'address' in move.location_raw:
+        address = move.location_raw['address']
+        texts.extend(u'%s' % address[key] for key in sorted(address) if key not in IGNORED_ADDRESS_COMPONENTS)
+
+    document = []
+    for value in texts:
+        for word in WORD_PATTERN.findall(value):
+            transliterated = word.lower()
+            for umlaut, replacement in TRANSLITERATIONS:
+                transliterated = transliterated.replace(umlaut, replacement)
+            for variant in (fold(word), fold(transliterated)):
+                if variant not in document:
+                    document.append(variant)
+    return u' '.join(document)
+
+
+def remove_move(move):
+    """ Removes a move from the search index, before the move is deleted """
+    if _is_sqlite():
+        db.session.execute(text("DELETE FROM move_search WHERE rowid = :move_id"), {'move_id': move.id})
+    else:
+        db.session.execute(text("DELETE FROM move_search WHERE move_id = :move_id"), {'move_id': move.id})
+
+
+def update_move(move):
+    """ (Re)indexes a move after its activity or location changed, returns the indexed document """
+    if move.id is None:
+        db.session.flush()
+    remove_move(move)
+
+    document = move_document(move)
+    parameters = {'move_id': move.id, 'user_id': move.user_id, 'document': document}
+    if _is_sqlite():
+        db.session.execute(text("INSERT INTO move_search (rowid, user_id, document) VALUES (:move_id, :user_id, :document)"), parameters)
+    else:
+        db.session.execute(text("INSERT INTO move_search (move_id, user_id, document) VALUES (:move_id, :user_id, to_tsvector('simple', :document))"), parameters)
+    return document
+
+
+def indexed_move_ids():
+    """ Returns a select of the ids of the indexed moves """
+    if _is_sqlite():
+        return select([_sqlite_table.c.rowid])
+    else:
+        return select([_postgresql_table.c.move_id])
+
+
+def search_query(user, query):
+    """ Returns a query of (Move, score) of the moves of an user matching all words of a search query as prefix, the best match first.
+
+    Returns None if the search query has no words.
+    """
+    query_words = words(query)[:MAX_QUERY_WORDS]
+    if not query_words:
+        return None
+
+    if _is_fts5():
+        # the user restriction is part of the full-text query, so the matches of other users are never visited
+        match = u'user_id : "%d" AND document : (%s)' % (user.id, u' '.join(u'"%s"*' % word for word in query_words))
+        rank = literal_column('move_search.rank')
+        return db.session.query(Move, (-rank).label('score')) \
+                         .select_from(_sqlite_table) \
+                         .join(Move, Move.id == _sqlite_table.c.rowid) \
+                         .filter(literal_column('move_search').op('MATCH')(match)) \
+                         .order_by(rank)
+    elif _is_sqlite():
+        # without FTS5 all words must be prefixes of words of the document, the most recent move first
+        document = literal(u' ') + _sqlite_table.c.document
+        moves = db.session.query(Move, literal(0.0).label('score')) \
+                          .select_from(_sqlite_table) \
+                          .join(Move, Move.id == _sqlite_table.c.rowid) \
+                          .filter(_sqlite_table.c.user_id == user.id)
+        for word in query_words:
+            moves = moves.filter(document.like(u'%% %s%%' % _escape_like(word), escape='\\'))
+        return moves.order_by(Move.date_time.desc())
+    else:
+        ts_query = func.to_tsquery('simple', u' & '.join(u'%s:*' % word for word in query_words))
+        score = func.ts_rank(_postgresql_table.c.document, ts_query)
+        return db.session.query(Move, score.label('score')) \
+                         .select_from(_postgresql_table) \
+                         .join(Move, Move.id == _postgresql_table.c.move_id) \
+                         .filter(_postgresql_table.c.user_id == user.id) \
+                         .filter(_postgresql_table.c.document.op('@@')(ts_query)) \
+                         .order_by(score.desc())
+
+
+def search(user, query, limit=SEARCH_LIMIT):
+    """ Returns the best (Move, score) matches of a search query """
+    moves = search_query(user, query)
+    if moves is None:
+        return []
+    return moves.limit(limit).all()
@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+
+from model import db, Move, Segment, SegmentTraversal
+from spatial import near_criterion, EARTH_RADIUS
+from datetime import timedelta
+import sample_reader
+import numpy as np
+import math
+
+# a traversal has to pass this close by the start and end of the segment
+MATCH_RADIUS = 30.0
+
+# and this close by every point of the simplified segment
+TRACK_RADIUS = 50.0
+
+# spacing of the points of the simplified segment
+POINT_SPACING = 25.0
+
+# relative difference of the length of a traversal and the segment, rejects detours
+DISTANCE_TOLERANCE = 0.2
+
+TRACK_COLUMNS = ('time', 'distance', 'latitude', 'longitude', 'gps_outlier')
+
+
+def _to_xy(latitude, longitude, origin_latitude, origin_longitude):
+    """ Projects coordinates in radians to meters east and north of an origin """
+    x = (longitude - origin_longitude) * math.cos(origin_latitude) * EARTH_RADIUS
+    y = (latitude - origin_latitude) * EARTH_RADIUS
+    return x, y
+
+
+def _path_length(x, y):
+    return np.concatenate(([0.0], np.cumsum(np.hypot(np.diff(x), np.diff(y)))))
+
+
+def gps_track(samples):
+    """ Returns the time, latitude and longitude arrays of the GPS samples which are not outliers """
+    mask = ~np.isnan(samples['time']) & ~np.isnan(samples['latitude']) & ~np.isnan(samples['longitude']) & np.isnan(samples['gps_outlier'])
+    return samples['time'][mask], samples['latitude'][mask], samples['longitude'][mask]
+
+
+def simplify(latitude, longitude, spacing=POINT_SPACING):
+    """ Resamples a track in radians to points every spacing meters along it, returns the points and the length of the track """
+    x, y = _to_xy(latitude, longitude, latitude[0], longitude[0])
+    length = _path_length(x, y)
+    distances = np.append(np.arange(0.0, length[-1], spacing), length[-1])
+    return np.interp(distances, length, latitude), np.interp(distances, length, longitude), float(length[-1])
+
+
+def segment_track(samples, start_distance, end_distance):
+    """ Returns the GPS track between two distances of a move.
+
+    The distances refer to the distance channel of the device, the GPS
+    samples between the times these distances were reached are used.
+    """
+    time, distance = samples['time'], np.maximum.accumulate(np.nan_to_num(samples['distance']))
+    mask = ~np.isnan(samples['time']) & ~np.isnan(samples['distance'])
+    if not mask.any() or start_distance >= end_distance:
+        raise ValueError("illegal segment: %g m to %g m" % (start_distance, end_distance))
+
+    start_time, end_time = np.interp([start_distance, end_distance], distance[mask], time[mask])
+    time, latitude, longitude = gps_track(samples)
+    in_segment = (time >= start_time) & (time <= end_time)
+    if np.count_nonzero(in_segment) < 2:
+        raise ValueError("no GPS samples between %g m and %g m" % (start_distance, end_distance))
+    return latitude[in_segment], longitude[in_segment]
+
+
+def _passes(distances, radius):
+    """ Returns the index of the closest sample of each pass within radius """
+    near = distances <= radius
+    if not near.any():
+        return []
+
+    changes = np.flatnonzero(np.diff(np.concatenate(([False], near, [False])).astype(int)))
+    return [start + int(np.argmin(distances[start:end])) for start, end in zip(changes[::2], changes[1::2])]
+
+
+def find_traversals(segment_latitude, segment_longitude, segment_distance, time, latitude, longitude):
+    """ Returns the (start, end) times of the traversals of a segment in a GPS track, all coordinates in radians.
+
+    A traversal passes within MATCH_RADIUS by the start and then the end of
+    the segment, within TRACK_RADIUS by all points of the simplified segment
+    and its length differs by at most DISTANCE_TOLERANCE from the segment.
+    """
+    if len(time) < 2:
+        return []
+
+    segment_x, segment_y = _to_xy(np.asarray(segment_latitude), np.asarray(segment_longitude), segment_latitude[0], segment_longitude[0])
+    x, y = _to_xy(latitude, longitude, segment_latitude[0], segment_longitude[0])
+    length = _path_length(x, y)
+
+    starts = _passes(np.hypot(x - segment_x[0], y - segment_y[0]), MATCH_RADIUS)
+    ends = _passes(np.hypot(x - segment_x[-1], y - segment_y[-1]), MATCH_RADIUS)
+
+    traversals = []
+    previous_end = -1
+    for start in starts:
+        if start <= previous_end:
+            continue
+        for end in ends:
+            if end <= start:
+                continue
+            traversal_length = length[end] - length[start]
+            if abs(traversal_length - segment_distance) > DISTANCE_TOLERANCE * segment_distance:
+                if traversal_length > segment_distance:
+                    break
+                continue
+
+            # distance of every segment point to the closest point of the traversal
+            distances = np.hypot(segment_x[:, np.newaxis] - x[np.newaxis, start:end + 1],
+                                 segment_y[:, np.newaxis] - y[np.newaxis, start:end + 1])
+            if distances.min(axis=1).max() <= TRACK_RADIUS:
+                traversals.append((float(time[start]), float(time[end])))
+                previous_end = end
+                break
+    return traversals
+
+
+def create_segment(move, name, start_distance, end_distance):
+    """ Creates a segment between two distances of a move and searches its traversals in all moves of the user """
+    latitude, longitude = segment_track(sample_reader.sample_array(move, TRACK_COLUMNS), start_distance, end_distance)
+    points_latitude, points_longitude, distance = simplify(latitude, longitude)
+
+    segment = Segment(user_id=move.user_id, move_id=move.id, name=name, distance=distance,
+                      points={'latitude': points_latitude.tolist(), 'longitude': points_longitude.tolist()},
+                      latitude_min=float(latitude.min()), latitude_max=float(latitude.max()),
+                      longitude_min=float(longitude.min()), longitude_max=float(longitude.max()))
+    db.session.add(segment)
+    db.session.flush()
+
+    for candidate in candidate_moves(segment):
+        update_traversals(segment, candidate)
+    return segment
+
+
+def candidate_moves(segment):
+    """ Returns the moves of the user passing by the start and end of a segment according to their bounding boxes """
+    points = segment.points
+    start = math.degrees(points['latitude'][0]), math.degrees(points['longitude'][0])
+    end = math.degrees(points['latitude'][-1]), math.degrees(points['longitude'][-1])
+    return Move.query.filter(Move.user_id == segment.user_id) \
+                     .filter(near_criterion(segment.user_id, start[0], start[1], MATCH_RADIUS)) \
+                     .filter(near_criterion(segment.user_id, end[0], end[1], MATCH_RADIUS)) \
+                     .order_by(Move.id.asc())
+
+
+def update_traversals(segment, move, samples=None):
+    """ Replaces the traversals of a segment in a move """
+    SegmentTraversal.query.filter_by(segment=segment, move=move).delete(synchronize_session=False)
+
+    if samples is None:
+        samples = sample_reader.sample_array(move, TRACK_COLUMNS)
+    time, latitude, longitude = gps_track(samples)
+    points = segment.points
+    traversals = find_traversals(points['latitude'], points['longitude'], segment.distance, time, latitude, longitude)
+    for start_time, end_time in traversals:
+        db.session.add(SegmentTraversal(segment=segment, move=move, start=timedelta(seconds=start_time), duration=end_time - start_time))
+    return traversals
+
+
+def match_move(move):
+    """ Searches the traversals of the segments of the user in a move, the GPS bounds of the move have to be up to date """
+    if move.gps_geohash is None:
+        return 0
+
+    segments = Segment.query.filter(Segment.user_id == move.user_id) \
+                            .filter(Segment.latitude_min <= move.gps_latitude_max) \
+                            .filter(Segment.latitude_max >= move.gps_latitude_min) \
+                            .filter(Segment.longitude_min <= move.gps_longitude_max) \
+                            .filter(Segment.longitude_max >= move.gps_longitude_min).all()
+
+    count = 0
+    if segments:
+        samples = sample_reader.sample_array(move, TRACK_COLUMNS)
+        for segment in segments:
+            count += len(update_traversals(segment, move, samples))
+    return count
+
+
+def remove_move(move):
+    """ Deletes the traversals of a move and detaches the segments defined on it, before the move is deleted """
+    SegmentTraversal.query.filter_by(move=move).delete(synchronize_session=False)
+    Segment.query.filter_by(move_id=move.id).update({'move_id': None}, synchronize_session=False)
+
+
+def delete_segment(segment):
+    SegmentTraversal.query.filter_by(segment=segment).delete(synchronize_session=False)
+    db.session.delete(segment)
+
+
+def leaderboard_query(segment):
+    return SegmentTraversal.query.filter(SegmentTraversal.segment_id == segment.id) \
+                                 .order_by(SegmentTraversal.duration.asc())
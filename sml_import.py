@@ -6,6 +6,8 @@ from model import db
 from model import Move, Device
 from lxml import objectify
 import os
+from import_profiler import import_phase
+import gps_filter
 from _import import add_children, set_attr, normalize_tag, normalize_move, parse_samples, postprocess_move
 
 
@@ -33,11 +35,12 @@ def parse_device(tree):
 
 def sml_import(xmlfile, user, request_form):
     filename = xmlfile.filename
-    tree = objectify.parse(xmlfile).getroot()
-    move = parse_move(tree)
-    move.source = os.path.abspath(filename)
-    move.import_module = __name__
-    device = parse_device(tree)
+    with import_phase('parse header'):
+        tree = objectify.parse(xmlfile).getroot()
+        move = parse_move(tree)
+        move.source = os.path.abspath(filename)
+        move.import_module = __name__
+        device = parse_device(tree)
     persistent_device = Device.query.filter_by(serial_number=device.serial_number).scalar()
     if persistent_device:
         if not persistent_device.name:
@@ -56,9 +59,16 @@ def sml_import(xmlfile, user, request_form):
         move.device = device
         db.session.add(move)
 
-        samples = tree.DeviceLog.Samples.iterchildren()
-        for sample in parse_samples(samples, move):
-            db.session.add(sample)
+        with import_phase('parse samples'):
+            samples = list(parse_samples(tree.DeviceLog.Samples.iterchildren(), move))
+        with import_phase('filter'):
+            move.gps_outlier_count = gps_filter.flag_samples(samples, move.activity)
+        with import_phase('parse samples'):
+            for sample in samples:
+                db.session.add(sample)
+        with import_phase('persist'):
+            db.session.flush()
         postprocess_move(move)
-        db.session.commit()
+        with import_phase('persist'):
+            db.session.commit()
         return move
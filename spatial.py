@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+
+from model import Move
+from sqlalchemy.sql import and_, select, union_all
+import sample_reader
+import numpy as np
+import math
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 12
+
+# sorts after every geohash character, so [prefix, prefix + GEOHASH_END) are the geohashes starting with prefix
+GEOHASH_END = '{'
+
+EARTH_RADIUS = 6371000.0
+
+
+def geohash(latitude, longitude, precision=GEOHASH_PRECISION):
+    """ Encodes a coordinate in degrees as geohash """
+    latitude_range = [-90.0, 90.0]
+    longitude_range = [-180.0, 180.0]
+    characters = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(characters) < precision:
+        value, value_range = (longitude, longitude_range) if even else (latitude, latitude_range)
+        middle = (value_range[0] + value_range[1]) / 2
+        if value >= middle:
+            bits = bits * 2 + 1
+            value_range[0] = middle
+        else:
+            bits = bits * 2
+            value_range[1] = middle
+        even = not even
+
+        bit_count += 1
+        if bit_count == 5:
+            characters.append(GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(characters)
+
+
+def geohash_cell_size(precision):
+    """ Returns the height and width in degrees of the geohash cells of a precision """
+    bits = 5 * precision
+    return 180.0 / 2 ** (bits // 2), 360.0 / 2 ** ((bits + 1) // 2)
+
+
+def bounds_geohash(south, west, north, east):
+    """ Returns the geohash of the smallest cell containing a bounding box in degrees """
+    south_west, north_east = geohash(south, west), geohash(north, east)
+    length = 0
+    while length < GEOHASH_PRECISION and south_west[length] == north_east[length]:
+        length += 1
+    return south_west[:length]
+
+
+def update_gps_bounds(move):
+    """ Stores the bounding box of the GPS samples of a move without outliers and the geohash of the smallest cell containing it """
+    samples = sample_reader.sample_array(move, ('latitude', 'longitude'), sample_reader.NOT_GPS_OUTLIER)
+    mask = ~np.isnan(samples['latitude']) & ~np.isnan(samples['longitude'])
+    latitude, longitude = samples['latitude'][mask], samples['longitude'][mask]
+    if not len(latitude):
+        move.gps_latitude_min = move.gps_latitude_max = move.gps_longitude_min = move.gps_longitude_max = move.gps_geohash = None
+        return None
+
+    move.gps_latitude_min, move.gps_latitude_max = float(latitude.min()), float(latitude.max())
+    move.gps_longitude_min, move.gps_longitude_max = float(longitude.min()), float(longitude.max())
+    move.gps_geohash = bounds_geohash(*[math.degrees(value) for value in (move.gps_latitude_min, move.gps_longitude_min,
+                                                                          move.gps_latitude_max, move.gps_longitude_max)])
+    return move.gps_geohash
+
+
+def _geohash_criterion(user_id, south, west, north, east):
+    """ Criterion on the indexed geohash selecting the candidate moves of an user which may intersect a bounding box in degrees.
+
+    The geohash cells of the largest precision still covering the whole
+    bounding box are used, at most four of them. A move is a candidate if its
+    cell lies within one of them or contains one of them. Each cell is looked
+    up by its own index range scan, as SQLite doesn't use the index for an OR
+    of ranges next to other criteria on the user.
+    """
+    height, width = north - south, east - west
+    precision = 0
+    while precision < GEOHASH_PRECISION and geohash_cell_size(precision + 1)[0] >= height and geohash_cell_size(precision + 1)[1] >= width:
+        precision += 1
+
+    cells = sorted(set(geohash(latitude, longitude, precision) for latitude in (south, north) for longitude in (west, east)))
+    prefixes = sorted(set(cell[:length] for cell in cells for length in range(len(cell))))
+
+    candidates = [select([Move.id]).where(Move.user_id == user_id)
+                                   .where(Move.gps_geohash >= cell)
+                                   .where(Move.gps_geohash < cell + GEOHASH_END) for cell in cells]
+    if prefixes:
+        candidates.append(select([Move.id]).where(Move.user_id == user_id).where(Move.gps_geohash.in_(prefixes)))
+    return Move.id.in_(union_all(*candidates) if len(candidates) > 1 else candidates[0])
+
+
+def bounds_criterion(user_id, south, west, north, east):
+    """ Criterion selecting the moves of an user whose GPS bounding box intersects a bounding box in degrees """
+    south, north = max(south, -90.0), min(north, 90.0)
+    west, east = max(west, -180.0), min(east, 180.0)
+    if south > north or west > east:
+        raise ValueError("illegal bounding box: %f,%f,%f,%f" % (west, south, east, north))
+
+    return and_(_geohash_criterion(user_id, south, west, north, east),
+                Move.gps_latitude_min <= math.radians(north),
+                Move.gps_latitude_max >= math.radians(south),
+                Move.gps_longitude_min <= math.radians(east),
+                Move.gps_longitude_max >= math.radians(west))
+
+
+def near_criterion(user_id, latitude, longitude, radius):
+    """ Criterion selecting the moves of an user whose GPS bounding box intersects the square of radius meters around a coordinate in degrees """
+    latitude_delta = math.degrees(radius / EARTH_RADIUS)
+    longitude_delta = math.degrees(radius / (EARTH_RADIUS * max(math.cos(math.radians(latitude)), 1e-6)))
+    return bounds_criterion(user_id, latitude - latitude_delta, longitude - longitude_delta, latitude + latitude_delta, longitude + longitude_delta)
+
+
+def parse_distance(value):
+    """ Parses a distance like '500', '500m' or '2.5km' into meters """
+    value = value.strip().lower()
+    if value.endswith('km'):
+        return float(value[:-2]) * 1000
+    elif value.endswith('m'):
+        return float(value[:-1])
+    return float(value)
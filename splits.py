@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+
+from flask import current_app, json
+from export_cache import export_cache
+import sample_reader
+import numpy as np
+from collections import OrderedDict
+
+SPLIT_COLUMNS = ('time', 'distance', 'hr', 'cadence', 'altitude')
+
+MILE = 1609.344
+
+
+def _valid(time, values):
+    mask = ~np.isnan(time) & ~np.isnan(values)
+    return time[mask], values[mask]
+
+
+def _to_list(values):
+    return [None if np.isnan(value) else value for value in values.tolist()]
+
+
+def _averages(time, values, boundary_times):
+    """ Time-weighted averages of a channel between the boundary times, NaN where the channel has no samples """
+    time, values = _valid(time, values)
+    if len(time) < 2:
+        return np.full(len(boundary_times) - 1, np.nan)
+
+    # trapezoidal integral over time
+    integral = np.concatenate(([0.0], np.cumsum(np.diff(time) * (values[1:] + values[:-1]) / 2)))
+    integral = np.interp(boundary_times, time, integral)
+
+    # only the part of a split covered by the channel counts
+    covered = np.diff(np.clip(boundary_times, time[0], time[-1]))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(covered > 0, np.diff(integral) / covered, np.nan)
+
+
+def _ascent_descent(time, altitude, boundary_times):
+    time, altitude = _valid(time, altitude)
+    if len(time) < 2:
+        nan = np.full(len(boundary_times) - 1, np.nan)
+        return nan, nan
+
+    deltas = np.diff(altitude)
+    ascent = np.concatenate(([0.0], np.cumsum(np.clip(deltas, 0, None))))
+    descent = np.concatenate(([0.0], np.cumsum(np.clip(-deltas, 0, None))))
+    return np.diff(np.interp(boundary_times, time, ascent)), np.diff(np.interp(boundary_times, time, descent))
+
+
+def calculate_splits(samples, split_distance):
+    """ Splits a move at every split_distance meters.
+
+    samples is a structured array with the SPLIT_COLUMNS as returned by
+    sample_reader.sample_array. The times of the split boundaries are
+    interpolated from the cumulative distance, the last split covers the
+    remaining distance. Returns a list of dicts with JSON serializable values,
+    None for channels without samples.
+    """
+    time, distance = _valid(samples['time'], samples['distance'])
+    if len(time) < 2:
+        return []
+
+    # the distance of some devices jitters slightly backwards
+    distance = np.maximum.accumulate(distance)
+
+    # a split ends as soon as its distance is reached, the following pause belongs to the next split
+    increasing = np.concatenate(([True], np.diff(distance) > 0))
+    time, distance = time[increasing], distance[increasing]
+    if len(time) < 2:
+        return []
+
+    boundaries = np.arange(split_distance, distance[-1], split_distance)
+    boundaries = np.concatenate(([distance[0]], boundaries[boundaries > distance[0]], [distance[-1]]))
+    boundary_times = np.interp(boundaries, distance, time)
+
+    lengths = np.diff(boundaries)
+    durations = np.diff(boundary_times)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        speeds = np.where(durations > 0, lengths / durations, np.nan)
+
+    hr = _averages(samples['time'], samples['hr'], boundary_times)
+    cadence = _averages(samples['time'], samples['cadence'], boundary_times)
+    ascent, descent = _ascent_descent(samples['time'], samples['altitude'], boundary_times)
+
+    columns = [
+        ('distance', boundaries[1:]),
+        ('length', lengths),
+        ('start', boundary_times[:-1]),
+        ('duration', durations),
+        ('speed', speeds),
+        ('hr_avg', hr),
+        ('cadence_avg', cadence),
+        ('ascent', ascent),
+        ('descent', descent),
+    ]
+    names = [name for name, _ in columns]
+    rows = zip(*[_to_list(values) for _, values in columns])
+    return [dict(zip(names, row), split=index + 1) for index, row in enumerate(rows)]
+
+
+def split_distances(move):
+    """ Returns the split distances of a move in meters: the pool length for pool swimming, SPLIT_DISTANCES otherwise """
+    if move.activity == 'Pool swimming':
+        return [move.pool_length] if move.pool_length else []
+    return list(current_app.config.get('SPLIT_DISTANCES') or [])
+
+
+def split_name(split_distance):
+    if split_distance == MILE:
+        return "1 mi"
+    elif split_distance >= 1000 and split_distance % 1000 == 0:
+        return "%g km" % (split_distance / 1000.0)
+    else:
+        return "%g m" % split_distance
+
+
+def _cache_format(split_distance):
+    return "splits_%g.json" % split_distance
+
+
+def move_splits(move):
+    """ Returns an OrderedDict of split distance to splits of the move.
+
+    The splits are cached in the export cache until the move changes, the
+    samples are only read if a split distance is not cached yet.
+    """
+    samples = []
+
+    def splits_json(split_distance):
+        if not samples:
+            samples.append(sample_reader.sample_array(move, SPLIT_COLUMNS))
+        return json.dumps(calculate_splits(samples[0], split_distance))
+
+    splits = OrderedDict()
+    version = None
+    for split_distance in split_distances(move):
+        if export_cache.enabled:
+            version = version or export_cache.version(move)
+            path = export_cache.get_or_create(move, _cache_format(split_distance), lambda move, format: splits_json(split_distance), version)
+            with open(path, 'rb') as f:
+                data = f.read().decode('utf-8')
+        else:
+            data = splits_json(split_distance)
+        splits[split_distance] = json.loads(data)
+    return splits
@@ -25,6 +25,12 @@ function kmh(val) {
     return val * 3.6;
 }
 
+function resampledSeries(start, offset, interval, values) {
+    return values.map(function(value, index) {
+        return [start + offset + index * interval, value];
+    });
+}
+
 function pruneNulls(data) {
     var ret = [];
     var before = null
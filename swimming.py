@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+
+from model import db, Sample, SwimLength
+from datetime import timedelta
+from pauses import is_pause_start
+import sample_reader
+
+
+def _swimming_event(events, event_type):
+    swimming = events.get('swimming')
+    return swimming if swimming and swimming['type'] == event_type else None
+
+
+def segment_lengths(time, events):
+    """ Splits a swim into its lengths from turn to turn.
+
+    time and events are the arrays of the samples with events, ordered by
+    time. Returns (number, start, duration, strokes, style) per length with
+    times in seconds and the strokes after the start up to the turn.
+
+    A StyleChange event is recorded with the turn ending a length and names
+    the style of that length, only when it differs from the length before.
+    Lengths interrupted by a pause and turns not increasing the total number
+    of lengths, eg. resting at the wall, are no lengths.
+    """
+    lengths = []
+    start = number = style = None
+    strokes = 0
+    paused = False
+    for sample_time, sample_events in zip(time, events):
+        if 'pause' in sample_events:
+            paused |= is_pause_start(sample_events)
+        elif _swimming_event(sample_events, 'Stroke'):
+            strokes += 1
+        elif _swimming_event(sample_events, 'StyleChange'):
+            style = sample_events['swimming'].get('prevPoolLengthStyle', style)
+        elif _swimming_event(sample_events, 'Turn'):
+            turn_number = int(sample_events['swimming']['totalLengths'])
+            if start is not None and not paused and turn_number > number:
+                lengths.append((turn_number, start, sample_time - start, strokes, style))
+            start, number, strokes, paused = sample_time, turn_number, 0, False
+    return lengths
+
+
+def update_swim_lengths(move):
+    """ Replaces the lengths of a swimming move with ones segmented from its events """
+    SwimLength.query.filter_by(move_id=move.id).delete(synchronize_session=False)
+    if 'swimming' not in move.activity:
+        return []
+
+    samples = sample_reader.sample_array(move, ('time', 'events'), Sample.__table__.c.events != None)
+    lengths = segment_lengths(samples['time'], samples['events'])
+
+    for number, start, duration, strokes, style in lengths:
+        db.session.add(SwimLength(move_id=move.id,
+                                  number=number,
+                                  start=timedelta(seconds=start),
+                                  duration=timedelta(seconds=duration),
+                                  strokes=strokes,
+                                  style=style,
+                                  swolf=int(round(duration + strokes)),
+                                  pace=timedelta(seconds=duration / move.pool_length) if move.pool_length else None))
+    return lengths
@@ -0,0 +1,53 @@
+# vim: set fileencoding=utf-8 :
+
+from sqlalchemy import event
+import re
+
+
+class QueryCounter(object):
+    """ Context manager which records the SQL statements executed on an engine """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        event.remove(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def assert_max(self, budget, description=''):
+        assert self.count <= budget, "%s: %d SQL statements exceed the budget of %d:\n%s" % \
+            (description, self.count, budget, "\n".join(" ".join(statement.split()) for statement in self.statements))
+
+
+def explain_query_plan(session, query):
+    """ Returns the details of the SQLite query plan of the given query or statement """
+    statement = getattr(query, 'statement', query)
+    compiled = statement.compile(dialect=session.bind.dialect)
+    # apply the bind processors of the column types, eg. for intervals
+    processors = compiled._bind_processors
+    parameters = [processors[name](compiled.params[name]) if name in processors else compiled.params[name]
+                  for name in compiled.positiontup]
+    rows = session.connection().execute("EXPLAIN QUERY PLAN %s" % compiled, parameters)
+    return [detail for _, _, _, detail in rows]
+
+
+def assert_index_backed(session, query, allow_temp_sort=False):
+    """ Fails if SQLite falls back to a full table scan (or an explicit sort) to answer the query """
+    plan = explain_query_plan(session, query)
+    for detail in plan:
+        if re.match(r'SCAN (TABLE )?\w+( USING (COVERING )?INDEX \w+)?$', detail):
+            raise AssertionError("full table scan in query plan: %s" % plan)
+        if not allow_temp_sort and 'USE TEMP B-TREE' in detail:
+            raise AssertionError("sort without index in query plan: %s" % plan)
+    return plan
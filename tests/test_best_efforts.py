@@ -0,0 +1,58 @@
+# vim: set fileencoding=utf-8 :
+
+from best_efforts import fastest_section, best_window, calculate_best_efforts, effort_name
+import numpy as np
+
+
+class TestBestEfforts(object):
+
+    def test_fastest_section(self):
+        time = [0, 10, 20, 30, 40, 50]
+        distance = [0, 50, 150, 200, 300, 320]
+        assert fastest_section(time, distance, 100) == (10, 10)
+        assert fastest_section(time, distance, 150) == (20, 0)
+        assert fastest_section(time, distance, 320) == (50, 0)
+        assert fastest_section(time, distance, 321) is None
+
+    def test_fastest_section_during_pause(self):
+        time = [0, 10, 100, 110]
+        distance = [0, 100, 100, 200]
+        assert fastest_section(time, distance, 100) == (10, 0)
+        assert fastest_section(time, distance, 150) == (105, 5)
+
+    def test_best_window(self):
+        time = [0, 10, 20, 30, 40]
+        distance = [0, 10, 40, 50, 60]
+        assert best_window(time, distance, 10) == (30, 10)
+        assert best_window(time, distance, 15) == (35, 5)
+        assert best_window(time, distance, 40) == (60, 0)
+        assert best_window(time, distance, 41) is None
+
+    def test_calculate_best_efforts(self):
+        time = np.arange(0, 3001, 1.0)
+        speed = np.full(len(time), 3.0)
+        speed[1800:1920] = 6.0
+        distance = np.concatenate(([0.0], np.cumsum(speed[:-1])))
+        distance[np.arange(0, 3001, 7)] = np.nan
+        hr = np.full(len(time), 2.5)
+        hr[600:900] = 3.0
+
+        efforts = dict(((effort_type, parameter), value) for effort_type, parameter, value, _ in calculate_best_efforts(time, distance, hr))
+
+        assert round(efforts[('distance', 400)], 1) == round(400 / 6.0, 1)
+        assert round(efforts[('distance', 1000)], 1) == round(120 + 280 / 3.0, 1)
+        assert ('distance', 10000) not in efforts
+        assert round(efforts[('speed', 60)], 3) == 6.0
+        assert round(efforts[('hr', 300)], 2) == 3.0
+        assert round(efforts[('hr', 1200)], 2) == round((300 * 3.0 + 900 * 2.5) / 1200, 2)
+
+    def test_calculate_best_efforts_without_channels(self):
+        time = np.arange(0, 100, 1.0)
+        nan = np.full(len(time), np.nan)
+        assert calculate_best_efforts(time, nan, nan) == []
+        assert calculate_best_efforts(np.array([]), np.array([]), np.array([])) == []
+
+    def test_effort_name(self):
+        assert effort_name('distance', 400) == '400 m'
+        assert effort_name('distance', 5000) == '5 km'
+        assert effort_name('hr', 1200) == '20 min'
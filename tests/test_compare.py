@@ -0,0 +1,49 @@
+# vim: set fileencoding=utf-8 :
+
+from compare import align, distance_profile, COMPARE_COLUMNS
+import numpy as np
+
+
+def _samples(time, **channels):
+    samples = np.empty(len(time), dtype=[(column, float) for column in COMPARE_COLUMNS])
+    samples['time'] = time
+    for column in COMPARE_COLUMNS[1:]:
+        samples[column] = channels.get(column, np.nan)
+    return samples
+
+
+class TestCompare(object):
+
+    def test_align(self):
+        time = np.arange(0, 1001, 1.0)
+        samples1 = _samples(time, distance=time * 4.0, hr=np.full(len(time), 2.0), speed=np.full(len(time), 4.0))
+        samples2 = _samples(time + 50, distance=time * 2.0 + 10, hr=np.full(len(time), 2.5), speed=np.full(len(time), 2.0))
+
+        series = align(samples1, samples2, spacing=10, max_points=50)
+        assert len(series['distance']) == 50
+        assert series['distance'][-1] == 2000
+        assert series['time_1'][-1] == 500
+        assert series['time_2'][-1] == 1000
+        assert series['time_gap'][-1] == 500
+        assert all(round(gap - distance / 4.0, 6) == 0 for gap, distance in zip(series['time_gap'], series['distance']))
+        assert set(series['hr_delta']) == {0.5}
+        assert set(series['speed_delta']) == {-2.0}
+        assert set(series['altitude_1']) == {None}
+
+    def test_align_fewer_grid_points_than_max_points(self):
+        time = np.arange(0, 11, 1.0)
+        samples = _samples(time, distance=time * 3.0)
+        series = align(samples, samples, spacing=5, max_points=500)
+        assert series['distance'] == [0, 5, 10, 15, 20, 25, 30]
+        assert set(series['time_gap']) == {0}
+
+    def test_distance_profile_skips_pauses(self):
+        time = np.array([0, 100, 200, 300], dtype=float)
+        distance = np.array([100, 500, 500, 1000], dtype=float)
+        profile_time, profile_distance = distance_profile(_samples(time, distance=distance))
+        assert profile_time.tolist() == [0, 200, 300]
+        assert profile_distance.tolist() == [0, 400, 900]
+
+    def test_align_without_distance(self):
+        time = np.arange(0, 11, 1.0)
+        assert align(_samples(time), _samples(time, distance=time)) is None
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+
+from elevation import median_filter, savitzky_golay, climbs, raw_ascent_descent, ascent_descent
+import numpy as np
+
+
+def _hill(seed=0):
+    """ 100 m up in 10 minutes and down again at 1 Hz with the noise of a phone's GPS altitude """
+    rng = np.random.RandomState(seed)
+    time = np.arange(1201, dtype=float)
+    altitude = 500 + 100 * np.minimum(time, 1200 - time) / 600.0
+    return time, altitude + rng.normal(0, 3, len(time))
+
+
+def test_median_filter():
+    values = np.array([1.0, 2.0, 50.0, 4.0, 5.0])
+    assert median_filter(values, 3).tolist() == [1.0, 2.0, 4.0, 5.0, 5.0]
+    assert median_filter(values, 1).tolist() == values.tolist()
+
+
+def test_savitzky_golay_keeps_polynomials():
+    values = np.arange(20, dtype=float) ** 2
+    smoothed = savitzky_golay(values, 7)
+    assert np.allclose(smoothed[3:-3], values[3:-3])
+
+
+def test_climbs():
+    altitude = np.array([0.0, 3.0, 1.0, 10.0, 8.0, 12.0, 2.0, 4.0, 0.0])
+    assert climbs(altitude, 5.0) == [(0, 5), (5, 8)]
+    assert climbs(altitude, 20.0) == []
+    assert climbs(np.array([7.0]), 5.0) == []
+
+
+def test_climbs_start_with_descent():
+    altitude = np.array([10.0, 12.0, 0.0, 1.0, 6.0])
+    assert climbs(altitude, 5.0) == [(1, 2), (2, 4)]
+
+
+def test_raw_ascent_descent():
+    assert raw_ascent_descent(np.array([0.0, 10.0, 5.0, np.nan, 100.0, 120.0])) == (30.0, 5.0)
+
+
+def test_ascent_descent_noisy_hill():
+    time, altitude = _hill()
+    raw_ascent, raw_descent = raw_ascent_descent(altitude)
+    assert raw_ascent > 1000
+
+    ascent, ascent_time, descent, descent_time = ascent_descent(time, altitude)
+    assert abs(ascent - 100) < 10
+    assert abs(descent - 100) < 10
+    assert abs(ascent_time - 600) < 60
+    assert abs(descent_time - 600) < 60
+
+
+def test_ascent_descent_sections():
+    # a pause without altitude separates the sections, the jump between them is not counted
+    time = np.arange(9, dtype=float) * 60
+    altitude = np.array([0.0, 100.0, 300.0, 600.0, np.nan, 1200.0, 700.0, 300.0, 0.0])
+    assert ascent_descent(time, altitude) == (600.0, 180.0, 1200.0, 180.0)
+    assert ascent_descent(time, np.full(9, np.nan)) == (0.0, 0.0, 0.0, 0.0)
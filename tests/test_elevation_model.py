@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+
+from elevation_model import ElevationModel, tile_name, VOID
+from gpx_import import fill_missing_altitudes
+from filters import degree_to_radian
+from model import Sample
+import numpy as np
+
+
+def _write_tile(directory, south, west, elevations):
+    np.asarray(elevations, dtype='>i2').tofile(str(directory.join(tile_name(south, west))))
+
+
+def _ramp_tile(directory, south=47, west=8):
+    """ A tile of 5 x 5 samples rising 100 m per row to the north and 10 m per column to the east """
+    rows, columns = np.mgrid[0:5, 0:5]
+    _write_tile(directory, south, west, (4 - rows) * 100 + columns * 10)
+
+
+def test_tile_name():
+    assert tile_name(47, 8) == 'N47E008.hgt'
+    assert tile_name(-34, -71) == 'S34W071.hgt'
+
+
+def test_elevations(tmpdir):
+    _ramp_tile(tmpdir)
+    dem = ElevationModel(str(tmpdir))
+    elevations = dem.elevations([47.0, 47.875, 47.125, 47.5, 47.5, 46.5, np.nan], [8.0, 8.875, 8.125, 8.5, 8.875, 8.5, 8.5])
+    assert np.allclose(elevations[:5], [0.0, 385.0, 55.0, 220.0, 235.0])
+    assert np.isnan(elevations[5:]).all()
+
+
+def test_elevations_next_to_voids(tmpdir):
+    elevations = np.full((5, 5), 100)
+    elevations[2, 2] = VOID
+    _write_tile(tmpdir, 47, 8, elevations)
+    dem = ElevationModel(str(tmpdir))
+    assert np.isnan(dem.elevations([47.45], [8.45])[0])
+    assert dem.elevations([47.1], [8.1])[0] == 100.0
+
+
+def test_open_tiles(tmpdir):
+    for west in range(3):
+        _ramp_tile(tmpdir, 47, west)
+    dem = ElevationModel(str(tmpdir), max_open_tiles=2)
+    dem.elevations([47.5, 47.5, 47.5], [0.5, 1.5, 2.5])
+    assert [path.split('/')[-1] for path in dem._tiles] == ['N47E001.hgt', 'N47E002.hgt']
+
+    dem.tile(47, 1)
+    dem.tile(47, 5)
+    assert [path.split('/')[-1] for path in dem._tiles] == ['N47E001.hgt', 'N47E005.hgt']
+    assert dem.tile(47, 5) is None
+
+
+def test_fill_missing_altitudes(tmpdir):
+    _ramp_tile(tmpdir)
+    samples = [Sample(latitude=degree_to_radian(47.5), longitude=degree_to_radian(8.5)),
+               Sample(latitude=degree_to_radian(47.5), longitude=degree_to_radian(8.5), altitude=1000),
+               Sample(latitude=degree_to_radian(50.5), longitude=degree_to_radian(8.5)),
+               Sample(hr=2.0)]
+    assert fill_missing_altitudes(samples, ElevationModel(str(tmpdir))) == 1
+    assert [sample.altitude for sample in samples] == [220, 1000, None, None]
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+
+from gps_filter import flag_outliers, flag_samples, activity_limits, DEFAULT_LIMITS
+from gpx_import import parse_samples, derive_move_infos_from_samples, GPX_NAMESPACES
+from model import Move, Sample
+from spatial import EARTH_RADIUS
+from lxml import objectify
+from datetime import timedelta
+import numpy as np
+import io
+
+ORIGIN_LATITUDE = np.radians(47.9)
+
+
+def _track(x, y):
+    """ Returns the latitudes and longitudes in radians of points in meters east and north of the origin """
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    return ORIGIN_LATITUDE + y / EARTH_RADIUS, x / (EARTH_RADIUS * np.cos(ORIGIN_LATITUDE))
+
+
+def _running(count=60, seed=0):
+    """ A noisy run at 3 m/s sampled every second """
+    rng = np.random.RandomState(seed)
+    time = np.arange(count, dtype=float)
+    latitude, longitude = _track(3.0 * time + rng.normal(0, 3, count), rng.normal(0, 3, count))
+    return time, latitude, longitude
+
+
+def test_activity_limits():
+    assert activity_limits('Running') == (12.0, 8.0)
+    assert activity_limits('Unknown activity') == DEFAULT_LIMITS
+
+
+def test_flag_outliers_plausible_track():
+    time, latitude, longitude = _running()
+    assert not flag_outliers(time, latitude, longitude, max_speed=12.0, max_acceleration=8.0).any()
+
+
+def test_flag_outliers_spike():
+    time, latitude, longitude = _running()
+    latitude[20], longitude[20] = _track([60.0], [500.0])
+    outliers = flag_outliers(time, latitude, longitude, max_speed=12.0, max_acceleration=8.0)
+    assert np.flatnonzero(outliers).tolist() == [20]
+
+
+def test_flag_outliers_consecutive_spikes():
+    time, latitude, longitude = _running()
+    latitude[20:22], longitude[20:22] = _track([60.0, 63.0], [500.0, 503.0])
+    outliers = flag_outliers(time, latitude, longitude, max_speed=12.0, max_acceleration=8.0)
+    assert np.flatnonzero(outliers).tolist() == [20, 21]
+
+
+def test_flag_outliers_endpoints():
+    time, latitude, longitude = _running()
+    latitude[0], longitude[0] = _track([-1000.0], [0.0])
+    latitude[-1], longitude[-1] = _track([5000.0], [0.0])
+    outliers = flag_outliers(time, latitude, longitude, max_speed=12.0, max_acceleration=8.0)
+    assert np.flatnonzero(outliers).tolist() == [0, len(time) - 1]
+
+
+def test_flag_outliers_detour():
+    # too slow for the speed limit, but turning back within 2 s needs an implausible acceleration
+    time, latitude, longitude = _running()
+    latitude[30], longitude[30] = _track([90.0], [20.0])
+    assert not flag_outliers(time, latitude, longitude, max_speed=30.0, max_acceleration=1000.0).any()
+    outliers = flag_outliers(time, latitude, longitude, max_speed=30.0, max_acceleration=8.0)
+    assert np.flatnonzero(outliers).tolist() == [30]
+
+
+def test_flag_outliers_precision():
+    time, latitude, longitude = _running(10)
+    hdop = np.full(10, 1.0)
+    hdop[3] = 25.0
+    ehpe = np.full(10, np.nan)
+    ehpe[5] = 500.0
+    outliers = flag_outliers(time, latitude, longitude, hdop, ehpe)
+    assert np.flatnonzero(outliers).tolist() == [3, 5]
+
+
+def test_flag_outliers_samples_without_position():
+    time = np.arange(5, dtype=float)
+    latitude, longitude = _track([0.0, 3.0, 6.0, 9.0, 12.0], [0.0] * 5)
+    latitude[2] = longitude[2] = np.nan
+    hdop = np.full(5, 99.0)
+    outliers = flag_outliers(time, latitude, longitude, hdop)
+    assert outliers.tolist() == [True, True, False, True, True]
+
+
+def test_flag_samples():
+    time, latitude, longitude = _running(10)
+    latitude[5], longitude[5] = _track([15.0], [1000.0])
+    samples = []
+    for index in range(10):
+        sample = Sample()
+        sample.time = timedelta(seconds=time[index])
+        sample.latitude, sample.longitude = float(latitude[index]), float(longitude[index])
+        samples.append(sample)
+    samples.insert(3, Sample(time=timedelta(seconds=2.5), hr=2.5))
+
+    assert flag_samples(samples, 'Running') == 1
+    assert [index for index, sample in enumerate(samples) if sample.gps_outlier] == [6]
+    assert samples[3].gps_outlier is None
+
+
+GPX = u'''<?xml version="1.0" encoding="UTF-8"?>
+<gpx version="1.1" xmlns="http://www.topografix.com/GPX/1/1">
+  <trk>
+    <trkseg>
+%s
+    </trkseg>
+  </trk>
+</gpx>
+'''
+
+
+def test_gpx_spike_excluded_from_distance_and_speed():
+    latitude, longitude = _track([0.0, 50.0, 3000.0, 150.0, 200.0], [0.0] * 5)
+    points = u'\n'.join(u'<trkpt lat="%.9f" lon="%.9f"><ele>300</ele><time>2015-01-01T10:00:%02dZ</time></trkpt>' % (np.degrees(lat), np.degrees(lon), 10 * index)
+                        for index, (lat, lon) in enumerate(zip(latitude, longitude)))
+    tree = objectify.parse(io.BytesIO((GPX % points).encode('utf-8'))).getroot()
+
+    move = Move()
+    move.activity = 'Running'
+    samples = parse_samples(tree, move, GPX_NAMESPACES['1.1'], {})
+    derive_move_infos_from_samples(move, samples)
+
+    assert move.gps_outlier_count == 1
+    assert [sample.gps_outlier for sample in samples] == [None, None, True, None, None]
+    assert samples[2].speed is None
+    assert abs(samples[3].speed - 5.0) < 0.1
+    assert abs(move.distance - 200) < 1
+    assert abs(move.speed_max - 5.0) < 0.1
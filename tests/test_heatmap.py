@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+
+from heatmap import tile_coordinates, tile_center, calculate_cells, grid_zoom, ZOOM_LEVELS
+import numpy as np
+
+
+def test_tile_coordinates():
+    # Zurich main station on the OpenStreetMap tiles
+    x, y = tile_coordinates(np.array([47.3779]), np.array([8.5403]), 14)
+    assert (x.tolist(), y.tolist()) == ([8580], [5737])
+
+    x, y = tile_coordinates(np.array([90.0, -90.0]), np.array([-180.0, 180.0]), 2)
+    assert (x.tolist(), y.tolist()) == ([0, 3], [0, 3])
+
+
+def test_tile_center():
+    latitude, longitude = tile_center(14, 8580, 5737)
+    x, y = tile_coordinates(np.array([latitude]), np.array([longitude]), 14)
+    assert (x.tolist(), y.tolist()) == ([8580], [5737])
+
+    assert tile_center(1, 0, 0)[1] == -90.0
+
+
+def test_calculate_cells():
+    latitude = np.array([47.3779, 47.37791, np.nan, 47.3779, -33.8568])
+    longitude = np.array([8.5403, 8.54031, 8.5403, np.nan, 151.2153])
+    assert calculate_cells(latitude, longitude, 14) == [(8580, 5737), (15073, 9831)]
+    assert calculate_cells(np.array([np.nan]), np.array([np.nan]), 14) == []
+
+
+def test_grid_zoom():
+    assert grid_zoom(0) == ZOOM_LEVELS[0]
+    assert grid_zoom(9) == 14
+    assert grid_zoom(18) == ZOOM_LEVELS[-1]
@@ -0,0 +1,56 @@
+# vim: set fileencoding=utf-8 :
+
+from import_profiler import ImportProfile, import_phase, tracemalloc
+import pytest
+
+
+class TestImportProfiler(object):
+
+    def test_phases_outside_of_profile(self):
+        with import_phase('parse samples') as phase:
+            assert phase is None
+
+    def test_phases_are_accumulated(self):
+        with ImportProfile('move.sml') as profile:
+            with import_phase('persist'):
+                pass
+            with import_phase('parse samples'):
+                pass
+            with import_phase('persist'):
+                pass
+
+        assert list(profile.phases.keys()) == ['persist', 'parse samples']
+        assert [phase.name for phase in profile.sorted_phases()] == ['parse samples', 'persist']
+        assert profile.total_duration == sum(phase.duration for phase in profile.phases.values())
+        assert profile.phases['persist'].memory_peak is None
+        assert profile.summary().startswith("import of 'move.sml' took ")
+        assert 'parse samples 0.0' in profile.summary()
+
+        with import_phase('derive') as phase:
+            assert phase is None
+        assert 'derive' not in profile.phases
+
+    def test_nested_profiles(self):
+        with ImportProfile('outer.sml') as outer:
+            with ImportProfile('inner.sml') as inner:
+                with import_phase('derive'):
+                    pass
+            with import_phase('persist'):
+                pass
+
+        assert list(inner.phases.keys()) == ['derive']
+        assert list(outer.phases.keys()) == ['persist']
+
+    @pytest.mark.skipif(tracemalloc is None, reason="requires tracemalloc")
+    def test_memory_peak(self):
+        with ImportProfile('move.sml', trace_memory=True) as profile:
+            with import_phase('parse samples'):
+                data = [bytearray(1024) for _ in range(1024)]
+                del data
+            with import_phase('derive'):
+                pass
+
+        assert not tracemalloc.is_tracing()
+        assert profile.phases['parse samples'].memory_peak >= 1024 * 1024
+        assert profile.phases['derive'].memory_peak < 1024 * 1024
+        assert 'MiB' in profile.summary()
@@ -0,0 +1,50 @@
+# vim: set fileencoding=utf-8 :
+
+from model import JsonEncodedDict, LazyJsonDict
+import json
+import pytest
+
+
+class TestModel(object):
+
+    def test_json_encoded_dict_is_decoded_lazily(self):
+        value = JsonEncodedDict().process_result_value('{"pause": {"state": "True"}}', dialect=None)
+        assert isinstance(value, LazyJsonDict)
+        assert not value.decoded
+
+        assert 'pause' in value
+        assert value.decoded
+        assert value['pause']['state'] == 'True'
+        assert list(value.keys()) == ['pause']
+        assert value == {'pause': {'state': 'True'}}
+        assert repr(value) == repr({'pause': {'state': 'True'}})
+
+    def test_json_encoded_dict_null(self):
+        assert JsonEncodedDict().process_result_value(None, dialect=None) is None
+        assert JsonEncodedDict().process_bind_param(None, dialect=None) is None
+
+    def test_json_encoded_dict_compact(self):
+        value = {'b': [1, 2], 'a': {'c': u'Galtür'}}
+        encoded = JsonEncodedDict(compact=True).process_bind_param(value, dialect=None)
+        assert encoded == '{"a":{"c":"Galt\\u00fcr"},"b":[1,2]}'
+        assert json.loads(JsonEncodedDict().process_bind_param(value, dialect=None)) == value
+
+    def test_json_encoded_dict_keeps_raw_value(self):
+        raw = '{"b": 1, "a": 2}'
+        value = JsonEncodedDict().process_result_value(raw, dialect=None)
+        assert JsonEncodedDict(compact=True).process_bind_param(value, dialect=None) is raw
+        assert not value.decoded
+
+        value['a']
+        assert JsonEncodedDict(compact=True).process_bind_param(value, dialect=None) == '{"a":2,"b":1}'
+
+    def test_json_encoded_dict_encodes_with_standard_library(self):
+        value = {'latitude': 0.1 + 0.2, 'name': u'Galtür', 'values': [1e-7, 12345678.123456789]}
+        assert JsonEncodedDict().process_bind_param(value, dialect=None) == json.dumps(value)
+        assert JsonEncodedDict(compact=True).process_bind_param(value, dialect=None) == json.dumps(value, separators=(',', ':'), sort_keys=True)
+
+    def test_json_encoded_dict_is_decoded_with_ujson(self):
+        ujson = pytest.importorskip('ujson')
+        raw = json.dumps({'pause': {'state': 'True', 'duration': 12.5}, 'values': [1, 2.25, None, u'Galtür']})
+        assert ujson.loads(raw) == json.loads(raw)
+        assert JsonEncodedDict().process_result_value(raw, dialect=None) == json.loads(raw)
@@ -1,14 +1,35 @@
 # vim: set fileencoding=utf-8 :
 
 import openmoves
-from commands import AddUser
-from model import db, User, Move, MoveEdit
+from commands import AddUser, ExportMoves, ProfileImport, RebuildHeatmap, BackfillGpsOutliers, BackfillGpxAscent, BackfillSwimLengths, BackfillMovingTime
+from model import db, User, Move, MoveEdit, Sample, BestEffort, HrZone, SwimLength, Pause, TrainingLoad, HeatCell, Segment, SegmentTraversal
+from export_cache import export_cache
+import sample_reader
+import best_efforts
+import training_load
+import heatmap
+import spatial
+import move_filter
+import segments
+import search
+import resample
+import gpx_import
+from pauses import move_pauses
+from tests.query_budget import QueryCounter, assert_index_backed
+import numpy as np
 from flask import json
+from sqlalchemy.sql import func
+from collections import OrderedDict
 import pytest
 import html5lib
 import re
 import os
-from datetime import timedelta, datetime
+import io
+import zipfile
+import tempfile
+import shutil
+import pstats
+from datetime import timedelta, datetime, date
 from gpx_import import GPX_IMPORT_OPTION_PAUSE_DETECTION, GPX_IMPORT_OPTION_PAUSE_DETECTION_THRESHOLD, GPX_DEVICE_NAME, \
     GPX_ACTIVITY_TYPE, GPX_DEVICE_SERIAL, GPX_SAMPLE_TYPE, GPX_TRK, GPX_IMPORT_PAUSE_TYPE_PAUSE_DETECTION
 
@@ -23,7 +44,17 @@ class TestOpenMoves(object):
         global app
         app = openmoves.init(configfile=None)
         db_uri = 'sqlite:///:memory:'
-        app.config.update(SQLALCHEMY_ECHO=False, WTF_CSRF_ENABLED=False, DEBUG=True, TESTING=True, SQLALCHEMY_DATABASE_URI=db_uri, SECRET_KEY="testing")
+        cls.temporary_dir = tempfile.mkdtemp(prefix='openmoves_test_')
+        app.config.update(SQLALCHEMY_ECHO=False, WTF_CSRF_ENABLED=False, DEBUG=True, TESTING=True, SQLALCHEMY_DATABASE_URI=db_uri, SECRET_KEY="testing",
+                          EXPORT_CACHE_DIR=os.path.join(cls.temporary_dir, 'export_cache'),
+                          PROFILE_DIR=os.path.join(cls.temporary_dir, 'profiles'),
+                          METRICS_ENABLED=True, METRICS_TOKEN='metrics token')
+        os.mkdir(app.config['EXPORT_CACHE_DIR'])
+        os.mkdir(app.config['PROFILE_DIR'])
+
+    @classmethod
+    def teardown_class(cls):
+        shutil.rmtree(cls.temporary_dir)
 
     def setup_method(self, method):
         self.app = app
@@ -248,10 +279,55 @@ class TestOpenMoves(object):
         assert u'<span class="date-time">2014-11-09 15:26:45.314</span>' in response_data
         assert u'<td>00:10:55.32</td>' in response_data
 
+        assert u'<h2>Lengths</h2>' in response_data
+        assert u'<td>01:30.94 min / 100 m</td>' in response_data  # pace of the first length
+
+        # the last pause has no end event, it is shown until the end of the move
+        pauses_table = response_data[response_data.index(u'<h2>Pauses</h2>'):]
+        pauses_table = pauses_table[:pauses_table.index(u'</table>')]
+        assert pauses_table.count(u'<tr>') == 1 + 2
+
         with app.test_request_context():
             move = Move.query.one()
             assert move.recovery_time is None
 
+            # the page reads neither the strokes nor the pause events
+            event_samples = sample_reader.sample_rows(move, ('events',), Sample.events != None)
+            page_events = sample_reader.sample_rows(move, ('events',), openmoves.MOVE_PAGE_EVENTS)
+            assert page_events
+            assert all('swimming' not in sample.events and 'pause' not in sample.events for sample in page_events)
+            assert len(page_events) == len([sample for sample in event_samples
+                                            if 'swimming' not in sample.events and 'pause' not in sample.events])
+
+            # the device counts the duration without the pauses, the last one lasts until the end of the move
+            assert abs(move.moving_time.total_seconds() - move.duration.total_seconds()) < 1
+            pauses = [(pause.start.total_seconds(), pause.end.total_seconds()) for pause in move.pauses.order_by(Pause.start.asc())]
+            assert len(pauses) == 2
+            assert pauses[0] == (1236.991, 1892.314)
+
+            # the pauses of moves imported before they were stored, the last one is not ended by an event
+            moving_time, move.moving_time = move.moving_time, None
+            assert move_pauses(move) == pauses
+            move.moving_time = moving_time
+
+            Pause.query.delete()
+            move.moving_time = None
+            assert BackfillMovingTime(lambda: app.test_request_context()).update(move).endswith(", 2 pauses")
+            db.session.commit()
+            assert move.pauses.count() == 2
+
+            swim_lengths = move.swim_lengths.order_by(SwimLength.start.asc()).all()
+            assert len(swim_lengths) == 60
+            assert (swim_lengths[0].number, swim_lengths[0].strokes, swim_lengths[0].style, swim_lengths[0].swolf) == (1, 12, 'Freestyle', 35)
+            assert [swim_length.style for swim_length in swim_lengths[1:3]] == ['Breaststroke', 'Breaststroke']
+            assert 46 in [swim_length.number for swim_length in swim_lengths]
+            assert all(swim_length.start.total_seconds() < 1236.991 or swim_length.start.total_seconds() > 1892.314 for swim_length in swim_lengths)
+
+            SwimLength.query.delete()
+            assert BackfillSwimLengths(lambda: app.test_request_context()).update(move) == "60 lengths"
+            db.session.commit()
+            assert move.swim_lengths.count() == 60
+
     def test_import_move_upload_multiple(self, tmpdir):
         self._login()
         data = {}
@@ -301,27 +377,36 @@ class TestOpenMoves(object):
             assert move.activity == GPX_ACTIVITY_TYPE
             assert move.date_time == datetime(2015, 1, 1, 10, 0, 0 , 0)
             assert move.duration == timedelta(minutes=18)
+            assert move.moving_time == move.duration
+            assert move.pauses.count() == 1
             assert int(move.distance) == 1800
             assert move.log_item_count == 8 + 2  # 2 entries for the pause events
             assert move.log_item_count == move.samples.count()
 
             # Altitudes
-            assert move.altitude_max == move.samples[4].altitude
-            assert move.altitude_max == move.samples[4].gps_altitude
-            assert move.altitude_min == move.samples[0].altitude
-            assert move.altitude_min == move.samples[7].altitude
+            assert move.altitude_max == move.samples.order_by(Sample.id)[4].altitude
+            assert move.altitude_max == move.samples.order_by(Sample.id)[4].gps_altitude
+            assert move.altitude_min == move.samples.order_by(Sample.id)[0].altitude
+            assert move.altitude_min == move.samples.order_by(Sample.id)[7].altitude
             assert move.ascent == 600
             assert move.descent == 1200
             assert move.ascent_time == timedelta(minutes=6) - timedelta(microseconds=1)
             assert move.descent_time == timedelta(minutes=12) - timedelta(microseconds=1)
+            assert (move.ascent_raw, move.descent_raw) == (600, 1200)
+
+            move.ascent = move.ascent_raw = None
+            assert BackfillGpxAscent(lambda: app.test_request_context()).update(move) == "ascent 600 m (raw 600 m), descent 1200 m (raw 1200 m)"
+            assert move.ascent == 600
+            assert move.ascent_time == timedelta(minutes=6) - timedelta(microseconds=1)
+            db.session.commit()
 
             # Speed
             assert round(move.speed_avg, 1) == round(6 / 3.6, 1)
             assert round(move.speed_max, 1) == round(30 / 3.6, 1)
-            assert move.speed_max == move.samples[5].speed
+            assert move.speed_max == move.samples.order_by(Sample.id)[5].speed
 
             # Pause events
-            events = [sample for sample in move.samples if sample.events]
+            events = [sample for sample in move.samples.order_by(Sample.id) if sample.events]
             assert len(events) == 2
             start_pause_sample = events[0].events['pause']
             assert start_pause_sample['state'].lower() == 'true'
@@ -402,15 +487,17 @@ class TestOpenMoves(object):
             assert move.device.serial_number == GPX_DEVICE_SERIAL
             assert move.date_time == datetime(2015, 1, 1, 10, 0, 0 , 0)
             assert move.duration == timedelta(minutes=18 - 8)  # 8min by pause detection
+            assert move.moving_time == move.duration
+            assert move.pauses.count() == 2  # 1 pause by pause detection
             assert int(move.distance) == 1800 - 400  # 400m by pause detection
             assert move.log_item_count == 8 + 4  # 4 entries for the pause events
             assert move.log_item_count == move.samples.count()
 
             # Attention: samples are not sorted by UTC
-            assert move.altitude_max == move.samples[4].altitude
-            assert move.altitude_max == move.samples[4].gps_altitude
-            assert move.altitude_min == move.samples[0].altitude
-            assert move.altitude_min == move.samples[9].altitude
+            assert move.altitude_max == move.samples.order_by(Sample.id)[4].altitude
+            assert move.altitude_max == move.samples.order_by(Sample.id)[4].gps_altitude
+            assert move.altitude_min == move.samples.order_by(Sample.id)[0].altitude
+            assert move.altitude_min == move.samples.order_by(Sample.id)[9].altitude
             assert move.ascent == 600
             assert move.descent == 1200 - 400  # 400m by pause_detection
             assert move.ascent_time == timedelta(minutes=6) - timedelta(microseconds=1)
@@ -419,10 +506,10 @@ class TestOpenMoves(object):
             # Speed
             assert round(move.speed_avg, 1) == round(8.4 / 3.6, 1)
             assert round(move.speed_max, 1) == round(30 / 3.6, 1)
-            assert move.speed_max == move.samples[5].speed
+            assert move.speed_max == move.samples.order_by(Sample.id)[5].speed
 
             # Pause events
-            events = [sample for sample in move.samples if sample.events]
+            events = [sample for sample in move.samples.order_by(Sample.id) if sample.events]
             assert len(events) == 2 + 2  # 2 pauses by pause_detection
             start_pause_sample = events[2].events['pause']
             assert start_pause_sample['state'].lower() == 'true'
@@ -448,6 +535,32 @@ class TestOpenMoves(object):
             assert int(float(end_pause_sample['distance'])) == 0
             assert end_pause_sample['type'] == GPX_IMPORT_PAUSE_TYPE_PAUSE_DETECTION
 
+            # the distances and speeds accumulated again are the ones of the import
+            imported = sample_reader.sample_array(move, ('distance', 'speed'), Sample.latitude != None)
+            imported_speed_max = move.speed_max
+            gpx_import.update_distances(move)
+            assert np.allclose(sample_reader.sample_array(move, ('distance', 'speed'), Sample.latitude != None).tolist(), imported.tolist())
+            assert int(move.distance) == 1800 - 400
+            # the pause events shifted the times of their neighbours by 1 µs
+            assert abs(move.speed_max - imported_speed_max) < 1e-3
+
+            # the fastest sample is left out of the track as GPS outlier
+            fastest = move.samples.order_by(Sample.id)[5]
+            fastest.gps_outlier = True
+            db.session.flush()
+            gpx_import.update_distances(move)
+            db.session.refresh(fastest)
+            assert fastest.speed is None
+            assert move.distance < 1800 - 400
+            assert move.speed_max < imported_speed_max
+            assert move.speed_avg == move.distance / move.duration.total_seconds()
+
+            fastest.gps_outlier = None
+            assert BackfillGpsOutliers(lambda: app.test_request_context()).update(move) == "0 GPS outliers, distance 1400 m"
+            assert abs(move.speed_max - imported_speed_max) < 1e-3
+            assert move.best_efforts.count() > 0
+            db.session.commit()
+
     def test_import_move_already_exists(self, tmpdir):
         self._login()
         data = {}
@@ -521,6 +634,298 @@ class TestOpenMoves(object):
                 assert u"<title>OpenMoves – Move %d</title>" % move.id in response_data
                 assert u">%s</" % move.activity in response_data
 
+    def test_move_splits(self, tmpdir):
+        self._login()
+        response = self.client.get('/moves/2/splits')
+        data = self._validate_response(response, tmpdir)
+        assert [splits['name'] for splits in data['splits']] == ['1 km', '1 mi']
+
+        kilometer_splits = data['splits'][0]['splits']
+        assert [split['split'] for split in kilometer_splits] == [1, 2, 3]
+        assert [split['distance'] for split in kilometer_splits] == [1000, 2000, 2217]
+        assert [split['length'] for split in kilometer_splits[1:]] == [1000, 217]
+        assert round(kilometer_splits[1]['duration'], 2) == 1036.28
+        assert kilometer_splits[1]['start'] == kilometer_splits[0]['start'] + kilometer_splits[0]['duration']
+        assert [(split['ascent'], split['descent']) for split in kilometer_splits] == [(57, 5), (10, 61), (3, 2)]
+        assert kilometer_splits[0]['hr_avg'] is None
+
+        response = self.client.get('/moves/2/splits', headers={'If-None-Match': response.headers['ETag']})
+        assert response.status_code == 304
+
+        response = self.client.get('/moves/2')
+        response_data = self._validate_response(response, tmpdir)
+        assert u'<h2>Splits (1 km)</h2>' in response_data
+        assert u'<h2>Splits (1 mi)</h2>' in response_data
+        assert re.search(u'<td>2</td>\\s*<td>2.00 km</td>\\s*<td>00:17:16.28</td>\\s*<td><span>3.5 km/h</span></td>', response_data)
+
+        response = self.client.get('/moves/1/splits')
+        data = self._validate_response(response, tmpdir)
+        assert [splits['name'] for splits in data['splits']] == ['25 m']
+        assert all(split['length'] == 25 for split in data['splits'][0]['splits'])
+
+        cache_dir = app.config['EXPORT_CACHE_DIR']
+        assert [filename for filename in os.listdir(cache_dir) if filename.startswith('1_') and filename.endswith('.splits_25.json')]
+        assert [filename for filename in os.listdir(cache_dir) if filename.startswith('2_') and filename.endswith('.splits_1609.34.json')]
+
+    def test_sample_reader(self, tmpdir):
+        with app.test_request_context():
+            move = Move.query.filter(Move.id == 2).one()
+            samples = move.samples.order_by(Sample.time.asc(), Sample.id.asc()).all()
+
+            rows = sample_reader.sample_rows(move)
+            assert len(rows) == len(samples)
+            for row, sample in zip(rows, samples):
+                for column in sample_reader.DEFAULT_COLUMNS:
+                    assert getattr(row, column) == getattr(sample, column)
+                assert not hasattr(row, 'events')
+
+            rows = sample_reader.sample_rows(move, ('time', 'events'), Sample.events != None)
+            assert [row.events for row in rows] == [sample.events for sample in samples if sample.events]
+
+            array = sample_reader.sample_array(move, ('time', 'hr', 'altitude', 'utc', 'sample_type'))
+            assert array.dtype.names == ('time', 'hr', 'altitude', 'utc', 'sample_type')
+            assert len(array) == len(samples)
+            assert array['time'][-1] == samples[-1].time.total_seconds()
+            assert np.count_nonzero(~np.isnan(array['altitude'])) == len([sample for sample in samples if sample.altitude is not None])
+            assert list(array['sample_type']) == [sample.sample_type for sample in samples]
+
+    def test_move_page_conditional_request(self, tmpdir):
+        self._login()
+        response = self.client.get('/moves/2')
+        self._validate_response(response, tmpdir)
+        etag = response.headers['ETag']
+        last_modified = response.headers['Last-Modified']
+        assert etag
+        assert last_modified
+        assert 'private' in response.headers['Cache-Control']
+
+        response = self.client.get('/moves/2', headers={'If-None-Match': etag})
+        assert response.status_code == 304
+        assert response.data == b''
+        assert response.headers['ETag'] == etag
+
+        response = self.client.get('/moves/2', headers={'If-Modified-Since': last_modified})
+        assert response.status_code == 304
+
+        response = self.client.get('/moves/2', headers={'If-None-Match': '"some other etag"'})
+        self._validate_response(response, tmpdir)
+
+        response = self.client.get('/moves/3', headers={'If-None-Match': etag})
+        self._validate_response(response, tmpdir)
+        assert response.headers['ETag'] != etag
+
+    def test_profile_import(self, tmpdir):
+        with app.test_request_context():
+            move_count = Move.query.count()
+
+        filename = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'baerensee_testtrack.gpx')
+        profile = ProfileImport(app.test_request_context).run(filename, trace_memory=False)
+        assert [phase.name for phase in profile.sorted_phases()] == ['parse samples', 'filter', 'derive', 'geocode', 'persist']
+
+        # gzip files are decompressed while they are parsed
+        filename = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'CAFEBABECAFEBABE-2014-11-09T14_55_13-0.sml.gz')
+        profile = ProfileImport(app.test_request_context).run(filename, trace_memory=False)
+        assert [phase.name for phase in profile.sorted_phases()] == ['parse header', 'parse samples', 'filter', 'derive', 'persist']
+        assert profile.phases['parse header'].duration > 0
+
+        # imported into a throwaway database
+        with app.test_request_context():
+            assert Move.query.count() == move_count
+            assert User.query.filter_by(username='profile-import').count() == 0
+
+    def test_backfill_changes_validators(self, tmpdir):
+        self._login()
+        response = self.client.get('/moves/2')
+        etag = response.headers['ETag']
+        response = self.client.get('/moves/2/export?format=csv')
+        assert response.status_code == 200
+        cache_dir = app.config['EXPORT_CACHE_DIR']
+        assert [filename for filename in os.listdir(cache_dir) if filename.startswith('2_')]
+
+        BackfillMovingTime(app.app_context).run(username='test_user', recalculate=True)
+
+        assert not [filename for filename in os.listdir(cache_dir) if filename.startswith('2_')]
+        response = self.client.get('/moves/2', headers={'If-None-Match': etag})
+        self._validate_response(response, tmpdir)
+        assert response.headers['ETag'] != etag
+
+    def _get_metrics(self):
+        response = self.client.get('/_metrics', environ_base={'REMOTE_ADDR': '127.0.0.1'}, headers={'Authorization': 'Bearer metrics token'})
+        assert response.status_code == 200
+        assert response.mimetype == 'text/plain'
+        metric_values = {}
+        for line in response.data.decode('utf-8').splitlines():
+            if not line.startswith('#'):
+                name, value = line.rsplit(' ', 1)
+                metric_values[name] = float(value)
+        return metric_values
+
+    def test_metrics(self, tmpdir):
+        self._login()
+        metrics_before = self._get_metrics()
+        response = self.client.get('/moves/2')
+        self._validate_response(response, tmpdir)
+        metrics_after = self._get_metrics()
+
+        def delta(name):
+            return metrics_after.get(name, 0) - metrics_before.get(name, 0)
+
+        assert delta('openmoves_requests_total{endpoint="move",status="200"}') == 1
+        assert delta('openmoves_request_duration_seconds_count{endpoint="move"}') == 1
+        assert delta('openmoves_request_duration_seconds_bucket{endpoint="move",le="+Inf"}') == 1
+        assert delta('openmoves_request_duration_seconds_sum{endpoint="move"}') > 0
+        assert delta('openmoves_sql_statements_total{endpoint="move"}') > 0
+        assert delta('openmoves_template_duration_seconds_total{endpoint="move"}') > 0
+        assert delta('openmoves_response_size_bytes_total{endpoint="move"}') == len(response.data)
+
+    def test_metrics_access(self, tmpdir):
+        response = self.client.get('/_metrics', environ_base={'REMOTE_ADDR': '192.0.2.1'}, headers={'Authorization': 'Bearer metrics token'})
+        assert response.status_code == 404
+
+        # eg. proxied requests
+        response = self.client.get('/_metrics', environ_base={'REMOTE_ADDR': '127.0.0.1'})
+        assert response.status_code == 404
+        response = self.client.get('/_metrics', environ_base={'REMOTE_ADDR': '127.0.0.1'}, headers={'Authorization': 'Bearer wrong token'})
+        assert response.status_code == 404
+
+        self._login()
+        response = self.client.get('/_metrics', environ_base={'REMOTE_ADDR': '127.0.0.1'})
+        assert response.status_code == 404
+
+        app.config.update(ADMIN_USERS=['test_user'])
+        try:
+            response = self.client.get('/_metrics', environ_base={'REMOTE_ADDR': '127.0.0.1'})
+            assert response.status_code == 200
+        finally:
+            app.config.update(ADMIN_USERS=None)
+
+    def test_slow_request_log(self, tmpdir):
+        self._login()
+        messages = []
+        app.logger.warning = messages.append
+        app.config.update(SLOW_REQUEST_THRESHOLD=1e-9)
+        try:
+            response = self.client.get('/moves/2')
+            self._validate_response(response, tmpdir)
+        finally:
+            app.config.update(SLOW_REQUEST_THRESHOLD=None)
+            del app.logger.warning
+
+        assert len(messages) == 1
+        assert messages[0].startswith('slow request: GET /moves/2 took')
+        assert 'FROM sample' in messages[0]
+
+    def test_request_profiling_requires_admin(self, tmpdir):
+        self._login()
+        response = self.client.get('/moves/2?_profile=1')
+        self._validate_response(response, tmpdir)
+        assert 'X-Profile-Name' not in response.headers
+        assert os.listdir(app.config['PROFILE_DIR']) == []
+
+        response = self.client.get('/_profiles')
+        assert response.status_code == 404
+
+    def test_request_profiling(self, tmpdir):
+        self._login()
+        app.config.update(ADMIN_USERS=['test_user'], PROFILE_MAX_FILES=2)
+        try:
+            response = self.client.get('/moves/2?_profile=1')
+            self._validate_response(response, tmpdir)
+            name = response.headers['X-Profile-Name']
+            assert name.endswith('_moves_2')
+
+            response = self.client.get('/moves', headers={'X-Profile': '1'})
+            self._validate_response(response, tmpdir)
+            assert response.headers['X-Profile-Name'] != name
+
+            response = self.client.get('/_profiles')
+            response_data = self._validate_response(response, tmpdir)
+            assert u'http://localhost/moves/2?_profile=1' in response_data
+            assert u'openmoves.py' in response_data
+
+            response = self.client.get('/_profiles/%s.prof' % name)
+            assert response.status_code == 200
+            assert response.headers['Content-Disposition'] == 'attachment; filename=%s.prof' % name
+            profile_path = str(tmpdir.join('profile.prof'))
+            with open(profile_path, 'wb') as f:
+                f.write(response.data)
+            assert pstats.Stats(profile_path).total_tt > 0
+
+            response = self.client.get('/dashboard?_profile=1')
+            self._validate_response(response, tmpdir)
+            assert len(os.listdir(app.config['PROFILE_DIR'])) == 2 * 2  # profile and metadata of the 2 most recent requests
+            response = self.client.get('/_profiles/%s.prof' % name)
+            assert response.status_code == 404
+        finally:
+            app.config.update(ADMIN_USERS=None, PROFILE_MAX_FILES=50)
+
+    def test_query_budgets(self, tmpdir):
+        self._login()
+        # the budgets of the first request generating the exports, splits and channels and of the requests reading them from the cache
+        query_budgets = OrderedDict([
+            ('/dashboard?start_date=2014-01-01&end_date=2015-12-31', (3, 3)),
+            ('/moves?start_date=2014-01-01&end_date=2015-12-31', (14, 14)),
+            # the first request of a move page reads the samples for its splits and its channels
+            ('/moves/1', (12, 9)),  # pool swimming, reads its stored lengths
+            ('/moves/2', (11, 8)),  # the move pages read the stored pauses and the other events
+            ('/moves/3', (11, 8)),
+            ('/moves/2/export?format=csv', (6, 6)),
+            ('/moves/2/export?format=gpx', (6, 6)),
+            ('/moves/2,3/export?format=gpx', (7, 7)),
+            ('/activity_types', (4, 4)),
+            ('/moves/compare/2,3/series', (13, 9)),  # the first request resamples both moves
+        ])
+
+        with app.app_context():
+            engine = db.engine
+
+        cache_dir = app.config['EXPORT_CACHE_DIR']
+        for url, (uncached_budget, cached_budget) in query_budgets.items():
+            for filename in os.listdir(cache_dir):
+                os.remove(os.path.join(cache_dir, filename))
+
+            for budget, description in ((uncached_budget, 'uncached'), (cached_budget, 'cached')):
+                with QueryCounter(engine) as query_counter:
+                    response = self.client.get(url)
+                    response.get_data()
+                assert response.status_code == 200, url
+                query_counter.assert_max(budget, "%s (%s)" % (url, description))
+
+    def test_hot_queries_use_indexes(self, tmpdir):
+        with app.test_request_context():
+            move = Move.query.filter(Move.id == 2).one()
+
+            assert_index_backed(db.session, move.samples.order_by(Sample.time.asc(), Sample.id.asc()))
+            assert_index_backed(db.session, sample_reader._query(move, sample_reader.DEFAULT_COLUMNS, ()))
+            assert_index_backed(db.session, Move.query.filter_by(user=move.user)
+                                                      .filter(Move.date_time >= datetime(2014, 1, 1))
+                                                      .filter(Move.date_time < datetime(2015, 1, 1))
+                                                      .order_by(Move.date_time.desc()))
+            assert_index_backed(db.session, db.session.query(func.max(MoveEdit.date_time)).filter(MoveEdit.move_id == move.id))
+            assert_index_backed(db.session, best_efforts.personal_record_query(move.user, 'Running', 'distance', 1000))
+            assert_index_backed(db.session, best_efforts.personal_record_query(move.user, 'Running', 'hr', 300))
+            assert_index_backed(db.session, Move.query.filter_by(user=move.user).filter(spatial.near_criterion(move.user_id, 50.72, 7.13, 2000)))
+            assert_index_backed(db.session, Move.query.filter_by(user=move.user).filter(spatial.bounds_criterion(move.user_id, 45, 5, 52, 10)))
+            assert_index_backed(db.session, heatmap.cells_query(move.user, 14, 6.0, 50.0, 7.0, 51.0))
+            assert_index_backed(db.session, training_load.daily_loads_query(move.user, date(2014, 1, 1), date(2015, 12, 31)))
+
+            with pytest.raises(AssertionError):
+                assert_index_backed(db.session, Move.query.filter(Move.activity == 'Trekking'))
+
+    def test_export_conditional_request(self, tmpdir):
+        self._login()
+        response = self.client.get('/moves/3/export?format=gpx')
+        self._validate_response(response, tmpdir, check_content=False)
+        gpx_etag = response.headers['ETag']
+        assert 'private' in response.headers['Cache-Control']
+
+        response = self.client.get('/moves/3/export?format=gpx', headers={'If-None-Match': gpx_etag})
+        assert response.status_code == 304
+
+        response = self.client.get('/moves/3/export?format=csv', headers={'If-None-Match': gpx_etag})
+        self._validate_response(response, tmpdir, check_content=False)
+        assert response.headers['ETag'] != gpx_etag
+
     def test_csv_export_filename(self, tmpdir):
         self._login()
         response = self.client.get('/moves/1/export?format=csv')
@@ -559,6 +964,107 @@ class TestOpenMoves(object):
         response = self.client.get('/moves/3/export?format=gpx')
         assert response.headers['Content-Disposition'] == u'attachment; filename=Move_2014-07-23T18_56_14_AT_Galt%C3%BCr_Cycling.gpx'
 
+    def test_export_moves_not_logged_in(self, tmpdir):
+        self._assert_requires_login('/moves/export')
+        response = self.client.get('/moves/1,2/export')
+        assert response.status_code == 302
+
+    def test_export_moves_not_found(self, tmpdir):
+        self._login()
+        response = self.client.get('/moves/1,99/export')
+        self._validate_response(response, code=404, check_content=False)
+
+        for ids in ('1,abc', '1,,2', '1,', ',', '1;2'):
+            response = self.client.get('/moves/%s/export?format=csv' % ids)
+            assert response.status_code == 400, ids
+            response = self.client.get('/moves/%s/delete' % ids)
+            assert response.status_code == 400, ids
+
+    def test_export_moves_zip(self, tmpdir):
+        self._login()
+        response = self.client.get('/moves/1,2,3/export?format=csv')
+        assert response.status_code == 200
+        assert response.mimetype == 'application/zip'
+        assert response.headers['Content-Disposition'] == 'attachment; filename=Moves_2014-07-23_2014-12-31.csv.zip'
+
+        archive = zipfile.ZipFile(io.BytesIO(response.data))
+        assert archive.testzip() is None
+        assert sorted(archive.namelist()) == [u'Move_2014-07-23T18_56_14_AT_Galtür_Cycling.csv',
+                                              u'Move_2014-11-09T14_55_13_Pool swimming.csv',
+                                              u'Move_2014-12-31T12_00_32_DE_Stegen_Trekking.csv']
+
+        with app.test_request_context():
+            move = Move.query.filter(Move.id == 2).one()
+            lines = archive.read(u'Move_2014-12-31T12_00_32_DE_Stegen_Trekking.csv').decode('utf-8').split('\r\n')
+            assert 'Timestamp;Duration;Latitude' in lines[0]
+            assert len(lines) == move.samples.count() + 1
+
+    def test_export_moves_zip_skips_moves_without_gps(self, tmpdir):
+        self._login()
+        response = self.client.get('/moves/1,3/export?format=gpx')
+        archive = zipfile.ZipFile(io.BytesIO(response.data))
+        assert archive.namelist() == [u'Move_2014-07-23T18_56_14_AT_Galtür_Cycling.gpx']
+
+    def test_export_moves_in_date_range(self, tmpdir):
+        self._login()
+        response = self.client.get('/moves/export?start_date=2014-11-01&end_date=2014-12-31&format=csv')
+        assert response.status_code == 200
+        assert response.headers['Content-Disposition'] == 'attachment; filename=Moves_2014-11-01_2014-12-31.csv.zip'
+
+        archive = zipfile.ZipFile(io.BytesIO(response.data))
+        assert archive.namelist() == [u'Move_2014-11-09T14_55_13_Pool swimming.csv',
+                                      u'Move_2014-12-31T12_00_32_DE_Stegen_Trekking.csv']
+
+    def test_export_moves_command(self, tmpdir):
+        filename = str(tmpdir.join("export.zip"))
+        cmd = ExportMoves(lambda: app.test_request_context())
+        cmd.run(username='test_user', filename=filename, format='csv')
+
+        archive = zipfile.ZipFile(filename)
+        assert archive.testzip() is None
+        with app.test_request_context():
+            user = User.query.filter_by(username='test_user').one()
+            assert len(archive.namelist()) == Move.query.filter_by(user=user).count()
+
+    def test_export_cache(self, tmpdir):
+        self._login()
+        cache_dir = app.config['EXPORT_CACHE_DIR']
+
+        response = self.client.get('/moves/3/export?format=gpx')
+        first_response_data = self._validate_response(response, tmpdir, check_content=False)
+        assert response.mimetype == 'application/gpx+xml'
+        assert 'public' not in response.headers['Cache-Control']
+
+        cached_files = [filename for filename in os.listdir(cache_dir) if filename.startswith('3_') and filename.endswith('.gpx')]
+        assert len(cached_files) == 1
+
+        response = self.client.get('/moves/3/export?format=gpx')
+        assert self._validate_response(response, tmpdir, check_content=False) == first_response_data
+        assert [filename for filename in os.listdir(cache_dir) if filename.startswith('3_') and filename.endswith('.gpx')] == cached_files
+
+    def test_export_cache_eviction(self, tmpdir):
+        cache_dir = str(tmpdir.join('export_cache'))
+        previous_config = dict((key, app.config[key]) for key in ('EXPORT_CACHE_DIR', 'EXPORT_CACHE_MAX_SIZE'))
+        with app.test_request_context():
+            app.config.update(EXPORT_CACHE_DIR=cache_dir, EXPORT_CACHE_MAX_SIZE=1)
+            try:
+                move1 = Move.query.filter(Move.id == 1).one()
+                move2 = Move.query.filter(Move.id == 2).one()
+
+                path1 = export_cache.put(move1, 'csv', u'some data')
+                assert export_cache.get(move1, 'csv') == path1
+
+                path2 = export_cache.put(move2, 'csv', u'some other data')
+                assert export_cache.get(move2, 'csv') == path2
+                assert export_cache.get(move1, 'csv') is None
+                assert os.listdir(cache_dir) == [os.path.basename(path2)]
+
+                export_cache.invalidate(move2.id)
+                assert export_cache.get(move2, 'csv') is None
+                assert os.listdir(cache_dir) == []
+            finally:
+                app.config.update(previous_config)
+
     def test_move_with_heart_rate(self, tmpdir):
         self._login()
         data = {}
@@ -601,6 +1107,28 @@ class TestOpenMoves(object):
         assert u'>Running</' in response_data
         assert filename in response_data
 
+    def test_records_not_logged_in(self, tmpdir):
+        self._assert_requires_login('/records')
+
+    def test_records(self, tmpdir):
+        self._login()
+        response = self.client.get('/records')
+        response_data = self._validate_response(response, tmpdir)
+        assert u'<title>OpenMoves – Records</title>' in response_data
+        assert u'<h4>Running</h4>' in response_data
+        assert u'<h4>Pool swimming</h4>' in response_data
+        assert re.search(u'<td>Fastest 1 km</td>\\s*<td>00:06:14.33</td>\\s*<td><a href="/moves/6">', response_data)
+        assert re.search(u'<td>Fastest 10 km</td>\\s*<td>00:19:42.00</td>\\s*<td><a href="/moves/3">', response_data)
+        assert re.search(u'<td>Best heart rate over 1 min</td>\\s*<td><span>158 bpm</span></td>\\s*<td><a href="/moves/5">', response_data)
+
+        with app.test_request_context():
+            running = Move.query.filter_by(activity='Running').one()
+            efforts = dict(((best_effort.type, best_effort.parameter), best_effort) for best_effort in running.best_efforts)
+            assert ('hr', 60) not in efforts
+            assert round(efforts[('distance', 1000)].value, 3) == 374.333
+            assert efforts[('distance', 5000)].value < efforts[('distance', 10000)].value / 2
+            assert efforts[('speed', 60)].value >= efforts[('speed', 300)].value >= efforts[('speed', 1200)].value
+
     def test_activity_types_not_logged_in(self, tmpdir):
         self._assert_requires_login('/activity_types')
 
@@ -615,6 +1143,9 @@ class TestOpenMoves(object):
 
         assert response_data == expected_data
 
+        response = self.client.get('/activity_types', headers={'If-None-Match': response.headers['ETag']})
+        assert response.status_code == 304
+
     def test_edit_move_not_logged_in(self, tmpdir):
         self._assert_requires_login("/moves/1", method='POST')
 
@@ -675,10 +1206,18 @@ class TestOpenMoves(object):
     def test_edit_move_activity_success(self, tmpdir):
         self._login()
 
+        cache_dir = app.config['EXPORT_CACHE_DIR']
+        self.client.get('/moves/1/export?format=csv')
+        assert [filename for filename in os.listdir(cache_dir) if filename.startswith('1_')]
+
+        etag = self.client.get('/moves/1').headers['ETag']
+
         data = {'name': 'activity', 'pk': 1, 'value': 'Trekking'}
         response = self.client.post('/moves/1', data=data)
         response_data = self._validate_response(response, check_content=False)
         assert response_data == 'OK'
+        assert not [filename for filename in os.listdir(cache_dir) if filename.startswith('1_')]
+        assert self.client.get('/moves/1', headers={'If-None-Match': etag}).status_code == 200
 
         with app.test_request_context():
             move_edit = MoveEdit.query.one()
@@ -686,6 +1225,373 @@ class TestOpenMoves(object):
             assert move_edit.move_id == 1
             assert move_edit.old_value == {'activity': 'Pool swimming', 'activity_type': 6}
             assert move_edit.new_value == {'activity': 'Trekking', 'activity_type': 11}
+            assert set(activity for activity, in db.session.query(BestEffort.activity).filter_by(move_id=1)) == {'Trekking'}
+
+    def test_training_load(self, tmpdir):
+        self._login()
+
+        response = self.client.get('/moves/5')
+        response_data = self._validate_response(response, tmpdir)
+        assert u'<h2>Heart Rate Zones</h2>' in response_data
+        assert re.search(u'<td>4</td>\\s*<td>\u2265 <span>152 bpm</span></td>\\s*<td>00:01:10.00</td>', response_data)
+
+        response = self.client.get('/moves/2')
+        response_data = self._validate_response(response, tmpdir)
+        assert u'<h2>Heart Rate Zones</h2>' not in response_data
+
+        with app.test_request_context():
+            move = Move.query.filter_by(id=5).one()
+            assert round(sum(hr_zone.duration for hr_zone in move.hr_zones)) == 6559
+            loads = dict(((training_load.date, training_load.activity), training_load.load) for training_load in TrainingLoad.query)
+            assert round(loads[(date(2014, 11, 2), 'Kayaking')], 1) == 73.2
+
+        response = self.client.get('/dashboard?start_date=2014-11-01&end_date=2014-11-30')
+        response_data = self._validate_response(response, tmpdir)
+        assert u'daily_load.push([Date.UTC(2014, 10, 2), 73.2]);' in response_data
+        assert u'acute_load.push([Date.UTC(2014, 10, 8), 10.5]);' in response_data
+        assert u'acute_load.push([Date.UTC(2014, 10, 9), 0.0]);' in response_data
+
+        response = self.client.post('/moves/5', data={'name': 'activity', 'pk': 5, 'value': 'Running'})
+        assert self._validate_response(response, check_content=False) == 'OK'
+        with app.test_request_context():
+            assert [training_load.activity for training_load in TrainingLoad.query.filter_by(date=date(2014, 11, 2))] == ['Running']
+
+    def test_heatmap(self, tmpdir):
+        self._login()
+        response = self.client.get('/heatmap')
+        response_data = self._validate_response(response, tmpdir)
+        assert u'<title>OpenMoves – Heatmap</title>' in response_data
+        assert u'<li class="active"><a href="/heatmap">Heatmap</a></li>' in response_data
+
+        with app.test_request_context():
+            counts = dict(((heat_cell.x, heat_cell.y), heat_cell.count) for heat_cell in HeatCell.query.filter_by(zoom=8))
+            assert counts == {(132, 86): 1, (133, 85): 1, (133, 86): 3, (133, 89): 1, (134, 88): 1}
+            assert set(zoom for zoom, in db.session.query(HeatCell.zoom).distinct()) == set(heatmap.ZOOM_LEVELS)
+            total_cells = HeatCell.query.count()
+
+        RebuildHeatmap(lambda: app.test_request_context()).run(username='test_user')
+        with app.test_request_context():
+            assert HeatCell.query.count() == total_cells
+            assert dict(((heat_cell.x, heat_cell.y), heat_cell.count) for heat_cell in HeatCell.query.filter_by(zoom=8)) == counts
+
+        response = self.client.get('/heatmap/cells?bbox=-180,-85,180,85&zoom=2')
+        assert response.mimetype == 'application/geo+json'
+        response_data = json.loads(response.get_data(as_text=True))
+        assert response_data['type'] == 'FeatureCollection'
+        assert response_data['zoom'] == 8
+        assert sorted(feature['properties']['count'] for feature in response_data['features']) == [1, 1, 1, 1, 3]
+
+        response = self.client.get('/heatmap/cells?bbox=6.0,50.0,7.0,51.0&zoom=3')
+        response_data = json.loads(response.get_data(as_text=True))
+        assert [feature['geometry']['coordinates'] for feature in response_data['features']] == [[6.328125, 50.28933925329178]]
+
+        response = self.client.get('/heatmap/cells?bbox=6.0,50.0,7.0,51.0&zoom=12')
+        response_data = json.loads(response.get_data(as_text=True))
+        assert response_data['zoom'] == 17
+        assert response_data['features']
+        assert all(6.0 <= longitude <= 7.0 and 50.0 <= latitude <= 51.0
+                   for longitude, latitude in (feature['geometry']['coordinates'] for feature in response_data['features']))
+
+        for query in ('', '?zoom=12', '?bbox=6.0,50.0,7.0', '?bbox=6.0,50.0,7.0,north', '?bbox=6.0,50.0,7.0,nan', '?bbox=6.0,50.0,7.0,51.0&zoom=high'):
+            response = self.client.get('/heatmap/cells' + query)
+            assert response.status_code == 400, query
+
+    def test_gps_outliers(self, tmpdir):
+        with app.test_request_context():
+            assert [move.gps_outlier_count for move in Move.query.order_by(Move.id.asc())] == [0, 0, 0, 0, 0, 0]
+
+            move = Move.query.get(2)
+            center_max_distance = move.gps_center_max_distance
+            heat_cells = dict(((heat_cell.x, heat_cell.y), heat_cell.count) for heat_cell in HeatCell.query.filter_by(zoom=8))
+
+            # a glitch about 60 km north of the track
+            samples = sample_reader.sample_array(move, ('id', 'latitude'), Sample.latitude != None)
+            glitch = samples[len(samples) // 2]
+            Sample.query.filter_by(id=int(glitch['id'])).update({'latitude': float(glitch['latitude']) + 0.01})
+            backfill = BackfillGpsOutliers(lambda: app.test_request_context())
+            assert backfill.update(move) == "1 GPS outliers"
+            db.session.commit()
+
+            assert move.gps_outlier_count == 1
+            assert Sample.query.get(int(glitch['id'])).gps_outlier
+            assert abs(move.gps_center_max_distance - center_max_distance) < 10
+            assert len(sample_reader.sample_array(move, ('latitude',), Sample.latitude != None, sample_reader.NOT_GPS_OUTLIER)) == len(samples) - 1
+            assert dict(((heat_cell.x, heat_cell.y), heat_cell.count) for heat_cell in HeatCell.query.filter_by(zoom=8)) == heat_cells
+
+        self._login()
+        response = self.client.get('/moves/2')
+        response_data = self._validate_response(response, tmpdir)
+        assert u'<th>GPS Outliers</th>' in response_data
+        assert u'<td title="ignored GPS samples">1</td>' in response_data
+
+        with app.test_request_context():
+            move = Move.query.get(2)
+            Sample.query.filter_by(id=int(glitch['id'])).update({'latitude': float(glitch['latitude'])})
+            BackfillGpsOutliers(lambda: app.test_request_context()).update(move)
+            db.session.commit()
+            assert move.gps_outlier_count == 0
+            assert Sample.query.filter(Sample.gps_outlier != None).count() == 0
+
+    def _filtered_move_ids(self, move_filter, tmpdir):
+        response = self.client.get('/moves', query_string={'start_date': '2013-01-01', 'end_date': '2020-01-01', 'filter': move_filter})
+        response_data = self._validate_response(response, tmpdir)
+        assert u'illegal filter' not in response_data
+        return sorted(int(id) for id in re.findall(u'href="/moves/(\\d+)"', response_data))
+
+    def test_moves_location_filter(self, tmpdir):
+        self._login()
+
+        def filtered_move_ids(move_filter):
+            return self._filtered_move_ids(move_filter, tmpdir)
+
+        assert filtered_move_ids('near:50.72,7.13,2km') == [3, 5, 6]
+        assert filtered_move_ids('near:50.72,7.13,500') == [5, 6]
+        assert filtered_move_ids('near:48.0,8.0,3km') == [2]
+        assert filtered_move_ids('near:48.0,8.0,1m') == []
+        assert filtered_move_ids('bbox:5,45,10,52') == [2, 3, 4, 5, 6]
+        assert filtered_move_ids('bbox:7.0,50.6,7.1,50.7') == [3]
+
+        for move_filter in ('near:50.72,7.13', 'near:north,7.13,1km', 'bbox:5,45,10', 'bbox:10,45,5,52'):
+            response = self.client.get('/moves?start_date=2013-01-01&end_date=2020-01-01&filter=%s' % move_filter)
+            assert u"illegal filter: &#39;%s&#39;" % move_filter in self._validate_response(response, tmpdir)
+
+        with app.test_request_context():
+            move = Move.query.filter_by(id=5).one()
+            assert move.gps_geohash == u'u1j0'
+            assert move.gps_latitude_min <= move.gps_center_latitude <= move.gps_latitude_max
+            assert move.gps_longitude_min <= move.gps_center_longitude <= move.gps_longitude_max
+            assert Move.query.filter_by(id=1).one().gps_geohash is None
+
+    def test_moves_filter(self, tmpdir):
+        self._login()
+
+        expected_move_ids = OrderedDict([
+            ('activity:running', [5, 6]),
+            ('activity:Unknown activity', [4]),
+            ('activity:"unknown activity"', [4]),
+            ('distance>10km', [3, 6]),
+            ('distance:2km..10km', [2, 5]),
+            ('distance:..1500', [1, 4]),
+            ('duration>=1h', [5, 6]),
+            ('duration<0:15:00', [4]),
+            ('hr_avg<150', [4, 5]),
+            ('speed_avg>20', [3]),
+            ('ascent>50', [2, 3, 4]),
+            ('date:2015', [4, 6]),
+            ('date:2014-11', [1, 5]),
+            ('date:2014-11..2014-12', [1, 2, 5]),
+            ('date<2014-11', [3]),
+            ('date>2014-12-31', [4, 6]),
+            ('location:zurich', [4]),
+            ('location:"Zurich, Switzerland"', [4]),
+            ('activity:running distance>10km', [6]),
+            ('activity:cycling OR activity:trekking', [1, 2, 3]),
+            ('activity:running AND (date:2015 OR hr_avg<100)', [5, 6]),
+            ('activity:running (date:2014 OR distance>10km) ascent>10', [6]),
+            ('activity:running near:50.72,7.13,500', [5, 6]),
+        ])
+        for filter_query, move_ids in expected_move_ids.items():
+            assert self._filtered_move_ids(filter_query, tmpdir) == move_ids, filter_query
+
+        for filter_query in ('distance:10km', 'foo:bar', 'bogus', 'date:2015-13', '(activity:running', 'activity:running OR',
+                             'distance>far', 'location>Zurich', 'location:"Zurich'):
+            response = self.client.get('/moves', query_string={'start_date': '2013-01-01', 'end_date': '2020-01-01', 'filter': filter_query})
+            response_data = self._validate_response(response, tmpdir)
+            assert u"illegal filter: " in response_data, filter_query
+
+    def test_moves_filter_index_backed(self, tmpdir):
+        expected_indexes = OrderedDict([
+            ('activity:running', 'ix_move_user_id_activity'),
+            ('distance>10km', 'ix_move_user_id_distance'),
+            ('duration:30min..1h', 'ix_move_user_id_duration'),
+            ('hr_avg<150', 'ix_move_user_id_hr_avg'),
+            ('speed_avg>=20', 'ix_move_user_id_speed_avg'),
+            ('ascent>500', 'ix_move_user_id_ascent'),
+            ('date:2015-06', 'ix_move_user_id_date_time'),
+            ('near:47.37,8.54,5km', 'ix_move_user_id_gps_geohash'),
+            ('bbox:5,45,10,52', 'ix_move_user_id_gps_geohash'),
+            # the substring match is only narrowed down to the moves of the user
+            ('location:Zurich', 'ix_move_user_id_'),
+            ('distance>10km OR hr_avg<150', 'ix_move_user_id_'),
+        ])
+        with app.test_request_context():
+            user = User.query.filter_by(username='test_user').one()
+            for filter_query, index in expected_indexes.items():
+                parsed_filter = move_filter.parse(filter_query, user.id)
+                plan = assert_index_backed(db.session, Move.query.filter(Move.user_id == user.id).filter(parsed_filter.criterion))
+                assert any(index in detail for detail in plan), "%s: %s" % (filter_query, plan)
+
+    def test_move_channels(self, tmpdir):
+        self._login()
+        response = self.client.get('/moves/2/channels?interval=10')
+        data = self._validate_response(response, tmpdir)
+        assert data['interval'] == 10
+        assert sorted(data['channels']) == sorted(resample.CHANNELS)
+        assert len(set(len(values) for values in data['channels'].values())) == 1
+        distance = [value for value in data['channels']['distance'] if value is not None]
+        assert abs(distance[-1] - 2217) < 10
+        assert all(value is None for value in data['channels']['hr'])
+
+        response = self.client.get('/moves/2/channels?interval=10', headers={'If-None-Match': response.headers['ETag']})
+        assert response.status_code == 304
+
+        cache_dir = app.config['EXPORT_CACHE_DIR']
+        assert [filename for filename in os.listdir(cache_dir) if filename.startswith('2_') and filename.endswith('.channels_10s.npz')]
+
+        response = self.client.get('/moves/2/channels')
+        assert self._validate_response(response, tmpdir)['interval'] == resample.INTERVALS[0]
+        for query in ('?interval=abc', '?interval=', '?interval=5', '?interval=-10'):
+            response = self.client.get('/moves/2/channels' + query)
+            assert response.status_code == 400, query
+
+        with app.test_request_context():
+            move = Move.query.filter_by(id=2).one()
+            resampled = resample.resampled_channels(move, 10)
+            assert resampled.values('distance') == data['channels']['distance']
+            with pytest.raises(ValueError):
+                resample.resampled_channels(move, 5)
+
+    def test_compare_moves(self, tmpdir):
+        self._assert_redirects('/moves/compare/5,6', 'login?next=%2Fmoves%2Fcompare%2F5%2C6', code=302)
+        self._login()
+
+        response = self.client.get('/moves/compare/5,6')
+        response_data = self._validate_response(response, tmpdir)
+        assert u'<h3>Comparison</h3>' in response_data
+        assert u'<a href="/moves/5">' in response_data
+        assert u'<a href="/moves/6">' in response_data
+        assert u"/moves/compare/5%2C6/series" in response_data
+
+        response = self.client.get('/moves/compare/5,6/series')
+        series = self._validate_response(response, tmpdir)['series']
+
+        assert 0 < len(series['distance']) <= 500
+        assert abs(series['distance'][-1] - 8579) < 10
+        assert series['time_gap'] == [time_2 - time_1 for time_1, time_2 in zip(series['time_1'], series['time_2'])]
+        # move 6 has no heart rate samples
+        assert any(value is not None for value in series['hr_1'])
+        assert all(value is None for value in series['hr_2'] + series['hr_delta'])
+        assert any(value is not None for value in series['speed_delta'])
+
+        response = self.client.get('/moves/compare/5,6/series', headers={'If-None-Match': response.headers['ETag']})
+        assert response.status_code == 304
+
+        cache_dir = app.config['EXPORT_CACHE_DIR']
+        with app.test_request_context():
+            move5, move6 = Move.query.filter_by(id=5).one(), Move.query.filter_by(id=6).one()
+            version = u'%s_%s' % (export_cache.version(move5), export_cache.version(move6))
+        assert [filename for filename in os.listdir(cache_dir) if filename.endswith('.compare_6.json')] == [u'5_%s.compare_6.json' % version]
+
+        # a changed version of either move replaces the cached comparison
+        stale_path = os.path.join(cache_dir, u'5_%s.compare_6.json' % version)
+        os.rename(stale_path, os.path.join(cache_dir, u'5_20000101T000000000000_20000101T000000000000.compare_6.json'))
+        response = self.client.get('/moves/compare/5,6/series')
+        assert response.status_code == 200
+        assert [filename for filename in os.listdir(cache_dir) if filename.endswith('.compare_6.json')] == [u'5_%s.compare_6.json' % version]
+
+        # invalidating the second move removes the comparison cached with the first one
+        with app.test_request_context():
+            export_cache.invalidate(6)
+        assert not [filename for filename in os.listdir(cache_dir) if filename.endswith('.compare_6.json')]
+
+        response = self.client.get('/moves/compare/5,1234')
+        assert response.status_code == 404
+
+    def test_search(self, tmpdir):
+        self._login()
+
+        response = self.client.get('/moves/search')
+        response_data = self._validate_response(response, tmpdir)
+        assert u'<title>OpenMoves – Search</title>' in response_data
+        assert u'moves found' not in response_data
+
+        response = self.client.get('/moves/search?q=running+rhein')
+        response_data = self._validate_response(response, tmpdir)
+        assert u"2 moves found for 'running rhein'." in response_data
+        assert u'<a href="/moves/5">' in response_data
+        assert u'<a href="/moves/6">' in response_data
+
+        response = self.client.get('/moves/search?q=Baerensee')
+        response_data = self._validate_response(response, tmpdir)
+        assert u"No moves found for 'Baerensee'." in response_data
+
+        with app.test_request_context():
+            user = User.query.filter_by(username='test_user').one()
+            expected_ids = OrderedDict([
+                ('rheinbach', [3, 5, 6]),
+                (u'Zürich', [4]),
+                ('zuri', [4]),
+                ('germany trekking', [2]),
+                ('CYCLING', [3]),
+                ('switzerland running', []),
+                ('"', []),
+            ])
+            for query, ids in expected_ids.items():
+                results = search.search(user, query)
+                assert sorted(move.id for move, score in results) == ids, query
+                scores = [score for move, score in results]
+                assert scores == sorted(scores, reverse=True)
+
+            other_user = User.query.filter_by(username='other_user').one()
+            assert search.search(other_user, 'rheinbach') == []
+
+            plan = assert_index_backed(db.session, search.search_query(user, 'rheinbach'))
+            assert any('VIRTUAL TABLE' in detail for detail in plan), plan
+
+    def test_segments(self, tmpdir):
+        self._login()
+
+        response = self.client.get('/segments')
+        response_data = self._validate_response(response, tmpdir)
+        assert u'<title>OpenMoves – Segments</title>' in response_data
+        assert u'No segments yet.' in response_data
+
+        response = self.client.get('/moves/6')
+        response_data = self._validate_response(response, tmpdir)
+        assert u'<form class="form-inline create-segment" action="/moves/6/segments" method="POST">' in response_data
+
+        response = self.client.post('/moves/6/segments', data={'name': 'Loop', 'start': '1', 'end': '2'}, follow_redirects=True)
+        response_data = self._validate_response(response, tmpdir)
+        assert u"created segment &#39;Loop&#39; with 1 traversals" in response_data
+        assert u'<h3>Loop</h3>' in response_data
+        assert re.search(u'<td>1</td>\\s*<td>2015-06-25 18:45:58</td>\\s*<td>Running</td>\\s*<td>00:07:07.10</td>', response_data)
+
+        with app.test_request_context():
+            segment = Segment.query.filter_by(name='Loop').one()
+            assert segment.move_id == 6
+            assert round(segment.distance) == 999
+            assert [move.id for move in segments.candidate_moves(segment)] == [5, 6]
+            assert_index_backed(db.session, segments.leaderboard_query(segment))
+
+            # the traversal is found again when the move is imported
+            move = Move.query.filter_by(id=6).one()
+            SegmentTraversal.query.delete()
+            assert segments.match_move(move) == 1
+            traversal = SegmentTraversal.query.one()
+            assert traversal.segment_id == segment.id
+            assert round(traversal.duration, 1) == 427.1
+            db.session.commit()
+            segment_id = segment.id
+
+        response = self.client.get('/segments')
+        response_data = self._validate_response(response, tmpdir)
+        assert re.search(u'<td><a href="/segments/%d">Loop</a></td>\\s*<td>0.999 km</td>\\s*<td>1</td>\\s*<td>00:07:07.10</td>' % segment_id, response_data)
+
+        response = self.client.post('/moves/6/segments', data={'name': 'Reversed', 'start': '2', 'end': '1'}, follow_redirects=True)
+        assert u'failed to create segment: illegal segment' in self._validate_response(response, tmpdir)
+
+        response = self.client.post('/moves/2/segments', data={'start': '0.5', 'end': '1'}, follow_redirects=True)
+        response_data = self._validate_response(response, tmpdir)
+        assert u'<h3>Segment of move 2</h3>' in response_data
+        with app.test_request_context():
+            segment_id = Segment.query.filter_by(move_id=2).one().id
+
+        response = self.client.get('/segments/%d/delete' % segment_id, follow_redirects=True)
+        response_data = self._validate_response(response, tmpdir)
+        assert u"segment &#39;Segment of move 2&#39; deleted" in response_data
+        with app.test_request_context():
+            assert Segment.query.filter_by(move_id=2).count() == 0
+            assert SegmentTraversal.query.filter_by(move_id=2).count() == 0
 
     def test_delete_moves_batch(self, tmpdir):
         self._login()
@@ -726,3 +1632,11 @@ class TestOpenMoves(object):
 
             total_moves = Move.query.count()
             assert total_moves == 0
+            assert BestEffort.query.count() == 0
+            assert HrZone.query.count() == 0
+            assert TrainingLoad.query.count() == 0
+            assert HeatCell.query.count() == 0
+            assert SegmentTraversal.query.count() == 0
+            assert Segment.query.filter(Segment.move_id != None).count() == 0
+            assert db.session.execute(search.indexed_move_ids().count()).scalar() == 0
+            assert os.listdir(app.config['EXPORT_CACHE_DIR']) == []
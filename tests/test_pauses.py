@@ -0,0 +1,26 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+
+from pauses import is_pause_start, pause_intervals, moving_time
+from datetime import timedelta
+
+
+def test_is_pause_start():
+    assert is_pause_start({'pause': {'state': 'True'}})
+    assert not is_pause_start({'pause': {'state': 'false'}})
+    assert not is_pause_start({'lap': {}})
+    assert not is_pause_start(None)
+
+
+def test_pause_intervals():
+    time = [5.0, 10.0, 20.0, 30.0, 40.0]
+    events = [{'pause': {'state': 'True'}}, {'lap': {}}, {'pause': {'state': 'False'}}, {'pause': {'state': 'False'}}, {'pause': {'state': 'True'}}]
+    assert pause_intervals(time, events) == [(5.0, 20.0)]
+    # a pause until the end of the move
+    assert pause_intervals(time, events, 50.0) == [(5.0, 20.0), (40.0, 50.0)]
+
+
+def test_moving_time():
+    assert moving_time(0.0, 100.0, []) == 100.0
+    assert moving_time(0.0, 100.0, [(10.0, 20.0), (90.0, 110.0)]) == 80.0
+    assert moving_time(timedelta(0), timedelta(minutes=10), [(timedelta(minutes=2), timedelta(minutes=5))]) == timedelta(minutes=7)
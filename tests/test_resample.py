@@ -0,0 +1,60 @@
+# vim: set fileencoding=utf-8 :
+
+from resample import resample, ResampledChannels, RESAMPLE_COLUMNS, _to_npz, _from_npz
+import numpy as np
+import io
+
+
+def _samples(time, **channels):
+    samples = np.empty(len(time), dtype=[(column, float) for column in RESAMPLE_COLUMNS])
+    samples['time'] = time
+    for column in RESAMPLE_COLUMNS[1:]:
+        samples[column] = channels.get(column, np.nan)
+    return samples
+
+
+def _values(resampled, column):
+    return resampled.values(column, 6)
+
+
+class TestResample(object):
+
+    def test_interpolates_on_one_second_grid(self):
+        samples = _samples(np.array([0.5, 2.5, 4.5]), hr=np.array([1.0, 2.0, 3.0]), temperature=np.array([290.0, 300.0, 310.0]))
+        resampled = resample(samples, [])
+        assert (resampled.start, resampled.interval, len(resampled)) == (0.0, 1, 5)
+        assert resampled.time.tolist() == [0, 1, 2, 3, 4]
+        assert _values(resampled, 'hr') == [None, 1.25, 1.75, 2.25, 2.75]
+        assert _values(resampled, 'temperature') == [None, 290, 290, 300, 300]
+        assert _values(resampled, 'distance') == [None] * 5
+
+    def test_pauses_and_gaps_are_preserved(self):
+        time = np.array([0, 1, 2, 3, 10, 11, 12, 100, 101], dtype=float)
+        samples = _samples(time, speed=np.arange(len(time), dtype=float))
+        resampled = resample(samples, [(3, 10)], max_gap=30)
+        speed = _values(resampled, 'speed')
+        assert speed[:4] == [0, 1, 2, 3]
+        assert speed[4:10] == [None] * 6
+        assert speed[10:13] == [4, 5, 6]
+        assert speed[13:100] == [None] * 87
+        assert speed[100:] == [7, 8]
+
+    def test_coarser_grid_averages(self):
+        time = np.arange(0, 25, 1.0)
+        samples = _samples(time, altitude=time)
+        resampled = resample(samples, [(9.5, 20.5)], interval=10)
+        assert (resampled.interval, len(resampled)) == (10, 3)
+        assert resampled.time.tolist() == [0, 10, 20]
+        assert _values(resampled, 'altitude') == [4.5, None, 22.5]
+
+    def test_without_samples(self):
+        resampled = resample(_samples(np.array([])), [])
+        assert len(resampled) == 0
+        assert resampled.to_array().shape == (0,)
+
+    def test_npz_roundtrip(self):
+        resampled = ResampledChannels(3.0, 10, dict((column, np.array([1.5, np.nan])) for column in RESAMPLE_COLUMNS[1:]))
+        loaded = _from_npz(io.BytesIO(_to_npz(resampled)))
+        assert (loaded.start, loaded.interval) == (3.0, 10)
+        assert loaded.values('hr') == [1.5, None]
+        assert loaded.to_array(('time', 'hr'))['time'].tolist() == [3.0, 13.0]
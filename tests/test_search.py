@@ -0,0 +1,106 @@
+# vim: set fileencoding=utf-8 :
+
+from model import db, Device, Move, User
+from sqlalchemy import orm
+from datetime import datetime
+import sqlalchemy
+import pytest
+import model
+import search
+
+
+class TestSearch(object):
+
+    def test_fold(self):
+        assert search.fold(u'Zürich') == u'zurich'
+        assert search.fold(u'ÉCOLE') == u'ecole'
+        assert search.fold(u'Straße') == u'straße'
+
+    def test_words(self):
+        assert search.words(u'  Bärensee, Stuttgart-Vaihingen ') == [u'barensee', u'stuttgart', u'vaihingen']
+        assert search.words(u'"*(') == []
+
+    def test_move_document(self):
+        move = Move(activity=u'Running', location_address=u'Bärensee, Stuttgart, Germany')
+        move.location_raw = {'address': {'water': u'Bärensee', 'city': u'Stuttgart', 'postcode': u'70569', 'country_code': u'de'}}
+        document = search.move_document(move)
+        assert document == u'running barensee baerensee stuttgart germany 70569'
+
+    def test_move_document_without_location(self):
+        assert search.move_document(Move(activity=u'Pool swimming')) == u'pool swimming'
+        assert search.move_document(Move()) == u''
+
+
+class _TestSearchIndex(object):
+    """ Searches moves indexed in an own in-memory SQLite database """
+    fts5 = None
+
+    def setup_method(self, method):
+        self.app_session, self.fts5_default = db.session, model._sqlite_fts5
+        model._sqlite_fts5 = self.fts5
+        self.engine = sqlalchemy.create_engine('sqlite://')
+        db.Model.metadata.create_all(self.engine)
+        db.session = orm.scoped_session(orm.sessionmaker(bind=self.engine))
+
+        device = Device(serial_number=u'CAFEBABECAFEBABE')
+        self.user = User(username=u'user', password=u'', active=True)
+        self.other_user = User(username=u'other user', password=u'', active=True)
+        db.session.add_all((device, self.user, self.other_user))
+        db.session.flush()
+
+        self.moves = {}
+        for day, user, activity, location in ((1, self.user, u'Running', u'Bärensee, Stuttgart'),
+                                              (2, self.user, u'Running', u'Stuttgart'),
+                                              (3, self.user, u'Cycling', u'Esslingen'),
+                                              (4, self.other_user, u'Running', u'Bärensee, Stuttgart')):
+            move = Move(user_id=user.id, device_id=device.id, activity=activity, location_address=location,
+                        date_time=datetime(2015, 6, day), import_date_time=datetime(2015, 6, day), import_module=u'test')
+            db.session.add(move)
+            search.update_move(move)
+            self.moves[day] = move
+        db.session.commit()
+
+    def teardown_method(self, method):
+        db.session.remove()
+        db.session, model._sqlite_fts5 = self.app_session, self.fts5_default
+        self.engine.dispose()
+
+    def search(self, query, user=None):
+        return [move.id for move, score in search.search(user or self.user, query)]
+
+    def test_user_restriction(self):
+        assert self.search(u'baerensee') == [self.moves[1].id]
+        assert self.search(u'baerensee', self.other_user) == [self.moves[4].id]
+        assert self.search(u'cycling', self.other_user) == []
+
+    def test_prefix_matches_all_words(self):
+        assert sorted(self.search(u'run stutt')) == [self.moves[1].id, self.moves[2].id]
+        assert self.search(u'run essl') == []
+        assert self.search(u'tuttgart') == []
+        assert self.search(u'"*(') == []
+
+    def test_like_wildcards(self):
+        assert self.search(u'r_n') == []
+        assert self.search(u'%') == []
+
+
+class TestSearchIndexFts5(_TestSearchIndex):
+    fts5 = True
+
+    @classmethod
+    def setup_class(cls):
+        if not sqlalchemy.create_engine('sqlite://').execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')").scalar():
+            pytest.skip("SQLite without FTS5")
+
+    def test_ranking(self):
+        # the document of the first move has more words, so its match on stuttgart ranks lower
+        assert self.search(u'stuttgart') == [self.moves[2].id, self.moves[1].id]
+
+
+class TestSearchIndexWithoutFts5(_TestSearchIndex):
+    fts5 = False
+
+    def test_ranking(self):
+        # without FTS5 the most recent move comes first
+        assert self.search(u'stuttgart') == [self.moves[2].id, self.moves[1].id]
+        assert self.search(u'running') == [self.moves[2].id, self.moves[1].id]
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+
+from segments import find_traversals, simplify, _passes, POINT_SPACING
+from spatial import EARTH_RADIUS
+import numpy as np
+import math
+
+LATITUDE = math.radians(47.0)
+LONGITUDE = math.radians(8.0)
+
+
+def _track(x, y):
+    """ Coordinates in radians of points x meters east and y meters north """
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    return LATITUDE + y / EARTH_RADIUS, LONGITUDE + x / (EARTH_RADIUS * math.cos(LATITUDE))
+
+
+def test_simplify():
+    latitude, longitude = _track(np.linspace(0, 1000, 11), np.zeros(11))
+    points_latitude, points_longitude, length = simplify(latitude, longitude)
+    assert round(length, 3) == 1000.0
+    assert len(points_latitude) == 1000 / POINT_SPACING + 1
+    assert points_longitude[0] == longitude[0] and points_longitude[-1] == longitude[-1]
+
+
+def test_passes():
+    distances = np.array([100.0, 20.0, 10.0, 25.0, 100.0, 5.0, 100.0])
+    assert _passes(distances, 30.0) == [2, 5]
+    assert _passes(distances, 1.0) == []
+
+
+def test_find_traversals():
+    segment_latitude, segment_longitude, _ = simplify(*_track([0.0, 1000.0], [0.0, 0.0]))
+
+    # out and back twice along the segment, 1 m/s
+    x = np.concatenate([np.arange(-200.0, 1200.0), np.arange(1200.0, -200.0, -1.0)] * 2)
+    time = np.arange(len(x), dtype=float)
+    latitude, longitude = _track(x, np.full(len(x), 10.0))
+
+    traversals = find_traversals(segment_latitude, segment_longitude, 1000.0, time, latitude, longitude)
+    assert traversals == [(200.0, 1200.0), (3000.0, 4000.0)]
+
+
+def test_find_traversals_detour():
+    segment_latitude, segment_longitude, _ = simplify(*_track([0.0, 1000.0], [0.0, 0.0]))
+
+    # from the start to the end via a point 400 m off the segment
+    x = np.concatenate([np.linspace(0, 500, 100), np.linspace(500, 1000, 100)])
+    y = np.concatenate([np.linspace(0, 400, 100), np.linspace(400, 0, 100)])
+    latitude, longitude = _track(x, y)
+    time = np.arange(len(x), dtype=float)
+    assert find_traversals(segment_latitude, segment_longitude, 1000.0, time, latitude, longitude) == []
+
+    # the same length but off the segment
+    x = np.concatenate([np.zeros(50), np.linspace(0, 1000, 100), np.full(50, 1000.0)])
+    y = np.concatenate([np.linspace(0, 100, 50), np.full(100, 100.0), np.linspace(100, 0, 50)])
+    latitude, longitude = _track(x, y)
+    time = np.arange(len(x), dtype=float)
+    assert find_traversals(segment_latitude, segment_longitude, 1000.0, time, latitude, longitude) == []
@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+
+from spatial import geohash, geohash_cell_size, bounds_geohash, parse_distance
+import pytest
+
+
+def test_geohash():
+    assert geohash(57.64911, 10.40744, 11) == 'u4pruydqqvj'
+    assert geohash(-90.0, -180.0, 3) == '000'
+    assert geohash(90.0, 180.0, 3) == 'zzz'
+    assert geohash(0.0, 0.0, 0) == ''
+
+
+def test_geohash_cell_size():
+    assert geohash_cell_size(0) == (180.0, 360.0)
+    assert geohash_cell_size(1) == (45.0, 45.0)
+    assert geohash_cell_size(2) == (45.0 / 8, 45.0 / 4)
+
+
+def test_bounds_geohash():
+    assert bounds_geohash(57.64911, 10.40744, 57.64911, 10.40744) == geohash(57.64911, 10.40744)
+    assert bounds_geohash(57.649, 10.407, 57.6492, 10.4075) == 'u4pruyd'
+    assert bounds_geohash(57.6, 10.4, 57.7, 10.5) == 'u4'
+    assert bounds_geohash(-1.0, -1.0, 1.0, 1.0) == ''
+
+
+def test_parse_distance():
+    assert parse_distance('500') == 500.0
+    assert parse_distance(' 500m') == 500.0
+    assert parse_distance('2.5km') == 2500.0
+    with pytest.raises(ValueError):
+        parse_distance('far')
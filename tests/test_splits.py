@@ -0,0 +1,52 @@
+# vim: set fileencoding=utf-8 :
+
+from splits import calculate_splits, split_name, SPLIT_COLUMNS, MILE
+import numpy as np
+
+
+def _samples(time, **channels):
+    samples = np.empty(len(time), dtype=[(column, float) for column in SPLIT_COLUMNS])
+    samples['time'] = time
+    for column in SPLIT_COLUMNS[1:]:
+        samples[column] = channels.get(column, np.nan)
+    return samples
+
+
+class TestSplits(object):
+
+    def test_calculate_splits(self):
+        time = np.arange(0, 601, 1.0)
+        distance = np.where(time < 300, time * 4.0, 1200 + (time - 300) * 2.0)
+        hr = np.where(time < 300, 2.0, 3.0)
+        altitude = np.where(time < 150, time, 300 - time)
+        samples = _samples(time, distance=distance, hr=hr, altitude=altitude)
+
+        splits = calculate_splits(samples, 1000)
+        assert [split['split'] for split in splits] == [1, 2]
+        assert [split['distance'] for split in splits] == [1000, 1800]
+        assert [split['length'] for split in splits] == [1000, 800]
+        assert [split['start'] for split in splits] == [0, 250]
+        assert [split['duration'] for split in splits] == [250, 350]
+        assert [split['speed'] for split in splits] == [4, 800 / 350.0]
+        assert splits[0]['hr_avg'] == 2.0
+        assert round(splits[1]['hr_avg'], 2) == round((50 * 2.0 + 300 * 3.0) / 350, 2)
+        assert splits[0]['cadence_avg'] is None
+        assert (splits[0]['ascent'], splits[0]['descent']) == (150, 100)
+        assert (splits[1]['ascent'], splits[1]['descent']) == (0, 350)
+
+    def test_split_ends_before_pause(self):
+        time = np.array([0, 100, 200, 300], dtype=float)
+        distance = np.array([0, 500, 500, 1000], dtype=float)
+        splits = calculate_splits(_samples(time, distance=distance), 500)
+        assert [split['duration'] for split in splits] == [100, 200]
+
+    def test_calculate_splits_without_distance(self):
+        time = np.arange(0, 100, 1.0)
+        assert calculate_splits(_samples(time), 1000) == []
+        assert calculate_splits(_samples(time, distance=np.zeros(len(time))), 1000) == []
+
+    def test_split_name(self):
+        assert split_name(1000) == '1 km'
+        assert split_name(5000) == '5 km'
+        assert split_name(MILE) == '1 mi'
+        assert split_name(25) == '25 m'
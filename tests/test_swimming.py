@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+
+from swimming import segment_lengths
+
+
+def _turn(total_lengths):
+    return {'swimming': {'type': 'Turn', 'totalLengths': str(total_lengths)}}
+
+
+def _style_change(style):
+    return {'swimming': {'type': 'StyleChange', 'prevPoolLengthStyle': style}}
+
+
+STROKE = {'swimming': {'type': 'Stroke'}}
+
+
+def _pause(state):
+    return {'pause': {'state': str(state)}}
+
+
+def test_segment_lengths():
+    time = [0.0, 0.0, 5.0, 10.0, 20.0, 20.0, 25.0, 30.0, 40.0, 45.0, 60.0]
+    events = [_style_change('Other'), _turn(0), STROKE, STROKE, _style_change('Freestyle'), _turn(1),
+              STROKE, STROKE, _turn(2), STROKE, _turn(3)]
+    assert segment_lengths(time, events) == [(1, 0.0, 20.0, 2, 'Freestyle'),
+                                             (2, 20.0, 20.0, 2, 'Freestyle'),
+                                             (3, 40.0, 20.0, 1, 'Freestyle')]
+
+
+def test_segment_lengths_style_change_names_the_finished_length():
+    time = [0.0, 10.0, 20.0, 20.0, 30.0, 40.0, 40.0]
+    events = [_turn(0), _turn(1), _style_change('Breaststroke'), _turn(2), _turn(3), _style_change('Freestyle'), _turn(4)]
+    assert [length[4] for length in segment_lengths(time, events)] == [None, 'Breaststroke', 'Breaststroke', 'Freestyle']
+
+
+def test_segment_lengths_skip_rests_and_pauses():
+    # resting at the wall repeats the number of lengths, the length interrupted by the pause is not complete
+    time = [0.0, 20.0, 35.0, 55.0, 56.0, 100.0, 101.0, 120.0]
+    events = [_turn(0), _turn(1), _turn(1), _turn(2), _pause(True), _pause(False), _turn(3), _turn(4)]
+    assert [length[:3] for length in segment_lengths(time, events)] == [(1, 0.0, 20.0), (2, 35.0, 20.0), (4, 101.0, 19.0)]
+
+
+def test_segment_lengths_without_turns():
+    assert segment_lengths([0.0, 1.0], [STROKE, _pause(True)]) == []
@@ -0,0 +1,30 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+
+from training_load import calculate_hr_zones, edwards_trimp, MAX_SAMPLE_GAP
+import numpy as np
+
+
+def test_calculate_hr_zones():
+    time = np.array([0.0, 10.0, 20.0, 30.0, 40.0])
+    hr = np.array([1.0, 2.0, 2.5, 3.0, 3.0])
+    assert calculate_hr_zones(time, hr, [1.5, 2.5]) == [10.0, 10.0, 20.0]
+
+
+def test_calculate_hr_zones_missing_samples():
+    time = np.array([0.0, 10.0, 20.0, 30.0])
+    hr = np.array([1.0, np.nan, 2.0, np.nan])
+    assert calculate_hr_zones(time, hr, [1.5]) == [20.0, 0.0]
+
+    assert calculate_hr_zones(np.array([0.0]), np.array([1.0]), [1.5]) == [0.0, 0.0]
+
+
+def test_calculate_hr_zones_gap():
+    time = np.array([0.0, 10.0, 1000.0])
+    hr = np.array([2.0, 2.0, 2.0])
+    assert calculate_hr_zones(time, hr, [1.5]) == [0.0, 10.0 + MAX_SAMPLE_GAP]
+
+
+def test_edwards_trimp():
+    assert edwards_trimp([(0, 600.0), (1, 600.0), (3, 120.0)]) == 16.0
+    assert edwards_trimp([]) == 0
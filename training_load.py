@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+
+from flask import current_app
+from model import db, HrZone, TrainingLoad
+from sqlalchemy.sql import func
+from datetime import timedelta
+import sample_reader
+import numpy as np
+
+# heart rate samples further apart are gaps in the recording, eg. a lost chest strap
+MAX_SAMPLE_GAP = 60.0
+
+ACUTE_DAYS = 7
+CHRONIC_DAYS = 42
+
+
+def zone_bounds():
+    """ Returns the lower bounds of the heart rate zones 1 to 5 in Hz """
+    hr_max = current_app.config['HR_MAX'] / 60.0
+    return [hr_max * fraction for fraction in current_app.config['HR_ZONES']]
+
+
+def calculate_hr_zones(time, hr, bounds):
+    """ Returns the seconds spent in each heart rate zone, zone 0 is below the first bound.
+
+    Each sample counts until the next heart rate sample, at most MAX_SAMPLE_GAP seconds.
+    """
+    mask = ~np.isnan(time) & ~np.isnan(hr)
+    time, hr = time[mask], hr[mask]
+    if len(time) < 2:
+        return [0.0] * (len(bounds) + 1)
+
+    durations = np.clip(np.diff(time), 0, MAX_SAMPLE_GAP)
+    zones = np.digitize(hr[:-1], bounds)
+    return np.bincount(zones, weights=durations, minlength=len(bounds) + 1).tolist()
+
+
+def edwards_trimp(zone_durations):
+    """ Training impulse after Edwards: minutes in zone times zone number """
+    return sum(zone * duration / 60.0 for zone, duration in zone_durations)
+
+
+def move_load(move):
+    return edwards_trimp((hr_zone.zone, hr_zone.duration) for hr_zone in HrZone.query.filter_by(move_id=move.id))
+
+
+def add_load(user_id, date, activity, load):
+    if not load:
+        return
+
+    training_load = TrainingLoad.query.filter_by(user_id=user_id, date=date, activity=activity).first()
+    if training_load:
+        training_load.load += load
+        if training_load.load < 1e-6:
+            db.session.delete(training_load)
+    else:
+        db.session.add(TrainingLoad(user_id=user_id, date=date, activity=activity, load=load))
+
+
+def update_hr_zones(move):
+    """ Replaces the heart rate zones of a move and adds its load to the daily training load """
+    remove_move(move)
+    HrZone.query.filter_by(move_id=move.id).delete(synchronize_session=False)
+
+    samples = sample_reader.sample_array(move, ('time', 'hr'))
+    zone_durations = calculate_hr_zones(samples['time'], samples['hr'], zone_bounds())
+    for zone, duration in enumerate(zone_durations):
+        if duration > 0:
+            db.session.add(HrZone(move_id=move.id, zone=zone, duration=duration))
+
+    add_load(move.user_id, move.date_time.date(), move.activity, edwards_trimp(enumerate(zone_durations)))
+    return zone_durations
+
+
+def remove_move(move):
+    """ Subtracts the load of a move from the daily training load, before the move is deleted """
+    add_load(move.user_id, move.date_time.date(), move.activity, -move_load(move))
+
+
+def change_activity(move, old_activity):
+    load = move_load(move)
+    add_load(move.user_id, move.date_time.date(), old_activity, -load)
+    add_load(move.user_id, move.date_time.date(), move.activity, load)
+
+
+def daily_loads_query(user, start_date, end_date):
+    return db.session.query(TrainingLoad.date, func.sum(TrainingLoad.load)) \
+                     .filter(TrainingLoad.user_id == user.id) \
+                     .filter(TrainingLoad.date >= start_date) \
+                     .filter(TrainingLoad.date <= end_date) \
+                     .group_by(TrainingLoad.date) \
+                     .order_by(TrainingLoad.date.asc())
+
+
+def training_load_series(user, start_date, end_date):
+    """ Returns the days from start_date to end_date with the daily, acute and chronic training load.
+
+    The acute and chronic load are the mean daily loads of the last ACUTE_DAYS
+    and CHRONIC_DAYS, so the days before start_date are read as well. Days
+    before the first load are skipped.
+    """
+    first_date = start_date - timedelta(days=CHRONIC_DAYS - 1)
+    daily_loads = daily_loads_query(user, first_date, end_date).all()
+    if not daily_loads:
+        return []
+
+    days = (end_date - first_date).days + 1
+    loads = np.zeros(days)
+    for date, load in daily_loads:
+        loads[(date - first_date).days] = load
+
+    cumulative = np.concatenate(([0.0], np.cumsum(loads)))
+    index = np.arange(1, days + 1)
+    acute = (cumulative[index] - cumulative[np.maximum(index - ACUTE_DAYS, 0)]) / ACUTE_DAYS
+    chronic = (cumulative[index] - cumulative[np.maximum(index - CHRONIC_DAYS, 0)]) / CHRONIC_DAYS
+
+    first_day = max(start_date, daily_loads[0][0])
+    return [(first_date + timedelta(days=day), loads[day], acute[day], chronic[day])
+            for day in range((first_day - first_date).days, days)]